@@ -0,0 +1,387 @@
+"""
+Benchmarks of the spectral, wavelet and baseline correction kernels of
+reqpy, of the end-to-end matching procedures and of the text export.
+
+The records are synthetic (band-limited noise with an envelope, fixed
+seeds) so the suite runs offline and is reproducible. Each benchmark is
+swept over the parameters it depends on (record length n, sampling
+frequency fs, number of scales NS, number of periods nT and damping zi),
+one parameter at a time around a reference case, and reports:
+
+    time     best wall-clock time of the warm runs (s)
+    median   median wall-clock time of the warm runs (s)
+    cold     time of the first run after clearing the in-memory caches (s)
+    peak_mb  peak memory allocated by a cold run (MB, tracemalloc)
+
+Usage (from the repository root):
+
+    python benchmarks/bench.py                        # full sweeps
+    python benchmarks/bench.py --quick                # reduced sweeps
+    python benchmarks/bench.py -k RSFD -k cwtzm       # selected benchmarks
+    python benchmarks/bench.py --save baseline.json   # save a baseline
+    python benchmarks/bench.py --compare baseline.json --threshold 0.25
+
+With --compare the cases slower (time) or heavier (peak_mb) than the
+baseline by more than the threshold are reported as regressions and the
+exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import export  # noqa: E402
+import reqpy  # noqa: E402
+from utilities import synthetic_record  # noqa: E402
+
+REFERENCE = {'n': 4000, 'fs': 100., 'NS': 100, 'nT': 100, 'zi': 0.05}  # case around which the sweeps are made
+SWEEPS = {'n': (2000, 4000, 8000, 32000),
+          'fs': (50., 100., 200.),
+          'NS': (50, 100, 200),
+          'nT': (50, 100, 200),
+          'zi': (0.02, 0.05)}
+QUICK_SWEEPS = {'n': (2000, 8000),
+                'fs': (100.,),
+                'NS': (50, 100),
+                'nT': (50, 100),
+                'zi': (0.02, 0.05)}
+NIT = 5  # iterations of the end-to-end benchmarks
+THETA = np.arange(0, 180, 1)
+
+
+def target_spectrum(nT: int = 50):
+    """
+    Smooth design spectrum (g) with a 0.1-0.5 s plateau.
+
+    Returns
+    -------
+    To : ndarray
+        Periods (s)
+    dso : ndarray
+        Pseudo-acceleration (g)
+    """
+    To = np.geomspace(0.05, 4, nT)
+    dso = np.where(To < 0.1, 0.4 + 0.6 * To / 0.1, np.where(To <= 0.5, 1., 0.5 / To))
+    return To, dso
+
+
+def _periods(case: dict) -> ndarray:
+    return np.geomspace(0.02, 5, case['nT'])
+
+
+def _scales(case: dict) -> ndarray:
+    freqs = np.geomspace(case['fs'] / 2, 0.1, case['NS'])
+    return np.pi / (2 * np.pi * freqs)
+
+
+def _bench_rsfd(case):
+    s, dt, T = synthetic_record(case['n'], case['fs']), 1 / case['fs'], _periods(case)
+    return lambda: reqpy.RSFD(T, s, 0.05, dt)
+
+
+def _bench_rspw(case):
+    s, dt, T = synthetic_record(case['n'], case['fs']), 1 / case['fs'], _periods(case)
+    return lambda: reqpy.RSPW(T, s, 0.02, dt)
+
+
+def _bench_response_spectrum(case):
+    s, dt, T = synthetic_record(case['n'], case['fs']), 1 / case['fs'], _periods(case)
+    return lambda: reqpy.ResponseSpectrum(T, s, case['zi'], dt)
+
+
+def _bench_rsfdtheta(case):
+    s1, s2 = synthetic_record(case['n'], case['fs']), synthetic_record(case['n'], case['fs'], 1)
+    dt, T = 1 / case['fs'], _periods(case)
+    return lambda: reqpy.RSFDtheta(T, s1, s2, 0.05, dt, THETA)
+
+
+def _bench_rspwtheta(case):
+    s1, s2 = synthetic_record(case['n'], case['fs']), synthetic_record(case['n'], case['fs'], 1)
+    dt, T = 1 / case['fs'], _periods(case)
+    return lambda: reqpy.RSPWtheta(T, s1, s2, 0.02, dt, THETA)
+
+
+def _bench_rotdnn(case):
+    s1, s2 = synthetic_record(case['n'], case['fs']), synthetic_record(case['n'], case['fs'], 1)
+    dt, T = 1 / case['fs'], _periods(case)
+    return lambda: reqpy.ResponseSpectrumRotDnn(T, s1, s2, case['zi'], dt, 50, THETA)
+
+
+def _bench_cwtzm(case):
+    s, scales = synthetic_record(case['n'], case['fs']), _scales(case)
+    return lambda: reqpy.cwtzm(s, case['fs'], scales, np.pi, 0.05)
+
+
+def _bench_getdetails(case):
+    s, scales = synthetic_record(case['n'], case['fs']), _scales(case)
+    t = np.arange(case['n']) / case['fs']
+    C = reqpy.cwtzm(s, case['fs'], scales, np.pi, 0.05)
+    return lambda: reqpy.getdetails(t, s, C, scales, np.pi, 0.05)
+
+
+def _bench_basecorr(case):
+    s = synthetic_record(case['n'], case['fs'])
+    t = np.arange(case['n']) / case['fs']
+    CT = max(1, t[-1] / 20)
+    return lambda: reqpy.basecorr(t, s, CT)
+
+
+def _bench_baselinecorrect(case):
+    s = synthetic_record(case['n'], case['fs'])
+    t = np.arange(case['n']) / case['fs']
+
+    def func():
+        with contextlib.redirect_stdout(io.StringIO()):  # success / failure banner
+            reqpy.baselinecorrect(s, t)
+    return func
+
+
+def _bench_reqpy_single(case):
+    s = synthetic_record(case['n'], case['fs'])
+    To, dso = target_spectrum()
+    return lambda: reqpy.REQPY_single(s, case['fs'], dso, To, zi=case['zi'], nit=NIT, NS=case['NS'],
+                                      plots=0, verbose=False)
+
+
+def _bench_reqpyrotdnn(case):
+    s1, s2 = synthetic_record(case['n'], case['fs']), synthetic_record(case['n'], case['fs'], 1)
+    To, dso = target_spectrum()
+    return lambda: reqpy.REQPYrotdnn(s1, s2, case['fs'], dso, To, 100, zi=case['zi'], nit=NIT, NS=case['NS'],
+                                     plots=0, verbose=False)
+
+
+def _bench_write_two_column(case):
+    s = synthetic_record(case['n'], case['fs'])
+    t = np.arange(case['n']) / case['fs']
+    return lambda: export.write_two_column(os.devnull, t, s)
+
+
+def _bench_savetxt(case):  # reference for write_two_column, same output
+    s = synthetic_record(case['n'], case['fs'])
+    data = np.column_stack((np.arange(case['n']) / case['fs'], s))
+    return lambda: np.savetxt(os.devnull, data, fmt='%.8e %.8e')
+
+
+def _bench_write_at2(case):
+    s = synthetic_record(case['n'], case['fs'])
+    return lambda: export.write_at2(os.devnull, s, 1 / case['fs'])
+
+
+BENCHMARKS = {'RSFD': (_bench_rsfd, ('n', 'fs', 'nT')),
+              'RSPW': (_bench_rspw, ('n', 'fs', 'nT')),
+              'ResponseSpectrum': (_bench_response_spectrum, ('zi',)),
+              'RSFDtheta': (_bench_rsfdtheta, ('n', 'nT')),
+              'RSPWtheta': (_bench_rspwtheta, ('n', 'nT')),
+              'ResponseSpectrumRotDnn': (_bench_rotdnn, ('n', 'zi')),
+              'cwtzm': (_bench_cwtzm, ('n', 'fs', 'NS')),
+              'getdetails': (_bench_getdetails, ('n', 'fs', 'NS')),
+              'basecorr': (_bench_basecorr, ('n', 'fs')),
+              'baselinecorrect': (_bench_baselinecorrect, ('n',)),
+              'REQPY_single': (_bench_reqpy_single, ('n', 'NS', 'zi')),
+              'REQPYrotdnn': (_bench_reqpyrotdnn, ('n', 'NS', 'zi')),
+              'write_two_column': (_bench_write_two_column, ('n',)),
+              'savetxt': (_bench_savetxt, ('n',)),
+              'write_at2': (_bench_write_at2, ('n',))}  # setup and swept parameters
+
+
+def cases(name: str, sweeps: Dict = None) -> List[dict]:
+    """
+    Parameter sets of a benchmark: the reference case and, for each swept
+    parameter, its values with the other parameters at the reference.
+    """
+    sweeps = sweeps or SWEEPS
+    found = [dict(REFERENCE)]
+    for param in BENCHMARKS[name][1]:
+        for value in sweeps[param]:
+            case = dict(REFERENCE, **{param: value})
+            if case not in found:
+                found.append(case)
+    return found
+
+
+def case_id(name: str, case: dict) -> str:
+    """
+    Identifier of a case, e.g. RSFD[n=4000,fs=100,nT=100].
+    """
+    params = ','.join('%s=%g' % (param, case[param]) for param in BENCHMARKS[name][1])
+    return '%s[%s]' % (name, params)
+
+
+def clear_caches():
+    """
+    Clears the in-memory caches of reqpy (spectral operators and filter
+    banks) so the next run is cold.
+    """
+    reqpy.clear_spectral_cache()
+    reqpy.clear_filterbank_cache()
+
+
+def measure(func: Callable, repeat: int = 5) -> dict:
+    """
+    Times func (cold run, then best and median of repeat warm runs) and
+    measures the peak memory of a cold run with tracemalloc.
+    """
+    clear_caches()
+    start = time.perf_counter()
+    func()
+    cold = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    clear_caches()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time': min(times), 'median': statistics.median(times), 'cold': cold, 'peak_mb': peak / 2 ** 20}
+
+
+def run(names: List[str] = None, quick: bool = False, repeat: int = 5, stream=sys.stdout) -> dict:
+    """
+    Runs the benchmarks.
+
+    Parameters
+    ----------
+    names : List[str]
+        Benchmarks to run (default None, all of BENCHMARKS)
+    quick : bool
+        Whether the reduced sweeps (QUICK_SWEEPS) are used
+    repeat : int
+        Number of warm runs per case
+    stream : file
+        Where the progress is printed (None for no output)
+
+    Returns
+    -------
+    results : dict
+        Measurements per case id (see measure)
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        for case in cases(name, QUICK_SWEEPS if quick else SWEEPS):
+            func = BENCHMARKS[name][0](case)
+            key = case_id(name, case)
+            results[key] = measure(func, repeat)
+            if stream is not None:
+                item = results[key]
+                stream.write('%-52s %10.4f s %10.4f s (cold) %9.1f MB\n'
+                             % (key, item['time'], item['cold'], item['peak_mb']))
+                stream.flush()
+    return results
+
+
+def environment() -> dict:
+    """
+    Versions and machine the benchmarks were run on.
+    """
+    import scipy
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'fft_backend': reqpy.get_fft_backend()[0], 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def save(filepath: str, results: dict):
+    """
+    Writes the results and the environment to a JSON baseline.
+    """
+    with open(filepath, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=1, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.25, min_delta: float = 0.005,
+            stream=sys.stdout) -> List[str]:
+    """
+    Compares results with a baseline (as written by save).
+
+    Parameters
+    ----------
+    results : dict
+        Measurements per case id
+    baseline : dict
+        Contents of a baseline file
+    threshold : float
+        Relative increase of time or peak_mb reported as a regression
+    min_delta : float
+        Slowdowns shorter than this (s) are taken as timing noise
+    stream : file
+        Where the comparison is printed (None for no output)
+
+    Returns
+    -------
+    regressions : List[str]
+        Case ids that regressed
+    """
+    reference = baseline['results']
+    regressions = []
+    for key in sorted(results):
+        if key not in reference:
+            continue
+        ratio_time = results[key]['time'] / reference[key]['time']
+        ratio_mem = (results[key]['peak_mb'] + 1) / (reference[key]['peak_mb'] + 1)  # 1 MB of slack
+        slower = ratio_time > 1 + threshold and results[key]['time'] - reference[key]['time'] > min_delta
+        regressed = slower or ratio_mem > 1 + threshold
+        if regressed:
+            regressions.append(key)
+        if stream is not None:
+            stream.write('%-52s time x%5.2f  memory x%5.2f%s\n'
+                         % (key, ratio_time, ratio_mem, '  REGRESSION' if regressed else ''))
+    if stream is not None:
+        stream.write('%i of %i cases regressed (threshold %.0f %%)\n'
+                     % (len(regressions), len([key for key in results if key in reference]), 100 * threshold))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='SpectralMatchPy benchmarks')
+    parser.add_argument('-k', dest='select', action='append', default=[],
+                        help='run the benchmarks whose name contains this text (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='reduced parameter sweeps')
+    parser.add_argument('--repeat', type=int, default=5, help='warm runs per case (default 5)')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown / memory increase reported as a regression (default 0.25)')
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help='slowdowns shorter than this are ignored as noise (s, default 0.005)')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in BENCHMARKS:
+            print('%-24s sweeps %s' % (name, ', '.join(BENCHMARKS[name][1])))
+        return 0
+
+    names = [name for name in BENCHMARKS if not args.select or any(text in name for text in args.select)]
+    results = run(names, args.quick, args.repeat)
+    if args.save:
+        save(args.save, results)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold, args.min_delta):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
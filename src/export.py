@@ -0,0 +1,301 @@
+import os
+import zipfile
+from typing import List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+__all__ = ['write_two_column', 'write_at2', 'results_dict', 'export_results', 'ResultsArchive', 'write_suite']
+
+CHUNK_ROWS = 65536  # rows formatted per write
+EXPORT_FORMATS = ('at2', 'txt', 'npz', 'parquet')  # formats understood by export_results
+HISTORIES = {'acc': ('ACCELERATION', 'G'),
+             'vel': ('VELOCITY', 'G*S'),
+             'disp': ('DISPLACEMENT', 'G*S2')}  # quantity and units of the time histories
+
+
+def write_two_column(filepath: str, x: ndarray, y: ndarray, fmt: str = '%.8e'):
+    """
+    Writes two columns (e.g. time and acceleration, or period and PSA).
+    The rows are formatted in chunks with a single %-format each.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file to write
+    x, y : ndarray
+        Values of the first and second columns (same length)
+    fmt : str
+        Format of each value
+    """
+    data = np.column_stack((np.asarray(x, dtype=float), np.asarray(y, dtype=float)))
+    with open(filepath, 'w') as file:
+        _write_rows(file, data, fmt + ' ' + fmt + '\n')
+
+
+def write_at2(filepath: str, values: ndarray, dt: float, description: str = 'SpectralMatchPy record',
+              quantity: str = 'ACCELERATION', units: str = 'G', fmt: str = ' %14.7E'):
+    """
+    Writes a time series in the PEER NGA .AT2 layout (four header lines
+    and five values per line), readable by utilities.read_record.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file to write
+    values : ndarray
+        Time series
+    dt : float
+        Time step
+    description : str
+        Second header line; use "event, m/d/yyyy, station, component"
+        (e.g. the line of the seed record) for files read with
+        reqpy.load_PEERNGA_record
+    quantity, units : str
+        Third header line, "<quantity> TIME SERIES IN UNITS OF <units>"
+    fmt : str
+        Format of each value (written without separator, so it must
+        start with a space)
+    """
+    values = np.asarray(values, dtype=float).reshape(-1)
+    npts = values.size
+    nfull = npts // 5 * 5
+    with open(filepath, 'w') as file:
+        file.write('PEER NGA STRONG MOTION DATABASE RECORD\n')
+        file.write(description.strip() + '\n')
+        file.write('%s TIME SERIES IN UNITS OF %s\n' % (quantity, units))
+        file.write('NPTS= %7d, DT= %.8g SEC\n' % (npts, dt))
+        _write_rows(file, values[:nfull].reshape(-1, 5), fmt * 5 + '\n')
+        if nfull < npts:
+            file.write(fmt * (npts - nfull) % tuple(values[nfull:]) + '\n')
+
+
+def _write_rows(file, data: ndarray, line: str, chunk: int = CHUNK_ROWS):
+    """
+    Writes the rows of data with the format line, one %-format per chunk.
+    A single % operation formats the whole chunk in compiled code, about
+    twice as fast as np.savetxt, which formats row by row (see the
+    write_two_column and savetxt cases of benchmarks/bench.py).
+    """
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        file.write((line * len(block)) % tuple(block.ravel()))
+
+
+def results_dict(result: tuple) -> dict:
+    """
+    Names the outputs of reqpy.REQPY_single or reqpy.REQPYrotdnn.
+
+    Parameters
+    ----------
+    result : tuple
+        Outputs of REQPY_single (ccs, rmse, misfit, cvel, cdespl, PSAccs,
+        PSAs, T, sf, ...) or REQPYrotdnn (scc1, scc2, cvel1, cvel2,
+        cdisp1, cdisp2, PSArotnn, PSArotnnor, T, misfit, rmse, ...); a
+        dictionary is returned unchanged
+
+    Returns
+    -------
+    results : dict
+        acc, vel, disp (single component) or acc1, acc2, vel1, vel2,
+        disp1, disp2 (pairs), and T, PSA, PSA_seed, rmse, misfit (and sf
+        for single components); the figures and info are not included
+    """
+    if isinstance(result, dict):
+        return result
+    if np.ndim(result[1]) == 0:
+        ccs, rmse, misfit, cvel, cdespl, PSAccs, PSAs, T, sf = result[:9]
+        return {'acc': ccs, 'vel': cvel, 'disp': cdespl, 'T': T, 'PSA': PSAccs, 'PSA_seed': PSAs,
+                'rmse': rmse, 'misfit': misfit, 'sf': sf}
+    scc1, scc2, cvel1, cvel2, cdisp1, cdisp2, PSArotnn, PSArotnnor, T, misfit, rmse = result[:11]
+    return {'acc1': scc1, 'acc2': scc2, 'vel1': cvel1, 'vel2': cvel2, 'disp1': cdisp1, 'disp2': cdisp2,
+            'T': T, 'PSA': PSArotnn, 'PSA_seed': PSArotnnor, 'rmse': rmse, 'misfit': misfit}
+
+
+def export_results(result, dt: float, directory: str, name: str, formats: Tuple = ('npz',),
+                   description: str = None) -> List[str]:
+    """
+    Writes the results of a matched record (or pair of components).
+
+    Parameters
+    ----------
+    result : tuple or dict
+        Outputs of REQPY_single / REQPYrotdnn, see results_dict
+    dt : float
+        Time step of the records
+    directory : str
+        Output directory (created when needed)
+    name : str
+        Base name of the files
+    formats : Tuple
+        Any of 'at2' (<name>_<history>.AT2 per time history), 'txt'
+        (two-column <name>_<history>.txt with time, and <name>_PSA.txt
+        with the periods and the matched and seed spectra), 'npz' (all
+        the results in <name>.npz) and 'parquet' (time histories in
+        <name>.parquet and spectra in <name>_spectra.parquet, requires
+        pyarrow)
+    description : str
+        Second header line of the .AT2 files (default None, name)
+
+    Returns
+    -------
+    paths : List[str]
+        Written files
+    """
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError('unknown format %r, expected one of %s' % (fmt, ', '.join(EXPORT_FORMATS)))
+
+    results = results_dict(result)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, name)
+    histories = _histories(results)
+    npts = len(next(iter(histories.values())))
+    time = np.arange(npts) * dt
+
+    paths = []
+    if 'at2' in formats:
+        for key, values in histories.items():
+            quantity, units = HISTORIES[key.rstrip('12')]
+            paths.append('%s_%s.AT2' % (base, key))
+            write_at2(paths[-1], values, dt, description or name, quantity, units)
+    if 'txt' in formats:
+        for key, values in histories.items():
+            paths.append('%s_%s.txt' % (base, key))
+            write_two_column(paths[-1], time, values)
+        paths.append('%s_PSA.txt' % base)
+        data = np.column_stack((results['T'], results['PSA'], results['PSA_seed']))
+        with open(paths[-1], 'w') as file:
+            _write_rows(file, data, '%.8e %.8e %.8e\n')
+    if 'npz' in formats:
+        paths.append(base + '.npz')
+        np.savez_compressed(paths[-1], dt=dt, **_arrays(results))
+    if 'parquet' in formats:
+        paths.extend(_write_parquet(base, time, histories, results))
+    return paths
+
+
+def _histories(results: dict) -> dict:
+    """
+    Time histories of the results, in acc, vel, disp order.
+    """
+    return {key: np.asarray(results[key], dtype=float)
+            for key in ('acc', 'acc1', 'acc2', 'vel', 'vel1', 'vel2', 'disp', 'disp1', 'disp2')
+            if key in results}
+
+
+def _arrays(results: dict) -> dict:
+    """
+    Results that can be stored as arrays (None values are skipped).
+    """
+    return {key: np.asarray(value) for key, value in results.items() if value is not None}
+
+
+def _write_parquet(base: str, time: ndarray, histories: dict, results: dict) -> List[str]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("the 'parquet' format requires pyarrow (pip install pyarrow)")
+
+    table = pa.table(dict({'time': time}, **histories))
+    pq.write_table(table, base + '.parquet')
+    spectra = pa.table({'T': np.asarray(results['T'], dtype=float),
+                        'PSA': np.asarray(results['PSA'], dtype=float),
+                        'PSA_seed': np.asarray(results['PSA_seed'], dtype=float)})
+    pq.write_table(spectra, base + '_spectra.parquet')
+    return [base + '.parquet', base + '_spectra.parquet']
+
+
+class ResultsArchive:
+    """
+    Archive with the results of a suite of records, written one record at
+    a time so the whole suite is never held in memory. The file is an
+    .npz archive: np.load(filepath) gives the arrays as '<name>/<key>'
+    (e.g. 'RSN6_pair/acc1', see results_dict) plus '<name>/dt'.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the archive
+    compress : bool
+        Whether the entries are deflate compressed
+
+    Examples
+    --------
+    >>> with ResultsArchive('suite.npz') as archive:
+    ...     for name, result, dt in matched:
+    ...         archive.add(name, result, dt)
+    """
+
+    def __init__(self, filepath: str, compress: bool = True):
+        self.filepath = filepath
+        self.names = []
+        mode = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip = zipfile.ZipFile(filepath, 'w', compression=mode, allowZip64=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def add(self, name: str, result, dt: float):
+        """
+        Appends the results of a record.
+
+        Parameters
+        ----------
+        name : str
+            Name of the record in the archive (unique)
+        result : tuple or dict
+            Outputs of REQPY_single / REQPYrotdnn, see results_dict
+        dt : float
+            Time step of the record
+        """
+        if name in self.names:
+            raise ValueError('%s is already in the archive' % name)
+        arrays = _arrays(results_dict(result))
+        arrays['dt'] = np.asarray(dt)
+        for key, value in arrays.items():
+            with self._zip.open('%s/%s.npy' % (name, key), 'w', force_zip64=True) as file:
+                np.lib.format.write_array(file, np.asanyarray(value), allow_pickle=False)
+        self.names.append(name)
+
+    def close(self):
+        self._zip.close()
+
+
+def write_suite(filepath: str, results, dt, names: List[str] = None, compress: bool = True) -> List[str]:
+    """
+    Streams the results of a suite (e.g. from reqpy.REQPY_batch) to one
+    archive, see ResultsArchive. Failed records (None) are skipped.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the archive
+    results : iterable
+        Outputs of REQPY_single / REQPYrotdnn per record (a generator is
+        consumed one record at a time)
+    dt : float or sequence
+        Time step, single value or one per record
+    names : List[str]
+        Names of the records (default None, record_0, record_1, ...)
+    compress : bool
+        Whether the entries are deflate compressed
+
+    Returns
+    -------
+    names : List[str]
+        Names of the records written
+    """
+    dt = np.asarray(dt, dtype=float)
+    with ResultsArchive(filepath, compress) as archive:
+        for k, result in enumerate(results):
+            if result is None:
+                continue
+            name = names[k] if names is not None else 'record_%i' % k
+            archive.add(name, result, float(dt if dt.ndim == 0 else dt[k]))
+    return archive.names
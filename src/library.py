@@ -0,0 +1,283 @@
+import fnmatch
+import json
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Any
+
+import numpy as np
+from numpy import ndarray
+
+import utilities
+
+__all__ = ['RecordLibrary', 'RecordInfo']
+
+VERTICAL_COMPONENTS = ('UP', 'DWN', 'DOWN', 'V', 'VER', 'VERT', 'Z')  # components excluded from the pairs
+
+RecordInfo = namedtuple('RecordInfo', ['path', 'event', 'year', 'station', 'component', 'dt', 'npts', 'eqname'])
+RecordInfo.__doc__ = """
+Header fields of a record in a RecordLibrary (path is absolute).
+"""
+
+
+class RecordLibrary:
+    """
+    Indexed library of PEER NGA (.AT2) records stored under a directory.
+
+    scan walks the directory tree and reads the headers of the new or
+    modified files in parallel (threads), keeping event, year, station,
+    component, dt, npts and eqname in a persistent JSON index, so later
+    sessions only read the headers of the files that changed. Records
+    are selected with query (header fields only) and their accelerations
+    read when loaded, optionally through a utilities.RecordCache. pairs
+    groups the horizontal components recorded at the same station during
+    the same event, ready for reqpy.REQPYrotdnn / reqpy.REQPY_batch.
+
+    Parameters
+    ----------
+    root : str
+        Directory with the records
+    index_file : str
+        Path of the JSON index (default records_index.json in root)
+    cache : utilities.RecordCache
+        Binary cache used to load the records (default None, the files
+        are parsed with utilities.read_record)
+    """
+
+    def __init__(self, root: str, index_file: str = None, cache: utilities.RecordCache = None):
+        self.root = os.path.abspath(root)
+        self.index_file = index_file or os.path.join(self.root, 'records_index.json')
+        self.cache = cache
+        self.errors = {}
+        self._entries = self._read_index()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return (self._info(relpath) for relpath in sorted(self._entries))
+
+    def scan(self, pattern: str = '*.AT2', workers: int = None) -> int:
+        """
+        Updates the index with the records under root.
+
+        Parameters
+        ----------
+        pattern : str
+            File name pattern of the records (case insensitive)
+        workers : int
+            Number of threads reading the headers (default None, chosen
+            by concurrent.futures)
+
+        Returns
+        -------
+        nread : int
+            Number of headers read (new or modified files); the files
+            that could not be read are listed in the errors attribute
+        """
+        found = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if fnmatch.fnmatch(filename.upper(), pattern.upper()):
+                    path = os.path.join(dirpath, filename)
+                    found[os.path.relpath(path, self.root)] = os.stat(path)
+
+        todo = [relpath for relpath, stat in found.items()
+                if relpath not in self._entries
+                or self._entries[relpath]['size'] != stat.st_size
+                or self._entries[relpath]['mtime'] != stat.st_mtime_ns]
+
+        self.errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            headers = list(pool.map(self._read_header, todo))
+
+        entries = {relpath: entry for relpath, entry in self._entries.items() if relpath in found}
+        for relpath, header in zip(todo, headers):
+            if isinstance(header, Exception):
+                self.errors[os.path.join(self.root, relpath)] = header
+                entries.pop(relpath, None)
+                continue
+            header['size'] = found[relpath].st_size
+            header['mtime'] = found[relpath].st_mtime_ns
+            entries[relpath] = header
+
+        self._entries = entries
+        self.save()
+        return len(todo) - len(self.errors)
+
+    def save(self):
+        """
+        Writes the index file.
+        """
+        directory = os.path.dirname(self.index_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.json.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump({'root': self.root, 'records': self._entries}, file)
+            os.replace(tmp, self.index_file)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def query(self, **criteria) -> List[RecordInfo]:
+        """
+        Selects records by their header fields.
+
+        Each keyword is a RecordInfo field compared with: a string (case
+        insensitive equality), a (min, max) tuple (inclusive, None for an
+        open end), a callable returning True for the accepted values, or
+        any other value (equality, with a tolerance for floats).
+
+        Examples
+        --------
+        >>> library.query(event='Northridge-01', dt=0.01)
+        >>> library.query(year=(1990, None), npts=lambda n: n < 10000)
+
+        Returns
+        -------
+        records : List[RecordInfo]
+            Matching records, sorted by path
+        """
+        for field in criteria:
+            if field not in RecordInfo._fields:
+                raise ValueError('unknown field %s, must be one of %s' % (field, ', '.join(RecordInfo._fields)))
+        return [info for info in self if all(_matches(getattr(info, field), value)
+                                             for field, value in criteria.items())]
+
+    def load(self, record, scalefactor: float = 1) -> utilities.Record:
+        """
+        Reads the accelerations of a record.
+
+        Parameters
+        ----------
+        record : RecordInfo or str
+            Record (as returned by query) or its path
+        scalefactor : float
+            Scale factor in which the acceleration values will be multiplied.
+
+        Returns
+        -------
+        record : utilities.Record
+            Named tuple with acc, dt, npts and eqname
+        """
+        path = record.path if isinstance(record, RecordInfo) else record
+        if self.cache is not None:
+            return self.cache.load(path, 'nga', scalefactor=scalefactor)
+        return utilities.read_record(path, 'nga', scalefactor=scalefactor)
+
+    def pairs(self, records: List[RecordInfo] = None) -> List[Tuple[RecordInfo, RecordInfo]]:
+        """
+        Pairs the horizontal components recorded at the same station
+        during the same event (and with the same dt). Vertical components
+        (see VERTICAL_COMPONENTS) are ignored; when a station has more
+        than two horizontal components the first two, sorted by
+        component, are used.
+
+        Parameters
+        ----------
+        records : List[RecordInfo]
+            Records to pair (default None, the whole library)
+
+        Returns
+        -------
+        pairs : List[Tuple[RecordInfo, RecordInfo]]
+            Horizontal pairs, sorted by event and station
+        """
+        if records is None:
+            records = list(self)
+        groups = {}
+        for info in records:
+            if _is_vertical(info.component):
+                continue
+            key = (info.event, info.year, info.station, round(info.dt, 9))
+            groups.setdefault(key, []).append(info)
+
+        pairs = []
+        for key in sorted(groups, key=lambda k: tuple(str(item) for item in k)):
+            group = sorted(groups[key], key=lambda info: info.component)
+            if len(group) >= 2:
+                pairs.append((group[0], group[1]))
+        return pairs
+
+    def load_suite(self, records, scalefactor: float = 1) -> Tuple[List, ndarray]:
+        """
+        Loads a suite of single records or pairs for reqpy.REQPY_batch.
+
+        Parameters
+        ----------
+        records : list
+            RecordInfo items and/or pairs of them (see pairs)
+        scalefactor : float
+            Scale factor in which the acceleration values will be multiplied.
+
+        Returns
+        -------
+        suite : list
+            Acceleration vectors (single records) and (acc1, acc2) tuples
+            (pairs, trimmed to the shorter component)
+        fs : ndarray
+            Sampling frequency of each item
+        """
+        suite = []
+        fs = np.zeros(len(records))
+        for k, item in enumerate(records):
+            if isinstance(item, RecordInfo):
+                record = self.load(item, scalefactor)
+                suite.append(record.acc)
+            else:
+                record, record2 = (self.load(info, scalefactor) for info in item)
+                n = min(record.npts, record2.npts)
+                suite.append((record.acc[:n], record2.acc[:n]))
+            fs[k] = 1 / record.dt
+        return suite, fs
+
+    def _info(self, relpath: str) -> RecordInfo:
+        entry = self._entries[relpath]
+        return RecordInfo(os.path.join(self.root, relpath), entry['event'], entry['year'], entry['station'],
+                          entry['component'], entry['dt'], entry['npts'], entry['eqname'])
+
+    def _read_header(self, relpath: str):
+        try:
+            return utilities.read_at2_header(os.path.join(self.root, relpath))
+        except (OSError, ValueError, IndexError, AttributeError, StopIteration) as error:
+            return error
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_file, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if index.get('root') != self.root:  # index of a different tree
+            return {}
+        return index.get('records', {})
+
+
+def _matches(value: Any, criterion: Any) -> bool:
+    """
+    Whether a header field meets a query criterion (see RecordLibrary.query).
+    """
+    if callable(criterion):
+        return bool(criterion(value))
+    if isinstance(criterion, tuple):
+        low, high = criterion
+        if value is None:
+            return False
+        return (low is None or value >= low) and (high is None or value <= high)
+    if isinstance(criterion, str):
+        return isinstance(value, str) and value.strip().lower() == criterion.strip().lower()
+    if isinstance(criterion, float) and value is not None:
+        return bool(np.isclose(value, criterion, rtol=1e-9, atol=0))
+    return value == criterion
+
+
+def _is_vertical(component: str) -> bool:
+    """
+    Whether a component label denotes the vertical direction (e.g. UP,
+    DWN, V, HNZ).
+    """
+    label = component.strip().upper()
+    return label in VERTICAL_COMPONENTS or label.endswith(('UP', 'DWN', 'Z'))
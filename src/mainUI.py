@@ -2,28 +2,27 @@ import sys
 
 import numpy as np
 from PyQt6 import QtWidgets, uic
+from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtWidgets import QDialog, QMessageBox
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
+from scipy import integrate
 
+import export
+import plotting
 import reqpy
 import utilities
 
 
-def remove_widget_from_layout(layout):
-    count = layout.count()
-    if count == 0:
-        return layout
-    else:
-        item = layout.itemAt(count - 1)
-        layout.removeItem(item)
-    return layout
+def screen_dpi():
+    screen = QtWidgets.QApplication.primaryScreen()
+    return screen.logicalDotsPerInch() if screen is not None else 100
 
 
 class MplCanvas(FigureCanvasQTAgg):
-    def __init__(self, parent=None, width=5, height=4, dpi=600, fig=None):
+    def __init__(self, parent=None, width=5, height=4, dpi=None, fig=None):
         if fig is None:
-            self.fig = Figure(figsize=(width, height), dpi=dpi)
+            self.fig = Figure(figsize=(width, height), dpi=dpi or screen_dpi())
             self.axes = self.fig.add_subplot(111)
         else:
             self.fig = fig
@@ -34,6 +33,42 @@ class MplCanvas(FigureCanvasQTAgg):
         self.fig.clf()
 
 
+class MatchWorker(QThread):
+    """
+    Runs reqpy.REQPY_single off the UI thread. The progress (0-100) and
+    the RMSE / misfit of each iteration are emitted as signals, and the
+    outputs are handed back with finished_match to be drawn by the UI
+    thread. requestInterruption() cancels the run before the next
+    iteration.
+    """
+    progress = pyqtSignal(int)
+    iteration = pyqtSignal(int, int, float, float)  # iteration, nit, rmse, misfit
+    finished_match = pyqtSignal(object)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, **kwargs):
+        super(MatchWorker, self).__init__(parent)
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = reqpy.REQPY_single(callback=self._event, verbose=False, full_output=True, **self.kwargs)
+        except reqpy.MatchCancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(str(error))
+        else:
+            self.finished_match.emit(result)
+
+    def _event(self, event):
+        if self.isInterruptionRequested():
+            raise reqpy.MatchCancelled()
+        if event['stage'] == 'iteration' and event['event'] == 'end':
+            self.progress.emit(int(event['iteration'] / event['nit'] * 100))
+            self.iteration.emit(event['iteration'], event['nit'], event['rmse'], event['misfit'])
+
+
 class MainUI(QtWidgets.QMainWindow):
     def __init__(self):
         super(MainUI, self).__init__()
@@ -45,8 +80,14 @@ class MainUI(QtWidgets.QMainWindow):
         self.pushButton_2.clicked.connect(self.plot_ec8)
         self.pushButton_3.clicked.connect(self.fit)
         self.pushButton_4.clicked.connect(self.save_results_tab1)
+        self.pushButton_5.clicked.connect(self.cancel_fit)
         self.comboBox.currentTextChanged.connect(self._enable_dt)
         self.lineEdit_4.setEnabled(False)
+        self.worker = None
+        self.record_canvas = None
+        self.ec8_canvas = None
+        self.history_canvas = None
+        self.spectrum_canvas = None
 
     def _enable_dt(self):
         if self.comboBox.currentText() == 'PEER NGA' or self.comboBox.currentText() == 'Two Columns':
@@ -55,20 +96,9 @@ class MainUI(QtWidgets.QMainWindow):
             self.lineEdit_4.setEnabled(True)
 
     def save_results_tab1(self):
-        with open('vel.txt', 'w') as vel_file:
-            for index, item in enumerate(self.cvel):
-                vel_file.write(f'{self.time[index]} {item}\n')
-        vel_file.close()
-
-        with open('disp.txt', 'w') as disp_file:
-            for index, item in enumerate(self.cdespl):
-                disp_file.write(f'{self.time[index]} {item}\n')
-        disp_file.close()
-
-        with open('accel.txt', 'w') as accel_file:
-            for index, item in enumerate(self.PSAccs):
-                accel_file.write(f'{self.time[index]} {item}\n')
-        accel_file.close()
+        export.write_two_column('vel.txt', self.time, self.cvel)
+        export.write_two_column('disp.txt', self.time, self.cdespl)
+        export.write_two_column('accel.txt', self.time, self.ccs)
         message_box = QMessageBox()
         message_box.setWindowTitle("Info")
         message_box.setText("Data Saved")
@@ -90,26 +120,74 @@ class MainUI(QtWidgets.QMainWindow):
         # labels: enhancement
         # assignees: iammix
 
+        if self.worker is not None and self.worker.isRunning():
+            return
         self.progressBar.setValue(0)
         fs = 1 / (self.time[1] - self.time[0])
-        ccs, rms, misfit, self.cvel, self.cdespl, self.PSAccs, PSAs, T, sf, fig1, fig2 = reqpy.REQPY_single(
-            np.array(self.accel), fs,
-            self.ds_pga, self.ds_periods,
-            T1=0, T2=10,
-            zi=float(self.lineEdit_3.text()),
-            nit=30, NS=100,
-            baseline=True, plots=True, progress_bar_object=self.progressBar)
-        plot_layout1 = self.verticalLayout_3
-        plot_layout1 = remove_widget_from_layout(plot_layout1)
-        canvas1 = FigureCanvasQTAgg(fig1)
-        plot_layout1.addWidget(canvas1)
-        canvas1.show()
-
-        plot_layout2 = self.verticalLayout_4
-        plot_layout2 = remove_widget_from_layout(plot_layout2)
-        canvas2 = FigureCanvasQTAgg(fig2)
-        plot_layout2.addWidget(canvas2)
-        canvas2.show()
+        self.worker = MatchWorker(self, s=np.array(self.accel), fs=fs,
+                                  dso=self.ds_pga, To=self.ds_periods,
+                                  T1=0, T2=10,
+                                  zi=float(self.lineEdit_3.text()),
+                                  nit=30, NS=100,
+                                  baseline=True, plots=False)
+        self.worker.progress.connect(self.progressBar.setValue)
+        self.worker.iteration.connect(self._show_iteration)
+        self.worker.finished_match.connect(self._fit_finished)
+        self.worker.cancelled.connect(lambda: self.statusbar.showMessage('Matching cancelled'))
+        self.worker.failed.connect(self._fit_failed)
+        self.worker.finished.connect(self._fit_stopped)
+        self.pushButton_3.setEnabled(False)
+        self.pushButton_5.setEnabled(True)
+        self.statusbar.showMessage('Matching...')
+        self.worker.start()
+
+    def cancel_fit(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.statusbar.showMessage('Cancelling...')
+
+    def _show_iteration(self, iteration, nit, rmse, misfit):
+        self.statusbar.showMessage('Iteration %i of %i: RMSE %.2f %%, avg. misfit %.2f %%'
+                                   % (iteration, nit, rmse, misfit))
+
+    def _fit_finished(self, result):
+        self.ccs, rms, misfit, self.cvel, self.cdespl, self.PSAccs, PSAs, T, sf, _, _, info = result
+        self.progressBar.setValue(100)
+        self.statusbar.showMessage('Matching finished: RMSE %.2f %%, avg. misfit %.2f %%' % (rms, misfit))
+
+        t = np.arange(np.size(self.ccs)) * (self.time[1] - self.time[0])
+        sacc = sf * np.asarray(self.accel)
+        svel = integrate.cumtrapz(sacc, t, initial=0)
+        sdespl = integrate.cumtrapz(svel, t, initial=0)
+        if self.history_canvas is None:
+            self.history_canvas = self._add_canvas(self.verticalLayout_3, width=4, height=6.5)
+            self.history_plot = plotting.HistoryPlot(self.history_canvas.fig)
+        self.history_plot.update(t, (sacc, svel, sdespl), (self.ccs, self.cvel, self.cdespl))
+        self.history_canvas.draw_idle()
+
+        To = np.asarray(self.ds_periods)
+        order = np.argsort(To)
+        ds = np.interp(T, To[order], np.asarray(self.ds_pga)[order], left=np.nan, right=np.nan)
+        if self.spectrum_canvas is None:
+            self.spectrum_canvas = self._add_canvas(self.verticalLayout_4, width=5.8, height=6)
+            self.spectrum_plot = plotting.SpectrumPlot(self.spectrum_canvas.fig)
+        self.spectrum_plot.update(T, ds, PSAs, sf, self.PSAccs, info['T1'], info['T2'])
+        self.spectrum_canvas.draw_idle()
+
+    def _add_canvas(self, layout, axes=False, **kwargs):
+        canvas = MplCanvas(self, **kwargs)
+        if not axes:
+            canvas.reset()
+        layout.addWidget(canvas)
+        return canvas
+
+    def _fit_failed(self, message):
+        self.statusbar.showMessage('Matching failed')
+        QMessageBox.critical(self, 'Error', message)
+
+    def _fit_stopped(self):
+        self.pushButton_3.setEnabled(True)
+        self.pushButton_5.setEnabled(False)
 
     def plot_ec8(self):
         self.ds_periods, self.ds_pga = utilities.ec8_rs(float(self.lineEdit_2.text()), self.comboBox_2.currentText(),
@@ -117,15 +195,16 @@ class MainUI(QtWidgets.QMainWindow):
                                                         importance_class=int(self.comboBox_4.currentText()),
                                                         damping=float(self.lineEdit_3.text()))
 
-        plot_layout = self.verticalLayout_2
-        sc = MplCanvas(self, width=10, height=4, dpi=80)
-        plot_layout = remove_widget_from_layout(plot_layout)
-        sc.axes.plot(self.ds_periods, self.ds_pga, linewidth=1.0)
-        sc.axes.set_title('EC8 Design Spectrum')
-        sc.axes.set_xlabel('Periods (sec)')
-        sc.axes.set_ylabel('PGA (g)')
-        plot_layout.addWidget(sc)
-        sc.show()
+        if self.ec8_canvas is None:
+            sc = self.ec8_canvas = self._add_canvas(self.verticalLayout_2, axes=True, width=10, height=4, dpi=80)
+            self.ec8_line, = sc.axes.plot([], [], linewidth=1.0)
+            sc.axes.set_title('EC8 Design Spectrum')
+            sc.axes.set_xlabel('Periods (sec)')
+            sc.axes.set_ylabel('PGA (g)')
+        self.ec8_line.set_data(self.ds_periods, self.ds_pga)
+        self.ec8_canvas.axes.relim()
+        self.ec8_canvas.axes.autoscale_view()
+        self.ec8_canvas.draw_idle()
 
     def loadEqFile_and_plot(self):
         # TODO Read different file formats
@@ -135,23 +214,26 @@ class MainUI(QtWidgets.QMainWindow):
         eq_loader = QtWidgets.QFileDialog()
         self.eq_filePath = eq_loader.getOpenFileNames(self, 'Load File')
         if len(self.eq_filePath[0]) != 0:
-            plot_layout = self.verticalLayout
             eq_line_edit = self.lineEdit
-            sc = MplCanvas(self, width=10, height=4, dpi=60)
-            plot_layout = remove_widget_from_layout(plot_layout)
             if self.comboBox.currentText() == 'PEER NGA':
                 self.time, self.accel, self.dt = utilities.processNGAfile(self.eq_filePath[0][0])
             elif self.comboBox.currentText() == 'One Column':
-                self.time, self.accel, self.dt = utilities.processOneCfile(self.eq_filePath[0][0])
+                self.time, self.accel, self.dt = utilities.processOneCfile(self.eq_filePath[0][0],
+                                                                           float(self.lineEdit_4.text()))
             elif self.comboBox.currentText() == 'Two Columns':
                 self.time, self.accel = utilities.processTwoCfile(self.eq_filePath[0][0])
             eq_line_edit.setText(self.eq_filePath[0][0])
-            sc.axes.plot(self.time, self.accel, linewidth=0.5)
-            sc.axes.set_title('Earthquake')
-            sc.axes.set_xlabel('Time (sec)')
-            sc.axes.set_ylabel('Acceleration (g)')
-            plot_layout.addWidget(sc)
-            sc.show()
+            if self.record_canvas is None:
+                sc = self.record_canvas = self._add_canvas(self.verticalLayout, axes=True, width=10, height=4, dpi=60)
+                self.record_line = plotting.DecimatedLine(sc.axes, linewidth=0.5)
+                sc.axes.set_title('Earthquake')
+                sc.axes.set_xlabel('Time (sec)')
+                sc.axes.set_ylabel('Acceleration (g)')
+            self.record_line.set_data(self.time, self.accel)
+            self.record_canvas.axes.set_xlim(self.time[0], self.time[-1])
+            self.record_canvas.axes.relim()
+            self.record_canvas.axes.autoscale_view(scalex=False)
+            self.record_canvas.draw_idle()
 
 
 class AboutPage(QDialog):
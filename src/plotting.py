@@ -0,0 +1,205 @@
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+
+__all__ = ['minmax_decimate', 'DecimatedLine', 'HistoryPlot', 'SpectrumPlot']
+
+MIN_BUCKETS = 200  # fewest buckets of a DecimatedLine (narrow or hidden axes)
+
+
+def minmax_decimate(x: ndarray, y: ndarray, nbuckets: int) -> Tuple[ndarray, ndarray]:
+    """
+    Decimates a trace for display keeping its peaks: the samples are
+    split in nbuckets buckets (one per pixel column) and the minimum and
+    maximum of each bucket are kept, in their original order, together
+    with the first and last samples.
+
+    Parameters
+    ----------
+    x : ndarray
+        Abscissas (e.g. time, ascending)
+    y : ndarray
+        Values of the trace
+    nbuckets : int
+        Number of buckets, at most 2 * nbuckets + 2 points are returned
+
+    Returns
+    -------
+    xd : ndarray
+        Abscissas of the points kept
+    yd : ndarray
+        Values of the points kept
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = y.size
+    nbuckets = max(int(nbuckets), 1)
+    if n <= 2 * nbuckets + 2:
+        return x, y
+
+    size = n // nbuckets
+    m = size * nbuckets
+    blocks = y[:m].reshape(nbuckets, size)
+    imin = np.argmin(blocks, axis=1)
+    imax = np.argmax(blocks, axis=1)
+    start = np.arange(nbuckets) * size
+    index = [[0], (start + np.minimum(imin, imax)), (start + np.maximum(imin, imax))]
+    if m < n:  # samples left after the last full bucket
+        index.append(m + np.array([np.argmin(y[m:]), np.argmax(y[m:])]))
+    index.append([n - 1])
+    index = np.unique(np.concatenate(index))
+    return x[index], y[index]
+
+
+class DecimatedLine:
+    """
+    Line of a matplotlib axes showing a long trace decimated with
+    minmax_decimate to the width of the axes in pixels. The full trace is
+    kept and the visible range decimated again when the axes are zoomed
+    or panned, so the peaks shown are always the true ones.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes where the line is drawn
+    x, y : ndarray
+        Trace (x ascending), default None (empty line, see set_data)
+    **kwargs
+        Line properties passed to ax.plot (color, linewidth, label, ...)
+    """
+
+    def __init__(self, ax, x: ndarray = None, y: ndarray = None, **kwargs):
+        self.ax = ax
+        self.line, = ax.plot([], [], **kwargs)
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        ax.callbacks.connect('xlim_changed', lambda _: self.update())
+        if x is not None:
+            self.set_data(x, y)
+
+    def set_data(self, x: ndarray, y: ndarray):
+        """
+        Replaces the trace (the whole trace is decimated, call
+        ax.relim / ax.autoscale_view to fit the axes to it).
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.line.set_data(*minmax_decimate(self.x, self.y, self._buckets()))
+
+    def update(self):
+        """
+        Decimates again the part of the trace within the x limits.
+        """
+        if self.x.size == 0:
+            return
+        low, high = sorted(self.ax.get_xlim())
+        start = max(np.searchsorted(self.x, low) - 1, 0)
+        stop = np.searchsorted(self.x, high) + 1
+        self.line.set_data(*minmax_decimate(self.x[start:stop], self.y[start:stop], self._buckets()))
+
+    def _buckets(self) -> int:
+        return max(int(self.ax.get_window_extent().width), MIN_BUCKETS)
+
+
+class HistoryPlot:
+    """
+    Acceleration, velocity and displacement of the scaled and matched
+    records (same layout as the fig1 of reqpy.REQPY_single) drawn with
+    DecimatedLine. The axes and lines are created once and updated in
+    place by update.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure where the axes are created
+    """
+
+    def __init__(self, fig):
+        self.fig = fig
+        self.axes = [fig.add_subplot(311), fig.add_subplot(312), fig.add_subplot(313)]
+        self.scaled = [DecimatedLine(ax, color='c', linewidth=0.5, label=': scaled') for ax in self.axes]
+        self.matched = [DecimatedLine(ax, color='b', linewidth=0.5, label=': matched') for ax in self.axes]
+        for ax, label in zip(self.axes, ('acc. [g]', 'vel./g', 'displ./g')):
+            ax.set_ylabel(label)
+        self.axes[2].set_xlabel('time [s]')
+        self.axes[2].legend(frameon=False, loc='upper right')
+
+    def update(self, t: ndarray, scaled: Tuple[ndarray, ndarray, ndarray], matched: Tuple[ndarray, ndarray, ndarray]):
+        """
+        Draws new histories.
+
+        Parameters
+        ----------
+        t : ndarray
+            Time vector
+        scaled : Tuple[ndarray, ndarray, ndarray]
+            Acceleration, velocity and displacement of the scaled record
+        matched : Tuple[ndarray, ndarray, ndarray]
+            Acceleration, velocity and displacement of the matched record
+        """
+        for ax, line1, line2, values1, values2 in zip(self.axes, self.scaled, self.matched, scaled, matched):
+            line1.set_data(t, values1)
+            line2.set_data(t, values2)
+            ax.set_xlim(t[0], t[-1])
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        self.fig.tight_layout()
+
+
+class SpectrumPlot:
+    """
+    Target, unscaled, scaled and matched spectra with the matching range
+    shaded (same layout as the fig2 of reqpy.REQPY_single); the axes and
+    lines are created once and updated in place by update.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        Figure where the axes are created
+    """
+
+    def __init__(self, fig):
+        self.fig = fig
+        self.ax = fig.add_subplot(111)
+        self.ax.set_xscale('log')
+        self.target, = self.ax.plot([], [], color=[0.5, 0.5, 0.5], linewidth=3)
+        self.unscaled, = self.ax.plot([], [], '-k')
+        self.scaled, = self.ax.plot([], [], '-c')
+        self.matched, = self.ax.plot([], [], '-b')
+        self.band = None
+        self.ax.legend((': target', ': unscaled', ': scaled', ': matched'),
+                       frameon=True, ncol=2, bbox_to_anchor=(0, 1), loc='lower left')
+        self.ax.set_xlabel('T[s]')
+        self.ax.set_ylabel('PSA [g]')
+
+    def update(self, T: ndarray, ds: ndarray, PSAs: ndarray, sf: float, PSAccs: ndarray, T1: float, T2: float):
+        """
+        Draws new spectra.
+
+        Parameters
+        ----------
+        T : ndarray
+            Periods of the spectra
+        ds : ndarray
+            Target spectrum resampled at T (NaN outside the target periods)
+        PSAs : ndarray
+            Spectrum of the seed record
+        sf : float
+            Scaling factor of the seed record
+        PSAccs : ndarray
+            Spectrum of the matched record
+        T1, T2 : float
+            Matching range
+        """
+        self.target.set_data(T, ds)
+        self.unscaled.set_data(T, PSAs)
+        self.scaled.set_data(T, sf * PSAs)
+        self.matched.set_data(T, PSAccs)
+        limy = 1.06 * np.max([np.max(sf * PSAs), np.max(PSAccs)])
+        if self.band is not None:
+            self.band.remove()
+        self.band = self.ax.fill_between([T1, T2], [limy, limy], color='skyblue', alpha=0.2)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.tight_layout()
@@ -42,14 +42,37 @@ The following is a list of the functions included in the module:
 
 *REQPY_single: CWT based modification of a single component from
  a historic record to obtain spectrally equivalent acceleration series 
+
+*REQPY_batch: Spectral matching of a suite of records (single components
+ or horizontal pairs) to the same target using a pool of processes
              
 *ResponseSpectrum: decides what approach to use to estimate the response spectrum
 based on the specified damping value (>=4% frequency domain, <4% piecewise)
 
+*set_spectra_cache: Enables the disk cache of response spectra (see also
+spectra_cache_info, clear_spectra_cache)
+
 *RSPW: Response spectra using a piecewise algorithm
 
+*pwblocks: Piecewise exact response of SDOF oscillators evaluated as linear
+recursive filters (scipy.signal.lfilter)
+
+*pwcoefs: Coefficients of the piecewise exact recurrence
+
+*SpectralOperator: SDOF kernels (transfer functions / filter coefficients)
+precomputed for a record geometry
+
+*spectral_operator: returns the cached SpectralOperator for a geometry
+(see also spectral_cache_info, clear_spectral_cache)
+
 *RSFD: Response spectra (operations performed in the frequency domain)
 
+*fdlength: Padded transform length of the frequency domain spectra ('pow2'
+or 'fast' padding policy, see also set_fd_padding)
+
+*fdblocks: Batched frequency domain response of SDOF oscillators for blocks
+of periods (real-input FFTs on the half spectrum)
+
 *ResponseSpectrumTheta: decides what approach to use to estimate the rotated 
 response spectra based on damping value (>=4% frequency domain, <4% piecewise)
 
@@ -59,10 +82,22 @@ accommodated in a matrix (operations performed in the frequency domain)
 *RSPWtheta: Rotated response spectra, returns the spectra for each angle 
 accommodated in a matrix (piecewise approach)
 
+*ResponseSpectrumRotDnn: RotDnn response spectra (closed form for RotD100,
+tiled rotation for other percentiles)
+
+*rotdsd: Peak rotated displacements evaluated in angle/time tiles
+
 *rotdnn - computes rotated and rotdnn spectra
 
+*detailresponses: SDOF responses of the detail functions (superposition)
+
+*superposition_sd: Spectrum of a record rebuilt from scaled detail functions
+via linear superposition of the detail responses
+
 *basecorr: Performs baseline correction
 
+*basecorr_batch: Baseline correction of several records at once (vectorized)
+
 *baselinecorrect: Performs baseline correction (iteratively calling basecorr)
 
 *cwtzm: Continuous Wavelet Transform using the Suarez-Montejo wavelet via 
@@ -72,17 +107,49 @@ convolution in the frequency domain
 
 *getdetails: Generates the detail functions from the wavelet coefficients
 
+*cwtdetails: Wavelet coefficients, detail functions and reconstructed signal
+in a single pass (optionally fusing analysis and synthesis filters)
+
+*WaveletFilterBank: Suarez-Montejo wavelets at a set of scales kept in the
+frequency domain (batched CWT and detail functions)
+
+*wavelet_filterbank: returns the cached WaveletFilterBank for a geometry
+(see also set_filterbank_cache, filterbank_cache_info, clear_filterbank_cache)
+
+*set_fft_backend: Selects the library performing the FFTs (numpy, scipy.fft
+or pyFFTW) and its number of threads (see also get_fft_backend and the
+fft_backend context manager)
+
+*MatchMonitor: Reports the stages of the matching procedures (with their
+wall-clock timings) to subscribers such as print_progress and progress_bar,
+which can stop them raising MatchCancelled
+
 *CheckPeriodRange: Verifies that the specified matching period range is doable
 
+*CheckConvergence: Verifies the stopping criteria of the matching iterations
+
 *load_PEERNGA_record: Load record in .at2 format (PEER NGA Databases)
 
 '''
 
-__all__ = ['REQPYrotdnn']
+__all__ = ['REQPYrotdnn', 'REQPY_batch']
+
+RS_BLOCK_BYTES = 64 * 2 ** 20  # memory budget for the batched spectra work arrays
+SPECTRA_OUTPUTS = ('PSA', 'PSV', 'SA', 'SV', 'SD')  # quantities returned by ResponseSpectrum
+OPERATOR_KERNEL_BYTES = 128 * 2 ** 20  # largest transfer function matrix kept by a SpectralOperator
+SPECTRAL_CACHE_SIZE = 16  # number of SpectralOperator instances kept in the cache
+FILTERBANK_CACHE_SIZE = 8  # number of WaveletFilterBank instances kept in memory
+FILTERBANK_CACHE_BYTES = 512 * 2 ** 20  # memory budget of the filter banks cache
+FFT_BACKENDS = ('numpy', 'scipy', 'pyfftw')  # libraries supported by set_fft_backend
+FD_PADDINGS = ('pow2', 'fast')  # zero padding policies of the frequency domain spectra
+SPECTRA_CACHE_BYTES = 256 * 2 ** 20  # disk budget of the response spectra cache
+_KEEP = object()  # default of the cache setters, keeps the current value
 
 
 def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
-                baseline=1, plots=1):
+                baseline=1, plots=1, superposition=False, keep_history=True, history_file=None,
+                rmse_tol=None, misfit_tol=None, rtol=None, patience=None, full_output=False,
+                workers=None, baseline_search='linear', callback=None, verbose=True):
     """
     Response spectral matching of horizontal ground motion
     components to an orientation-independent spectrum (RotDnn)
@@ -110,8 +177,52 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
         number of scale values to perform the CWT (default 100)
     baseline: boolean
         True/False (yes/no, whether baseline correction is performed, default True)
+    baseline_search: str
+        search of the time to correct when the baseline correction fails,
+        'linear' or 'bisect' (default 'linear', see baselinecorrect)
     plots: boolean
         True/False (yes/no, whether plots are generated, default True)
+    superposition: boolean
+        True/False, whether the spectra of the iterations are obtained
+        by linear superposition of the responses of the detail functions
+        (computed once, see detailresponses) instead of transforming each
+        iterate; needs memory for 2 x (periods in matching range) x NS x n
+        floats (default False)
+    keep_history: boolean
+        True/False, whether the records of all the iterations are kept in
+        memory; if False only the best iterate is kept so memory does not
+        grow with nit (default True)
+    history_file: str
+        path of a .npy file where the records of all the iterations are
+        written (memory-mapped, array 2 x (nit + 1) x n) for diagnostics;
+        when given nothing is kept in memory (default None)
+    rmse_tol, misfit_tol: float
+        stop the iterations once the RMSE / average misfit (%) are below
+        these values (all the given ones must be met, default None)
+    rtol: float
+        relative RMSE reduction, with respect to the best iteration, that
+        counts as an improvement (default None, any reduction)
+    patience: int
+        stop after this many iterations without improvement, reported as
+        'diverged' if the RMSE grew at each of them and 'stagnated'
+        otherwise (default None, 1 if rtol is given)
+    full_output: boolean
+        True/False, whether a dictionary with information about the
+        iterations is returned as an additional output (default False)
+    workers: int
+        number of threads used to process the independent stages of the
+        two components concurrently (wavelet decomposition, detail
+        responses and baseline correction) and to share the periods of
+        the RotDnn spectra; the results do not depend on it (default
+        None, serial)
+    callback: callable
+        subscriber called with the events of each stage (wavelet
+        decomposition, detail functions, seed spectra, each iteration
+        with its RMSE and misfit, baseline correction and final spectra),
+        see MatchMonitor (default None)
+    verbose: boolean
+        True/False, whether the progress messages are printed (default
+        True, see print_progress)
         
         
     Returns
@@ -132,11 +243,23 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
         root mean squared error
     meanefin: float
         average misfit
+    info: dict
+        only if full_output: niter (iterations performed), stop_reason
+        ('maxiter', 'converged', 'stagnated' or 'diverged'), 
+        best_iteration, rmse and meane (per iteration, %), history
+        (records of the iterations, 2 x (niter + 1) x n, when kept),
+        nfft (padded length of the spectra, None when piecewise),
+        T1 and T2 (matching range after CheckPeriodRange),
+        timings (wall-clock time per stage and total, s) and
+        iteration_times (s)
 
     """
+    import time
     import numpy as np
     from scipy import integrate
 
+    start = time.perf_counter()
+    monitor = MatchMonitor((print_progress if verbose else None, callback))
     pi = np.pi
     n = np.size(s1)
     theta = np.arange(0, 180, 1)
@@ -156,7 +279,7 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
     To = To[Tsortindex]
     dso = dso[Tsortindex]  # ensures ascending order in target spectrum
 
-    T1, T2, FF1 = CheckPeriodRange(T1, T2, To, FF1, FF2)  # verifies period range
+    T1, T2, FF1 = CheckPeriodRange(T1, T2, To, FF1, FF2, verbose)  # verifies period range
 
     # Perform Continuous Wavelet Decomposition:
 
@@ -165,19 +288,22 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
     freqs = np.geomspace(FF2, FF1, NS)  # frequencies vector
     T = 1 / freqs  # periods vector
     scales = omega / (2 * pi * freqs)  # scales vector
-    C1 = cwtzm(s1, fs, scales, omega, zeta)  # performs CWT using Suarez-Montejo wavelet
-    C2 = cwtzm(s2, fs, scales, omega, zeta)  # performs CWT using Suarez-Montejo wavelet
-
-    print('=' * 40)
-    print('Wavelet decomposition performed')
-    print('=' * 40)
-
-    D1, sr1 = getdetails(t, s1, C1, scales, omega, zeta)
-    D2, sr2 = getdetails(t, s2, C2, scales, omega, zeta)  # Detail functions and reconstructed signals
+    monitor.start('cwt')
+    bank = wavelet_filterbank(n, fs, scales, omega, zeta)
+    if workers is None or workers <= 1:
+        S = np.vstack((s1, s2))  # both components are decomposed together
+        C = bank.cwt(S)  # performs CWT using Suarez-Montejo wavelet
+    else:
+        S = (s1, s2)  # one thread per component
+        C = _threadmap(bank.cwt, S, workers)
+    monitor.end('cwt')
 
-    print('=' * 40)
-    print('Detail functions generated')
-    print('=' * 40)
+    monitor.start('details')
+    if workers is None or workers <= 1:
+        (D1, D2), (sr1, sr2) = bank.details(C, S)  # Detail functions and reconstructed signals
+    else:
+        (D1, sr1), (D2, sr2) = _threadmap(lambda k: bank.details(C[k], S[k]), (0, 1), workers)
+    monitor.end('details')
 
     ds = np.interp(T, To, dso, left=np.nan, right=np.nan)  # resample target spectrum
     Tlocs = np.nonzero((T >= T1) & (T <= T2))
@@ -186,8 +312,9 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
     meane = np.zeros(nit)
     rmse = np.zeros(nit)
 
-    PSA180or, _, _ = ResponseSpectrumTheta(T, s1, s2, zi, dt, theta)
-    PSArotnnor = np.percentile(PSA180or, nn, axis=0)
+    monitor.start('seed_spectra')
+    PSArotnnor, _, _ = ResponseSpectrumRotDnn(T, s1, s2, zi, dt, nn, theta, workers, cache=True)
+    monitor.end('seed_spectra')
 
     nTlocs = np.size(Tlocs)
     sf = np.sum(ds[Tlocs]) / np.sum(PSArotnnor[Tlocs])  # initial scaling factor
@@ -204,46 +331,73 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
     hPSArotnn = np.zeros((NS, nit + 1))
     hPSArotnn[:, 0] = sf * PSArotnnor
 
-    ns1 = np.zeros((n, nit + 1))
-    ns1[:, 0] = sc1
-
-    ns2 = np.zeros((n, nit + 1))
-    ns2[:, 0] = sc2
+    ns = _iteration_history((2, nit + 1, n), keep_history, history_file)
+    if ns is not None:
+        ns[:, 0] = sc1, sc2
+    brloc = 0  # best iteration so far
 
     dif = np.abs(hPSArotnn[Tlocs, 0] - ds[Tlocs]) / ds[Tlocs]
     meane[0] = np.mean(dif) * 100
     rmse[0] = np.linalg.norm(dif) / np.sqrt(nTlocs) * 100
     factor = np.ones((NS, 1))
 
+    if superposition:
+        R1, R2 = _threadmap(lambda D: detailresponses(T, D, scales, zi, dt, Tlocs, truncate=True),
+                            (D1, D2), workers)
+        F = np.ones(NS)  # accumulated scaling of the detail functions
+
+    niter = 0
+    stop_reason = 'maxiter'
     for m in range(1, nit + 1):
-        print('Now performing iteration %i of %i' % (m, nit))
+        monitor.start('iteration', iteration=m, nit=nit)
         factor[Tlocs, 0] = ds[Tlocs] / hPSArotnn[Tlocs, m - 1]
 
-        D1 = factor * D1
-        ns1[:, m] = np.trapz(D1.T, scales)
+        D1 *= factor
+        ns1 = np.trapz(D1.T, scales)
 
-        D2 = factor * D2
-        ns2[:, m] = np.trapz(D2.T, scales)
+        D2 *= factor
+        ns2 = np.trapz(D2.T, scales)
 
-        PSA180, _, _ = ResponseSpectrumTheta(T, ns1[:, m], ns2[:, m], zi, dt, theta)
-        hPSArotnn[:, m] = np.percentile(PSA180, nn, axis=0)
+        if superposition:
+            F = F * factor[:, 0]
+            SDrot = superposition_sd(R1, F, R2, nn=nn, theta=theta)
+            hPSArotnn[Tlocs, m] = (2 * pi / T[Tlocs]) ** 2 * SDrot
+        else:
+            hPSArotnn[:, m], _, _ = ResponseSpectrumRotDnn(T, ns1, ns2, zi, dt, nn, theta, workers)
 
         dif = np.abs(hPSArotnn[Tlocs, m] - ds[Tlocs]) / ds[Tlocs]
         meane[m] = np.mean(dif) * 100
         rmse[m] = np.linalg.norm(dif) / np.sqrt(nTlocs) * 100
 
-    brloc = np.argmin(rmse)  # locates min error
+        if ns is not None:
+            ns[:, m] = ns1, ns2
+        if rmse[m] < rmse[brloc]:  # locates min error
+            brloc = m
+            sc1 = ns1  # compatible record
+            sc2 = ns2  # compatible record
+
+        niter = m
+        reason = CheckConvergence(rmse[:m + 1], meane[:m + 1], rmse_tol, misfit_tol, rtol, patience)
+        monitor.end('iteration', iteration=m, nit=nit, rmse=rmse[m], misfit=meane[m], stop_reason=reason)
+        if reason is not None:
+            stop_reason = reason
+            break
 
-    sc1 = ns1[:, brloc]  # compatible record
-    sc2 = ns2[:, brloc]  # compatible record
+    if ns is not None and history_file is not None:
+        ns.flush()
+    info = {'niter': niter, 'stop_reason': stop_reason, 'best_iteration': brloc,
+            'rmse': rmse[:niter + 1], 'meane': meane[:niter + 1],
+            'history': None if ns is None else ns[:, :niter + 1],
+            'nfft': fdlength(n, dt, T) if zi >= 0.04 else None, 'T1': T1, 'T2': T2}
+    del ns
 
     if baseline:
-        scc1, cvel1, cdisp1 = baselinecorrect(sc1, t)
-        scc2, cvel2, cdisp2 = baselinecorrect(sc2, t)
+        monitor.start('baseline')
+        (scc1, cvel1, cdisp1, ok1), (scc2, cvel2, cdisp2, ok2) = _threadmap(
+            lambda sc: _baselinecorrect(sc, t, baseline_search), (sc1, sc2), workers)
+        monitor.end('baseline', succeeded=[ok1, ok2])
     else:
-        print('=' * 40)
-        print('**baseline correction was not performed**')
-        print('=' * 40)
+        monitor.skip('baseline')
         scc1 = sc1
         scc2 = sc2
         cvel1 = integrate.cumtrapz(scc1, t, initial=0)
@@ -251,17 +405,15 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
         cvel2 = integrate.cumtrapz(scc2, t, initial=0)
         cdisp2 = integrate.cumtrapz(cvel2, t, initial=0)
 
-    PSA180, _, _ = ResponseSpectrumTheta(T, scc1, scc2, zi, dt, theta)
-    PSArotnn = np.percentile(PSA180, nn, axis=0)
+    monitor.start('final_spectra')
+    PSArotnn, _, _ = ResponseSpectrumRotDnn(T, scc1, scc2, zi, dt, nn, theta, workers)
 
     dif = np.abs(PSArotnn[Tlocs] - ds[Tlocs]) / ds[Tlocs]
     meanefin = np.mean(dif) * 100
     rmsefin = np.linalg.norm(dif) / np.sqrt(nTlocs) * 100
-
-    print('=' * 40)
-    print('RMSE : %.2f %%' % rmsefin)
-    print('AVG. MISFIT : %.2f %%' % meanefin)
-    print('=' * 40)
+    monitor.end('final_spectra', rmse=rmsefin, misfit=meanefin)
+    info['timings'] = dict(monitor.timings, total=time.perf_counter() - start)
+    info['iteration_times'] = np.array(monitor.iteration_times)
 
     if plots:
         import matplotlib.pyplot as plt
@@ -347,11 +499,17 @@ def REQPYrotdnn(s1, s2, fs, dso, To, nn, T1=0, T2=0, zi=0.05, nit=15, NS=100,
         plt.xlabel('T[s]')
         plt.ylabel('PSA RotDnn [g]')
 
+    if full_output:
+        return (scc1, scc2, cvel1, cvel2, cdisp1, cdisp2, PSArotnn, PSArotnnor,
+                T, meanefin, rmsefin, info)
     return (scc1, scc2, cvel1, cvel2, cdisp1, cdisp2, PSArotnn, PSArotnnor,
             T, meanefin, rmsefin)
 
 
-def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1, plots=1, progress_bar_object=None):
+def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1, plots=1, progress_bar_object=None,
+                 superposition=False, keep_history=True, history_file=None,
+                 rmse_tol=None, misfit_tol=None, rtol=None, patience=None, full_output=False,
+                 baseline_search='linear', callback=None, verbose=True):
     '''
     REQPY_single - CWT based modification of a single component from
     a historic records to obtain spectrally equivalent acceleration series 
@@ -373,7 +531,43 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
         nit: max number of iterations (default 30)
         NS: number of scale values to perform the CWT (default 100)
         baseline: 1/0 (yes/no, whether baseline correction is performed, default 1)
+        baseline_search: search of the time to correct when the baseline
+                correction fails, 'linear' or 'bisect' (default 'linear',
+                see baselinecorrect)
         plots: 1/0 (yes/no, whether plots are generated, default 1)
+        superposition: True/False, whether the spectra of the iterations
+                are obtained by linear superposition of the responses of
+                the detail functions (computed once, see detailresponses)
+                instead of transforming each iterate; needs memory for
+                (periods in matching range) x NS x (padded) n floats
+                (default False)
+        keep_history: True/False, whether the records of all the
+                iterations are kept in memory; if False only the best
+                iterate is kept so memory does not grow with nit 
+                (default True)
+        history_file: path of a .npy file where the records of all the 
+                iterations are written (memory-mapped, array (nit + 1) x n)
+                for diagnostics; when given nothing is kept in memory
+                (default None)
+        rmse_tol, misfit_tol: stop the iterations once the RMSE / average
+                misfit (%) are below these values (all the given ones 
+                must be met, default None)
+        rtol: relative RMSE reduction, with respect to the best iteration,
+                that counts as an improvement (default None, any reduction)
+        patience: stop after this many iterations without improvement
+                (default None, 1 if rtol is given)
+        full_output: True/False, whether a dictionary with information
+                about the iterations is returned as an additional output
+                (default False)
+        progress_bar_object: progress bar updated after each iteration
+                (any object with a setValue method, see progress_bar)
+        callback: subscriber called with the events of each stage 
+                (wavelet decomposition, detail functions, seed spectra,
+                each iteration with its RMSE and misfit, baseline 
+                correction and final spectra), see MatchMonitor 
+                (default None)
+        verbose: True/False, whether the progress messages are printed
+                (default True, see print_progress)
         
     Returns:
         
@@ -386,12 +580,25 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
         PSAs: PSA response spectrum for the seed record (vector, g)
         T: Periods for PSA (vector, s)
         sf: Scaling factor for seed record (float)
+        fig1, fig2: figures with the time histories and spectra
+        info: only if full_output, dictionary with niter (iterations
+              performed), stop_reason ('maxiter', 'converged', 'stagnated'
+              or 'diverged'), best_iteration, rmse and meane (per 
+              iteration, %), history (records of the iterations, 
+              (niter + 1) x n, when kept), nfft (padded length of the
+              spectra, None when piecewise), T1 and T2 (matching range
+              after CheckPeriodRange), timings (wall-clock time per stage
+              and total, s) and iteration_times (s)
     
     '''
 
+    import time
     import numpy as np
     from scipy import integrate
 
+    start = time.perf_counter()
+    monitor = MatchMonitor((print_progress if verbose else None, callback,
+                            None if progress_bar_object is None else progress_bar(progress_bar_object)))
     pi = np.pi
     n = np.size(s)  # number of data points in seed record
     dt = 1 / fs  # time step
@@ -403,7 +610,7 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
     To = To[Tsortindex]
     dso = dso[Tsortindex]  # ensures ascending order in target spectrum
 
-    T1, T2, FF1 = CheckPeriodRange(T1, T2, To, FF1, FF2)  # verifies period range
+    T1, T2, FF1 = CheckPeriodRange(T1, T2, To, FF1, FF2, verbose)  # verifies period range
 
     # Perform Continuous Wavelet Decomposition:
 
@@ -412,26 +619,25 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
     freqs = np.geomspace(FF2, FF1, NS)  # frequencies vector
     T = 1 / freqs  # periods vector
     scales = omega / (2 * pi * freqs)  # scales vector
-    C = cwtzm(s, fs, scales, omega, zeta)  # performs CWT
-
-    print('=' * 40)
-    print('Wavelet decomposition performed')
-    print('=' * 40)
+    monitor.start('cwt')
+    bank = wavelet_filterbank(n, fs, scales, omega, zeta)
+    C = bank.cwt(s)  # performs CWT
+    monitor.end('cwt')
 
     # Generate detail functions:
 
-    D, sr = getdetails(t, s, C, scales, omega, zeta)  # matrix with the detail
+    monitor.start('details')
+    D, sr = bank.details(C, s)  # matrix with the detail
     # functions (D) and
     # signal recondtructed (sr)
-
-    print('=' * 40)
-    print('Detail functions generated')
-    print('=' * 40)
+    monitor.end('details')
 
     # response spectra from the reconstructed and original signal:
 
-    PSAs, _, _, _, _ = ResponseSpectrum(T, s, zi, dt)
-    PSAsr, _, _, _, _ = ResponseSpectrum(T, sr, zi, dt)
+    monitor.start('seed_spectra')
+    PSAs = ResponseSpectrum(T, s, zi, dt, outputs='PSA', cache=True)
+    PSAsr = ResponseSpectrum(T, sr, zi, dt, outputs='PSA')
+    monitor.end('seed_spectra')
 
     # initial scaling of record:
 
@@ -449,79 +655,88 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
     meane = np.zeros((nit + 1))
     rmse = np.zeros((nit + 1))
     hPSAbc = np.zeros((NS, nit + 1))
-    ns = np.zeros((n, nit + 1))
+    ns = _iteration_history((nit + 1, n), keep_history, history_file)
     hPSAbc[:, 0] = sf * PSAsr
-    ns[:, 0] = s
+    if ns is not None:
+        ns[0] = s
+    sc = s  # best record so far
+    brloc = 0
     dif = np.abs(hPSAbc[Tlocs, 0] - ds[Tlocs]) / ds[Tlocs]
     meane[0] = np.mean(dif) * 100
     rmse[0] = np.linalg.norm(dif) / np.sqrt(nTlocs) * 100
     factor = np.ones((NS, 1))
     DN = D
 
+    if superposition:
+        R = detailresponses(T, D, scales, zi, dt, Tlocs)
+        F = np.ones(NS)  # accumulated scaling of the detail functions
+
+    niter = 0
+    stop_reason = 'maxiter'
     for m in range(1, nit + 1):
-        print('Now performing iteration %i of %i' % (m, nit))
+        monitor.start('iteration', iteration=m, nit=nit)
         factor[Tlocs, 0] = ds[Tlocs] / hPSAbc[Tlocs, m - 1]
-        DN = factor * DN
-        ns[:, m] = np.trapz(DN.T, scales)
-        hPSAbc[:, m], _, _, _, _ = ResponseSpectrum(T, ns[:, m], zi, dt)
+        DN *= factor
+        nsm = np.trapz(DN.T, scales)
+        if superposition:
+            F = F * factor[:, 0]
+            hPSAbc[Tlocs, m] = (2 * pi / T[Tlocs]) ** 2 * superposition_sd(R, F)
+        else:
+            hPSAbc[:, m] = ResponseSpectrum(T, nsm, zi, dt, outputs='PSA')
         dif = np.abs(hPSAbc[Tlocs, m] - ds[Tlocs]) / ds[Tlocs]
         meane[m] = np.mean(dif) * 100
         rmse[m] = np.linalg.norm(dif) / np.sqrt(nTlocs) * 100
-        progress_bar_object.setValue((m / nit) * 100)
 
-    brloc = np.argmin(rmse)  # locates min error
-    sc = ns[:, brloc]  # compatible record
+        if ns is not None:
+            ns[m] = nsm
+        if rmse[m] < rmse[brloc]:  # locates min error
+            brloc = m
+            sc = nsm  # compatible record
+
+        niter = m
+        reason = CheckConvergence(rmse[:m + 1], meane[:m + 1], rmse_tol, misfit_tol, rtol, patience)
+        monitor.end('iteration', iteration=m, nit=nit, rmse=rmse[m], misfit=meane[m], stop_reason=reason)
+        if reason is not None:
+            stop_reason = reason
+            break
+
+    if ns is not None and history_file is not None:
+        ns.flush()
+    info = {'niter': niter, 'stop_reason': stop_reason, 'best_iteration': brloc,
+            'rmse': rmse[:niter + 1], 'meane': meane[:niter + 1],
+            'history': None if ns is None else ns[:niter + 1],
+            'nfft': fdlength(n, dt, T) if zi >= 0.04 else None, 'T1': T1, 'T2': T2}
+    del ns
 
     if baseline:
         # perform baseline correction:
-        print('=' * 40)
-        print('**now performing baseline correction**')
-        print('=' * 40)
-
-        CT = np.max(np.array([1, t[-1] / 20]))  # time to correct
-        vel, despl, ccs, cvel, cdespl = basecorr(t, sc, CT)
-        kka = 1
-        flbc = True
-
-        while any(np.isnan(ccs)):
-            kka = kka + 1
-            CTn = kka * CT
-            if CTn >= np.median(t):
-                print('=' * 40)
-                print('**baseline correction failed**')
-                print('=' * 40)
-                flbc = False
-                ccs = sc
-                cvel = vel
-                cdespl = despl
-                break
-            vel, despl, ccs, cvel, cdespl = basecorr(t, sc, CTn)
-        if flbc:
-            print('=' * 40)
-            print('**baseline correction was succesful**')
-            print('=' * 40)
+        monitor.start('baseline')
+        ccs, cvel, cdespl, flbc = _baselinecorrect(sc, t, baseline_search)
+        monitor.end('baseline', succeeded=[flbc])
 
-        PSAccs, _, _, _, _ = ResponseSpectrum(T, ccs, zi, dt)
+        monitor.start('final_spectra')
+        PSAccs = ResponseSpectrum(T, ccs, zi, dt, outputs='PSA')
 
         difin = np.abs(PSAccs[Tlocs] - ds[Tlocs]) / ds[Tlocs]
         meanefin = np.mean(difin) * 100
         rmsefin = np.linalg.norm(difin) / np.sqrt(nTlocs) * 100
     else:
-        print('=' * 40)
-        print('**baseline correction was not performed**')
-        print('=' * 40)
+        monitor.skip('baseline')
         ccs = sc
         cvel = integrate.cumtrapz(ccs, t, initial=0)
         cdespl = integrate.cumtrapz(cvel, t, initial=0)
-        PSAccs = hPSAbc[:, brloc]
+        monitor.start('final_spectra')
+        if superposition and brloc > 0:  # only the matching range was updated
+            PSAccs = ResponseSpectrum(T, ccs, zi, dt, outputs='PSA')
+        else:
+            PSAccs = hPSAbc[:, brloc]
         meanefin = meane[brloc]
         rmsefin = rmse[brloc]
+    monitor.end('final_spectra', rmse=rmsefin, misfit=meanefin)
+    info['timings'] = dict(monitor.timings, total=time.perf_counter() - start)
+    info['iteration_times'] = np.array(monitor.iteration_times)
 
-    print('=' * 40)
-    print('RMSE : %.2f %%' % rmsefin)
-    print('AVG. MISFIT : %.2f %%' % meanefin)
-    print('=' * 40)
-
+    fig1 = fig2 = None
     if plots:
         import matplotlib.pyplot as plt
         from matplotlib.figure import Figure
@@ -566,9 +781,290 @@ def REQPY_single(s, fs, dso, To, T1=0, T2=0, zi=0.05, nit=30, NS=100, baseline=1
         ax1.set_ylabel('PSA [g]')
         fig2.tight_layout()
 
+    if full_output:
+        return ccs, rmsefin, meanefin, cvel, cdespl, PSAccs, PSAs, T, sf, fig1, fig2, info
     return ccs, rmsefin, meanefin, cvel, cdespl, PSAccs, PSAs, T, sf, fig1, fig2
 
 
+def REQPY_batch(records, fs, dso, To, nn=None, processes=None, verbose=False, **kwargs):
+    '''
+    REQPY_batch - Spectral matching of a suite of records to the same
+    target spectrum using a pool of processes
+    
+    Single components are matched with REQPY_single and pairs of 
+    horizontal components with REQPYrotdnn. The target is sorted once for
+    the whole suite and the records are dispatched grouped by geometry 
+    (number of points and sampling frequency), so each worker reuses its
+    cached spectral operators and filter banks (the filter banks cache
+    directory, the FFT backend, the padding defaults and the spectra
+    cache, see set_filterbank_cache, set_fft_backend, set_fd_padding and
+    set_spectra_cache, are shared with the workers).
+    A failure in one record does not stop the others.
+    
+    Input:
+        
+        Required:
+            
+        records: list with the seed records, each either a vector (single
+                 component) or a pair (s1, s2) / 2 x n array (horizontal
+                 components)
+        fs: sampling frequency (Hz), single value or one per record
+        dso: design/target spectrum (g)
+        To: vector with the periods at which the design spectrum is defined
+        
+        Optional:
+            
+        nn: percentile for RotDnn, required when pairs are given
+        processes: number of worker processes (default None, one per CPU;
+                   1 runs the suite in the calling process)
+        verbose: True/False, whether the progress messages of each record
+                 are printed (default False)
+        **kwargs: other arguments passed to REQPY_single / REQPYrotdnn
+                  (T1, T2, zi, nit, NS, baseline, ...); plots are not
+                  generated. With full_output=True the info of each 
+                  record includes the timings of its stages, to find
+                  slow records; a callback must be picklable when 
+                  processes > 1 and runs in the worker processes. A 
+                  history_file is written per record, with the index of
+                  the record appended to its name (e.g. hist.npy gives
+                  hist_0.npy, hist_1.npy, ...)
+        
+    Returns:
+        
+        results: list in the order of records with the outputs of
+                 REQPY_single / REQPYrotdnn (None for failed records)
+        errors: list in the order of records with None or the traceback
+                of the error raised by the record
+    '''
+    import os
+    import numpy as np
+
+    nrec = len(records)
+    fs = np.broadcast_to(np.asarray(fs, dtype=float), (nrec,))
+
+    To = np.asarray(To, dtype=float)
+    Tsortindex = np.argsort(To)
+    To = To[Tsortindex]
+    dso = np.asarray(dso, dtype=float)[Tsortindex]  # sorted once for the whole suite
+
+    kwargs['plots'] = 0
+    kwargs.pop('progress_bar_object', None)
+
+    tasks = []
+    for k, rec in enumerate(records):
+        pair = _is_pair(rec)
+        if pair and nn is None:
+            raise ValueError('nn (RotDnn percentile) is required to match pairs of components')
+        rec = (np.asarray(rec[0]), np.asarray(rec[1])) if pair else np.asarray(rec)
+        kw = kwargs
+        if kwargs.get('history_file') is not None:  # one file per record
+            stem, ext = os.path.splitext(kwargs['history_file'])
+            kw = dict(kwargs, history_file=f'{stem}_{k}{ext}')
+        tasks.append((k, rec, fs[k], dso, To, nn if pair else None, kw, verbose))
+    tasks.sort(key=lambda task: (np.shape(task[1])[-1], task[2]))  # group by geometry
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    results = [None] * nrec
+    errors = [None] * nrec
+    if processes == 1 or nrec <= 1:
+        outputs = map(_batch_worker, tasks)
+        for k, result, error in outputs:
+            results[k] = result
+            errors[k] = error
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, int(np.ceil(nrec / (4 * processes))))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_batch_init,
+                                 initargs=(_FILTERBANK_CACHE_DIR, get_fft_backend(), get_fd_padding(),
+                                           (_SPECTRA_CACHE['cachedir'], _SPECTRA_CACHE['maxbytes']))) as pool:
+            for k, result, error in pool.map(_batch_worker, tasks, chunksize=chunksize):
+                results[k] = result
+                errors[k] = error
+
+    return results, errors
+
+
+def _is_pair(rec):
+    '''
+    _is_pair - whether a record of REQPY_batch holds two horizontal
+    components
+    '''
+    import numpy as np
+
+    if isinstance(rec, (tuple, list)):
+        return len(rec) == 2 and np.ndim(rec[0]) == 1
+    return np.ndim(rec) == 2
+
+
+def _batch_init(cachedir, fft, padding, spectra):
+    '''
+    _batch_init - initializes the REQPY_batch worker processes
+    '''
+    set_filterbank_cache(cachedir=cachedir)
+    set_fft_backend(*fft)
+    set_fd_padding(*padding)
+    set_spectra_cache(*spectra)
+
+
+def _batch_worker(task):
+    '''
+    _batch_worker - matches one record of REQPY_batch, returns its index,
+    the outputs (or None) and the traceback of the error (or None)
+    '''
+    import traceback
+
+    k, rec, fs, dso, To, nn, kwargs, verbose = task
+    try:
+        if nn is None:
+            result = REQPY_single(rec, fs, dso, To, verbose=verbose, **kwargs)
+        else:
+            result = REQPYrotdnn(rec[0], rec[1], fs, dso, To, nn, verbose=verbose, **kwargs)
+    except Exception:
+        return k, None, traceback.format_exc()
+    return k, result, None
+
+
+class MatchCancelled(Exception):
+    '''
+    MatchCancelled - raised by a MatchMonitor subscriber to stop a 
+    matching procedure (e.g. a cancel button); it propagates out of
+    REQPY_single / REQPYrotdnn at the next event, between iterations
+    '''
+
+
+class MatchMonitor:
+    '''
+    MatchMonitor - reports the stages of the matching procedures
+    (REQPY_single, REQPYrotdnn) to subscribers and keeps their wall-clock
+    timings
+    
+    Each subscriber is called with a dictionary describing the event:
+        stage: 'cwt', 'details', 'seed_spectra', 'iteration', 'baseline'
+               or 'final_spectra'
+        event: 'start', 'end' or 'skip' (baseline correction not performed)
+        elapsed: duration of the stage (s, end events)
+        iteration, nit: iteration number and max number of iterations
+               (iteration events)
+        rmse, misfit: errors after the stage (%, iteration and
+               final_spectra end events)
+        stop_reason: why the iterations stopped early (end event of the
+               last iteration, only when a stopping criterion was met)
+        succeeded: whether the correction of each component succeeded
+               (list, baseline end event)
+    
+    A subscriber can stop the procedure by raising MatchCancelled.
+    
+    input:
+        callbacks: subscribers (None items are ignored), e.g. 
+                   print_progress or progress_bar(progressbar)
+    '''
+
+    def __init__(self, callbacks=()):
+        self.callbacks = [callback for callback in callbacks if callback is not None]
+        self.timings = {}  # accumulated time per stage (s)
+        self.iteration_times = []  # time of each iteration (s)
+        self._started = {}
+
+    def start(self, stage, **data):
+        import time
+
+        self._emit(stage, 'start', data)
+        self._started[stage] = time.perf_counter()
+
+    def end(self, stage, **data):
+        import time
+
+        elapsed = time.perf_counter() - self._started.pop(stage)
+        self.timings[stage] = self.timings.get(stage, 0.) + elapsed
+        if stage == 'iteration':
+            self.iteration_times.append(elapsed)
+        data['elapsed'] = elapsed
+        self._emit(stage, 'end', data)
+
+    def skip(self, stage, **data):
+        self._emit(stage, 'skip', data)
+
+    def _emit(self, stage, event, data):
+        if self.callbacks:
+            data = dict(data, stage=stage, event=event)
+            for callback in self.callbacks:
+                callback(data)
+
+
+def print_progress(event):
+    '''
+    print_progress - MatchMonitor subscriber printing the progress 
+    messages of the matching procedures to the console (verbose=True)
+    '''
+    stage, kind = event['stage'], event['event']
+    if stage == 'cwt' and kind == 'end':
+        print('=' * 40)
+        print('Wavelet decomposition performed')
+        print('=' * 40)
+    elif stage == 'details' and kind == 'end':
+        print('=' * 40)
+        print('Detail functions generated')
+        print('=' * 40)
+    elif stage == 'iteration' and kind == 'start':
+        print('Now performing iteration %i of %i' % (event['iteration'], event['nit']))
+    elif stage == 'iteration' and kind == 'end' and event.get('stop_reason') is not None:
+        print('Iterations stopped (%s)' % event['stop_reason'])
+    elif stage == 'baseline' and kind == 'start':
+        print('=' * 40)
+        print('**now performing baseline correction**')
+        print('=' * 40)
+    elif stage == 'baseline' and kind == 'end':
+        for succeeded in event['succeeded']:
+            print('=' * 40)
+            if succeeded:
+                print('**baseline correction was succesful**')
+            else:
+                print('**baseline correction failed**')
+            print('=' * 40)
+    elif stage == 'baseline' and kind == 'skip':
+        print('=' * 40)
+        print('**baseline correction was not performed**')
+        print('=' * 40)
+    elif stage == 'final_spectra' and kind == 'end':
+        print('=' * 40)
+        print('RMSE : %.2f %%' % event['rmse'])
+        print('AVG. MISFIT : %.2f %%' % event['misfit'])
+        print('=' * 40)
+
+
+def progress_bar(progress_bar_object):
+    '''
+    progress_bar - MatchMonitor subscriber setting the value (0-100) of a
+    progress bar (any object with a setValue method, e.g. a Qt 
+    QProgressBar) after each iteration
+    '''
+    def update(event):
+        if event['stage'] == 'iteration' and event['event'] == 'end':
+            progress_bar_object.setValue(int(event['iteration'] / event['nit'] * 100))
+
+    return update
+
+
+def _iteration_history(shape, keep_history, history_file):
+    '''
+    _iteration_history - storage for the records of all the iterations of
+    the matching procedures: memory-mapped .npy file (history_file), 
+    array in memory (keep_history) or None (only the best iterate is kept)
+    '''
+    import numpy as np
+
+    shape = tuple(int(k) for k in shape)
+    if history_file is not None:
+        from numpy.lib.format import open_memmap
+        return open_memmap(history_file, mode='w+', dtype=float, shape=shape)
+    if keep_history:
+        return np.zeros(shape)
+    return None
+
+
 def zumontw(t, omega, zeta):
     '''
     zumontw - Generates the Suarez-Montejo Wavelet function
@@ -593,17 +1089,19 @@ def zumontw(t, omega, zeta):
 def cwtzm(s, fs, scales, omega, zeta):
     '''
     cwtzm - Continuous Wavelet Transform using the Suarez-Montejo wavelet
-    via convolution in the frequency domain
+    via convolution in the frequency domain (see WaveletFilterBank)
 
     input:
-        s        : input signal (vector)
+        s        : input signal (vector), or 2D array with one signal 
+                   per row (e.g. two horizontal components)
         fs       : sampling frequency
         scales   : scales at which cwt would be performed 
         omega    : wavelet parameter
         zeta     : wavelet parameter
 
     output:
-        coefs    : wavelet coefficients
+        coefs    : wavelet coefficients (scales x samples, with a leading
+                   dimension per signal for 2D input)
 
     References:
         
@@ -617,59 +1115,354 @@ def cwtzm(s, fs, scales, omega, zeta):
 
     '''
     import numpy as np
-    from scipy import signal
-
-    nf = np.size(scales)
-    dt = 1 / fs
-    n = np.size(s)
-    t = np.linspace(0, (n - 1) * dt, n)
-    centertime = np.median(t)
-
-    coefs = np.zeros((nf, n))
-    for k in range(nf):
-        wv = zumontw((t - centertime) / scales[k], omega, zeta) / np.sqrt(scales[k])
-        coefs[k, :] = signal.fftconvolve(s, wv, mode='same')
 
-    return coefs
+    bank = wavelet_filterbank(np.shape(s)[-1], fs, scales, omega, zeta)
+    return bank.cwt(s)
 
 
 def getdetails(t, s, C, scales, omega, zeta):
     '''
-    getdetails - Generates the detail functions
+    getdetails - Generates the detail functions (see WaveletFilterBank)
     
     input:
         t: time vector [s]
-        s:  signal being analyzed
+        s:  signal being analyzed (vector, or 2D array with one signal
+            per row)
         C:  matrix with the coeff. from the CWT
         scales: vector with the scales at which the CWT was performed
         omega, zeta: wavelet parameters
         
     returns:
-        D: 2D array with the detail functions
+        D: 2D array with the detail functions (3D for 2D input)
         sr: reconstructed signal        
     '''
     import numpy as np
-    from scipy import signal
 
-    NS = np.size(scales)
-    n = np.size(s)
-    D = np.zeros((NS, n))
+    bank = wavelet_filterbank(np.size(t), 1 / (t[1] - t[0]), scales, omega, zeta)
+    return bank.details(C, s)
+
+
+def cwtdetails(s, fs, scales, omega, zeta, fused=False):
+    '''
+    cwtdetails - Wavelet coefficients, detail functions and reconstructed
+    signal in a single pass of the filter bank (see WaveletFilterBank)
+    
+    input:
+        s: input signal (vector), or 2D array with one signal per row
+        fs: sampling frequency
+        scales: scales at which cwt would be performed
+        omega, zeta: wavelet parameters
+        fused: True/False, whether the analysis and synthesis 
+               convolutions are fused in a single filter per scale (one
+               inverse transform for coefficients and details; the
+               details then keep the tails of the coefficients that the
+               two-step procedure crops, so they differ slightly near
+               the record ends). Default False
+    
+    returns:
+        C: wavelet coefficients
+        D: detail functions
+        sr: reconstructed signal
+    '''
+    import numpy as np
+
+    bank = wavelet_filterbank(np.shape(s)[-1], fs, scales, omega, zeta)
+    if fused:
+        return bank.decompose(s)
+    C = bank.cwt(s)
+    D, sr = bank.details(C, s)
+    return C, D, sr
+
+
+class WaveletFilterBank:
+    '''
+    WaveletFilterBank - Suarez-Montejo wavelets at a set of scales,
+    sampled on a record geometry and kept in the frequency domain
+    
+    Reproduces the convolutions (mode 'same') of the time domain 
+    implementation: the wavelet at each scale is sampled over the record
+    duration centered at its median time, and all the scales are
+    transformed together with real-input FFTs of length nfft >= 2n - 1
+    (3n - 2 for the fused decomposition). The signal is transformed once
+    and the coefficients (or details) for all the scales are obtained in
+    batched inverse transforms, processing the scales in blocks bounded
+    by RS_BLOCK_BYTES. The wavelet spectra are kept when below 
+    OPERATOR_KERNEL_BYTES. Use wavelet_filterbank to get the (cached)
+    instance for a geometry.
+    
+    attributes:
+        n, fs, scales, omega, zeta: geometry of the filter bank
+        nfft: transform length
+        W: spectra of the analysis wavelets, zumontw(t/scale)/sqrt(scale)
+           (scales x nfft // 2 + 1) or None
+    '''
+
+    def __init__(self, n, fs, scales, omega, zeta, nfft=None, W=None):
+        import numpy as np
+        from scipy.fft import next_fast_len
+
+        self.n = int(n)
+        self.fs = float(fs)
+        self.scales = np.array(scales, dtype=float).reshape(-1)
+        self.omega = float(omega)
+        self.zeta = float(zeta)
+        self.scales.setflags(write=False)
+
+        if nfft is None:
+            nfft = next_fast_len(2 * self.n - 1, real=True)
+        self.nfft = int(nfft)
+        self.W = W
+        if W is None and np.size(self.scales) * (self.nfft // 2 + 1) * 16 <= OPERATOR_KERNEL_BYTES:
+            self.W = self._spectra(slice(None))
+            self.W.setflags(write=False)
+
+    @property
+    def nbytes(self):
+        return 0 if self.W is None else self.W.nbytes
+
+    def _spectra(self, blk):
+        '''
+        spectra of the analysis wavelets for the scales in blk
+        '''
+        import numpy as np
+
+        dt = 1 / self.fs
+        t = np.linspace(0, (self.n - 1) * dt, self.n)
+        centertime = np.median(t)
+        sc = self.scales[blk, None]
+        wv = zumontw((t - centertime) / sc, self.omega, self.zeta) / np.sqrt(sc)
+        return _rfft(wv, self.nfft)
+
+    def _blocks(self, nrec, nout):
+        import numpy as np
+
+        nbytes = nrec * self.nfft * (16 + 8 * nout)
+        return _period_blocks(np.size(self.scales), nbytes, RS_BLOCK_BYTES)
+
+    def _check(self, s):
+        import numpy as np
+
+        s = np.asarray(s, dtype=float)
+        if s.shape[-1] != self.n:
+            raise ValueError('signal length %i does not match the filter bank (%i)'
+                             % (s.shape[-1], self.n))
+        return s
+
+    def cwt(self, s):
+        '''
+        wavelet coefficients of s (..., samples) -> (..., scales, samples)
+        '''
+        import numpy as np
+
+        s = self._check(s)
+        n = self.n
+        a = (n - 1) // 2  # start of the central part ('same') of the full convolution
+        S = _rfft(s, self.nfft)[..., None, :]
+
+        C = np.empty(s.shape[:-1] + (np.size(self.scales), n))
+        nrec = int(np.prod(s.shape[:-1]))
+        for blk in self._blocks(nrec, 1):
+            W = self._spectra(blk) if self.W is None else self.W[blk]
+            C[..., blk, :] = _irfft(S * W, self.nfft)[..., a:a + n]
+        return C
+
+    def details(self, C, s):
+        '''
+        detail functions from the coefficients C (..., scales, samples), 
+        normalized so the reconstructed signal has the peak of s
+        returns D (same shape as C) and sr (..., samples)
+        '''
+        import numpy as np
+
+        s = self._check(s)
+        C = np.asarray(C, dtype=float)
+        n = self.n
+        a = (n - 1) // 2
+
+        D = np.empty(C.shape)
+        nrec = int(np.prod(C.shape[:-2]))
+        for blk in self._blocks(nrec, 2):
+            W = self._spectra(blk) if self.W is None else self.W[blk]
+            sc = self.scales[blk, None]
+            # synthesis wavelet is zumontw(t/scale) = sqrt(scale) * analysis wavelet
+            D[..., blk, :] = -_irfft(_rfft(C[..., blk, :], self.nfft) * W, self.nfft)[..., a:a + n] / sc ** 2
+
+        return self._normalize(D, s)
+
+    def decompose(self, s):
+        '''
+        coefficients and details of s with the analysis and synthesis
+        convolutions fused in a single filter per scale (see cwtdetails)
+        returns C, D and sr
+        '''
+        import numpy as np
+
+        s = self._check(s)
+        n = self.n
+        a = (n - 1) // 2
+        nfft = self.nfft
+        if nfft < 3 * n - 2:
+            from scipy.fft import next_fast_len
+            nfft = next_fast_len(3 * n - 2, real=True)
+        S = _rfft(s, nfft)[..., None, None, :]
+
+        C = np.empty(s.shape[:-1] + (np.size(self.scales), n))
+        D = np.empty(C.shape)
+        nrec = int(np.prod(s.shape[:-1]))
+        for blk in _period_blocks(np.size(self.scales), nrec * nfft * 48, RS_BLOCK_BYTES):
+            sc = self.scales[blk, None]
+            if nfft == self.nfft and self.W is not None:
+                W = self.W[blk]
+            else:
+                dt = 1 / self.fs
+                t = np.linspace(0, (n - 1) * dt, n)
+                W = _rfft(zumontw((t - np.median(t)) / sc, self.omega, self.zeta) / np.sqrt(sc), nfft)
+            W = np.stack((W, -W ** 2 * np.sqrt(sc) / sc ** (5 / 2)))  # analysis and fused filters
+            CD = _irfft(S * W, nfft)  # one batched inverse transform
+            C[..., blk, :] = CD[..., 0, :, a:a + n]
+            D[..., blk, :] = CD[..., 1, :, 2 * a:2 * a + n]
+
+        D, sr = self._normalize(D, s)
+        return C, D, sr
+
+    def _normalize(self, D, s):
+        import numpy as np
+
+        sr = np.trapz(D, self.scales, axis=-2)  # signal reconstructed from the details
+        ff = np.max(np.abs(s), axis=-1) / np.max(np.abs(sr), axis=-1)
+        ff = np.asarray(ff)[..., None]
+        sr = ff * sr
+        D = ff[..., None] * D
+
+        return D, sr
+
+
+def wavelet_filterbank(n, fs, scales, omega, zeta):
+    '''
+    wavelet_filterbank - returns the WaveletFilterBank for a record 
+    geometry, reusing a previously built one when available
+    
+    The filter banks are kept in memory (LRU, bounded by 
+    FILTERBANK_CACHE_SIZE entries and FILTERBANK_CACHE_BYTES) and, when a
+    cache directory is set (see set_filterbank_cache), the wavelet 
+    spectra are also stored there as .npy files and loaded memory-mapped,
+    so later runs (or other processes) with the same geometry skip the
+    filter construction. The scales are fully defined by NS, FF1 and FF2,
+    so the key (n, fs, scales, omega, zeta) covers them.
+    
+    input:
+        n: number of points in the record
+        fs: sampling frequency
+        scales: scales of the filter bank
+        omega, zeta: wavelet parameters
+    
+    returns:
+        bank: WaveletFilterBank
+    '''
+    import numpy as np
+
+    scales = np.asarray(scales, dtype=float).reshape(-1)
+    key = (int(n), float(fs), scales.tobytes(), float(omega), float(zeta))
+    bank = _FILTERBANK_CACHE.get(key)
+    if bank is not None:
+        return bank
+
+    cachedir = _FILTERBANK_CACHE_DIR
+    bank = None
+    if cachedir is not None:
+        bank = _load_filterbank(cachedir, key, n, fs, scales, omega, zeta)
+    if bank is None:
+        bank = WaveletFilterBank(n, fs, scales, omega, zeta)
+        if cachedir is not None and bank.W is not None:
+            _save_filterbank(cachedir, key, bank)
+    _FILTERBANK_CACHE.put(key, bank, bank.nbytes)
+    return bank
+
+
+def set_filterbank_cache(maxbytes=_KEEP, cachedir=_KEEP):
+    '''
+    set_filterbank_cache - configures the wavelet filter banks cache, the
+    arguments not given keep their current value
+    
+    input:
+        maxbytes: memory budget for the filter banks kept in memory
+                  (initially FILTERBANK_CACHE_BYTES)
+        cachedir: directory where the filter banks are persisted as .npy
+                  files (None, the initial value, for not persisted)
+    '''
+    global _FILTERBANK_CACHE_DIR
+
+    if maxbytes is not _KEEP and maxbytes is not None:
+        _FILTERBANK_CACHE.maxbytes = maxbytes
+    if cachedir is not _KEEP:
+        _FILTERBANK_CACHE_DIR = cachedir
+
+
+def filterbank_cache_info():
+    '''
+    filterbank_cache_info - statistics of the filter banks cache
+    
+    returns:
+        dictionary with hits, misses, entries, nbytes and cachedir
+    '''
+    info = _FILTERBANK_CACHE.info()
+    info['cachedir'] = _FILTERBANK_CACHE_DIR
+    return info
+
+
+def clear_filterbank_cache():
+    '''
+    clear_filterbank_cache - removes the filter banks kept in memory (the
+    files in the cache directory are not deleted)
+    '''
+    _FILTERBANK_CACHE.clear()
+
 
-    centertime = np.median(t)
+def _filterbank_path(cachedir, key):
+    import hashlib
+    import os
 
-    for k in range(NS):
-        wv = zumontw((t - centertime) / scales[k], omega, zeta)
-        D[k, :] = -signal.fftconvolve(C[k, :], wv, mode='same') / (scales[k] ** (5 / 2))
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(cachedir, 'wfb_%s.npy' % digest)
 
-    sr = np.trapz(D.T, scales)  # signal reconstructed from the details
-    ff = np.max(np.abs(s)) / np.max(np.abs(sr))
-    sr = ff * sr
-    D = ff * D
 
-    return D, sr
+def _load_filterbank(cachedir, key, n, fs, scales, omega, zeta):
+    import os
+    import numpy as np
+
+    path = _filterbank_path(cachedir, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        W = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    from scipy.fft import next_fast_len
+
+    nfft = next_fast_len(2 * int(n) - 1, real=True)  # may be odd, not recoverable from W
+    if W.ndim != 2 or W.shape != (np.size(scales), nfft // 2 + 1):
+        return None
+    return WaveletFilterBank(n, fs, scales, omega, zeta, nfft=nfft, W=W)
+
 
+def _save_filterbank(cachedir, key, bank):
+    import os
+    import tempfile
+    import numpy as np
+
+    os.makedirs(cachedir, exist_ok=True)
+    path = _filterbank_path(cachedir, key)
+    fd, tmp = tempfile.mkstemp(dir=cachedir, suffix='.npy.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.save(fp, bank.W)
+        os.replace(tmp, path)  # atomic, other processes never see partial files
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
-def CheckPeriodRange(T1, T2, To, FF1, FF2):
+
+def CheckPeriodRange(T1, T2, To, FF1, FF2, verbose=True):
     '''
     CheckPeriodRange - Verifies that the specified matching period 
     range  is doable 
@@ -679,6 +1472,7 @@ def CheckPeriodRange(T1, T2, To, FF1, FF2):
         T1, T2: define period range for matching 
                 (defautl T1=T2=0 matches the whole spectrum)
         FF1, FF2: defines frequency range for CWT decomposition
+        verbose: True/False, whether the warnings are printed (default True)
         
     returns:
         updated values of T1,T2,FF1 if required
@@ -690,27 +1484,30 @@ def CheckPeriodRange(T1, T2, To, FF1, FF2):
 
     if T1 < To[0]:
         T1 = To[0]
-        print('=' * 40)
-        print('warning: initial period for matching')
-        print('fails outside the target spectrum')
-        print('redefined to %.2f' % T1)
-        print('=' * 40)
+        if verbose:
+            print('=' * 40)
+            print('warning: initial period for matching')
+            print('fails outside the target spectrum')
+            print('redefined to %.2f' % T1)
+            print('=' * 40)
 
     if T2 > To[-1]:
         T2 = To[-1]
-        print('=' * 40)
-        print('warning: final period for matching')
-        print('fails outside the target spectrum')
-        print('redefined to %.2f s' % T2)
-        print('=' * 40)
+        if verbose:
+            print('=' * 40)
+            print('warning: final period for matching')
+            print('fails outside the target spectrum')
+            print('redefined to %.2f s' % T2)
+            print('=' * 40)
 
     if T1 < (1 / FF2):
         T1 = 1 / FF2
-        print('=' * 40)
-        print('warning: because of sampling frequency')
-        print('limitations in the seed record')
-        print('the target spectra can only be matched from %.2f s' % T1)
-        print('=' * 40)
+        if verbose:
+            print('=' * 40)
+            print('warning: because of sampling frequency')
+            print('limitations in the seed record')
+            print('the target spectra can only be matched from %.2f s' % T1)
+            print('=' * 40)
 
     if T2 > (1 / FF1):
         FF1 = 1 / T2  # redefine FF1 to match the whole spectrum
@@ -718,7 +1515,54 @@ def CheckPeriodRange(T1, T2, To, FF1, FF2):
     return T1, T2, FF1
 
 
-def ResponseSpectrum(T, s, z, dt):
+def CheckConvergence(rmse, meane, rmse_tol=None, misfit_tol=None, rtol=None, patience=None):
+    '''
+    CheckConvergence - Verifies the stopping criteria of the matching
+    iterations
+    
+    input:
+        rmse, meane: RMSE and average misfit (%) of the iterations so far
+                     (the first value corresponds to the scaled seed)
+        rmse_tol, misfit_tol: absolute tolerances, the iterations have 
+                     converged once all the given ones are met
+        rtol: relative RMSE reduction, with respect to the best previous
+              iteration, that counts as an improvement (default any
+              reduction)
+        patience: number of iterations without improvement after which
+                  the iterations are stopped (default 1 if rtol is given)
+    
+    returns:
+        None if the iterations should continue, otherwise the reason:
+        'converged', 'diverged' (RMSE grew in each of the last patience
+        iterations) or 'stagnated'
+    '''
+    import numpy as np
+
+    m = np.size(rmse) - 1
+    if rmse_tol is not None or misfit_tol is not None:
+        if ((rmse_tol is None or rmse[m] <= rmse_tol) and
+                (misfit_tol is None or meane[m] <= misfit_tol)):
+            return 'converged'
+
+    if patience is None and rtol is None:
+        return None
+    if patience is None:
+        patience = 1
+    if rtol is None:
+        rtol = 0
+
+    last = 0  # last iteration that improved the best RMSE
+    for j in range(1, m + 1):
+        if rmse[j] < np.min(rmse[:j]) * (1 - rtol):
+            last = j
+    if m - last >= patience:
+        if np.all(np.diff(rmse[m - patience:m + 1]) > 0):
+            return 'diverged'
+        return 'stagnated'
+    return None
+
+
+def ResponseSpectrum(T, s, z, dt, outputs=None, cache=False):
     '''
     ResponseSpectrum - decides what approach to use to estimate the 
     response spectrum based on damping value 
@@ -729,159 +1573,914 @@ def ResponseSpectrum(T, s, z, dt):
         s: acceleration time series
         zi: damping ratio
         dt: time steps for s
+        outputs: quantities to compute (see SPECTRA_OUTPUTS), either a
+                 single name (e.g. 'PSA') or a sequence of names; only
+                 the responses needed for them are evaluated
+                 (default None computes all of them)
+        cache: True/False, whether the spectra are taken from (or stored
+               in) the spectra disk cache when it is enabled, see
+               set_spectra_cache (default False)
     
     Returns:
-        PSA, PSV, SA, SV, SD
+        PSA, PSV, SA, SV, SD (default), the requested quantities in the
+        given order (sequence) or a single vector (single name)
         
     '''
 
+    if cache and _SPECTRA_CACHE['cachedir'] is not None:
+        names, single = _spectra_outputs(outputs)
+        spectra = _cached_spectra(('ResponseSpectrum', names, z, dt, _fd_key(z)), (T, s),
+                                  lambda: ResponseSpectrum(T, s, z, dt, names))
+        return spectra[0] if single else spectra
+
     if z >= 0.04:
-        PSA, PSV, SA, SV, SD = RSFD(T, s, z, dt)
+        return RSFD(T, s, z, dt, outputs)
     else:
-        PSA, PSV, SA, SV, SD = RSPW(T, s, z, dt)
+        return RSPW(T, s, z, dt, outputs)
+
+
+def _spectra_outputs(outputs):
+    '''
+    _spectra_outputs - validates the outputs requested from the response
+    spectra functions, returns the tuple of names and whether a single
+    vector (instead of a tuple) has to be returned
+    '''
+    if outputs is None:
+        return SPECTRA_OUTPUTS, False
+    single = isinstance(outputs, str)
+    names = (outputs,) if single else tuple(outputs)
+    for name in names:
+        if name not in SPECTRA_OUTPUTS:
+            raise ValueError('unknown spectral quantity %r, expected one of %s'
+                             % (name, ', '.join(SPECTRA_OUTPUTS)))
+    return names, single
+
+
+def _spectra_kinds(names):
+    '''
+    _spectra_kinds - time histories ('d', 'v', 'a') required to obtain
+    the requested spectral quantities
+    '''
+    kinds = []
+    if {'PSA', 'PSV', 'SD'} & set(names):
+        kinds.append('d')
+    if 'SV' in names:
+        kinds.append('v')
+    if 'SA' in names:
+        kinds.append('a')
+    return tuple(kinds)
 
-    return PSA, PSV, SA, SV, SD
+
+def _spectra_pack(spectra, names, single):
+    '''
+    _spectra_pack - arranges the computed spectra (dictionary) as
+    requested by the caller
+    '''
+    if single:
+        return spectra[names[0]]
+    return tuple(spectra[name] for name in names)
 
 
-def RSPW(T, s, zi, dt):
-    '''      
-    Response spectra using piecewise
+def set_spectra_cache(cachedir=_KEEP, maxbytes=_KEEP):
+    '''
+    set_spectra_cache - enables the disk cache of response spectra
     
-    Input:
-        T: vector with periods (s)
-        s: acceleration time series
-        zi: damping ratio
-        dt: time steps for s
+    The spectra requested with cache=True (ResponseSpectrum, 
+    ResponseSpectrumTheta, ResponseSpectrumRotDnn, and the spectra of
+    the seed records in the matching procedures) are stored as .npy
+    files named after a hash of the signals, periods, angles, damping,
+    time step and padding, so matching the same seeds to other targets
+    skips them. The least recently used files are removed when the 
+    total size exceeds maxbytes.
     
-    Returns:
-        PSA, PSV, SA, SV, SD
+    The arguments not given keep their current value.
     
+    input:
+        cachedir: directory of the cache (None, the initial value, 
+                  disables it)
+        maxbytes: disk budget (initially SPECTRA_CACHE_BYTES)
     '''
-    import numpy as np
+    if cachedir is not _KEEP:
+        _SPECTRA_CACHE['cachedir'] = cachedir
+    if maxbytes is not _KEEP and maxbytes is not None:
+        _SPECTRA_CACHE['maxbytes'] = maxbytes
 
-    pi = np.pi
 
-    nper = np.size(T)  # number of natural periods
-    n = np.size(s)  # length of record
+def spectra_cache_info():
+    '''
+    spectra_cache_info - statistics of the spectra disk cache
+    
+    returns:
+        dictionary with hits, misses, entries, nbytes, maxbytes and cachedir
+    '''
+    files = _spectra_files(_SPECTRA_CACHE['cachedir'])
+    return {'hits': _SPECTRA_CACHE['hits'], 'misses': _SPECTRA_CACHE['misses'],
+            'entries': len(files), 'nbytes': sum(size for _, _, size in files),
+            'maxbytes': _SPECTRA_CACHE['maxbytes'], 'cachedir': _SPECTRA_CACHE['cachedir']}
 
-    SD = np.zeros(nper)  # rel. displac. spectrum
-    SV = np.zeros(nper)  # rel. vel. spectrum
-    SA = np.zeros(nper)  # total acc. spectrum
 
-    for k in range(nper):
-        wn = 2 * pi / T[k]
-        wd = wn * (1 - zi ** 2) ** (1 / 2)
+def clear_spectra_cache():
+    '''
+    clear_spectra_cache - removes the files of the spectra disk cache
+    '''
+    import os
 
-        u = np.zeros((2, n))  # matrix with velocities and displacements
+    for path, _, _ in _spectra_files(_SPECTRA_CACHE['cachedir']):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _SPECTRA_CACHE['hits'] = 0
+    _SPECTRA_CACHE['misses'] = 0
 
-        ex = np.exp(-zi * wn * dt)
-        cwd = np.cos(wd * dt)
-        swd = np.sin(wd * dt)
-        zisq = 1 / (np.sqrt(1 - (zi ** 2)))
 
-        a11 = ex * (cwd + zi * zisq * swd)
-        a12 = (ex / wd) * swd
-        a21 = -wn * zisq * ex * swd
-        a22 = ex * (cwd - zi * zisq * swd)
+def _fd_key(z):
+    '''
+    _fd_key - settings that change the spectra besides their arguments
+    (padding of the frequency domain method)
+    '''
+    return get_fd_padding() if z >= 0.04 else None
+
+
+def _cached_spectra(params, arrays, compute):
+    '''
+    _cached_spectra - returns compute() (sequence of arrays of the same
+    shape) from the spectra disk cache, computing and storing it when
+    missing; the key hashes params (repr) and the bytes of arrays
+    '''
+    import hashlib
+    import os
+    import tempfile
+    import numpy as np
 
-        b11 = ex * (((2 * zi ** 2 - 1) / ((wn ** 2) * dt) + zi / wn) * (1 / wd) * np.sin(wd * dt) +
-                    (2 * zi / ((wn ** 3) * dt) + 1 / (wn ** 2)) * np.cos(wd * dt)) - 2 * zi / ((wn ** 3) * dt)
-        b12 = -ex * (((2 * zi ** 2 - 1) / ((wn ** 2) * dt)) * (1 / wd) * np.sin(wd * dt) +
-                     (2 * zi / ((wn ** 3) * dt)) * np.cos(wd * dt)) - (1 / (wn ** 2)) + 2 * zi / ((wn ** 3) * dt)
-        b21 = -((a11 - 1) / ((wn ** 2) * dt)) - a12
-        b22 = -b21 - a12
+    cachedir = _SPECTRA_CACHE['cachedir']
+    h = hashlib.sha1(repr(params).encode())
+    for a in arrays:
+        a = np.ascontiguousarray(np.asarray(a, dtype=float))
+        h.update(repr(a.shape).encode())
+        h.update(a.tobytes())
+    path = os.path.join(cachedir, 'spc_%s.npy' % h.hexdigest())
+
+    try:
+        data = np.load(path)
+        os.utime(path)  # recently used
+        _SPECTRA_CACHE['hits'] += 1
+        return tuple(data)
+    except (OSError, ValueError):
+        pass
+
+    _SPECTRA_CACHE['misses'] += 1
+    spectra = tuple(compute())
+    os.makedirs(cachedir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cachedir, suffix='.npy.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.save(fp, np.stack(spectra))
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return spectra
+
+    files = sorted(_spectra_files(cachedir), key=lambda f: f[1])  # oldest first
+    total = sum(size for _, _, size in files)
+    for old, _, size in files[:-1]:
+        if total <= _SPECTRA_CACHE['maxbytes']:
+            break
+        try:
+            os.remove(old)
+            total -= size
+        except OSError:
+            pass
+    return spectra
+
+
+def _spectra_files(cachedir):
+    '''
+    _spectra_files - (path, mtime, size) of the files in the spectra cache
+    '''
+    import os
+
+    if cachedir is None or not os.path.isdir(cachedir):
+        return []
+    files = []
+    for name in os.listdir(cachedir):
+        if name.startswith('spc_') and name.endswith('.npy'):
+            path = os.path.join(cachedir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_mtime_ns, stat.st_size))
+    return files
+
+
+def RSPW(T, s, zi, dt, outputs=None):
+    '''      
+    Response spectra using piecewise
+    
+    The piecewise exact recurrence is evaluated as a linear filter
+    (see pwblocks), so the time stepping runs in compiled code.
+    
+    Input:
+        T: vector with periods (s)
+        s: acceleration time series
+        zi: damping ratio
+        dt: time steps for s
+        outputs: quantities to compute (default None, all of them),
+                 see ResponseSpectrum
+    
+    Returns:
+        PSA, PSV, SA, SV, SD (or the requested outputs)
+    
+    '''
+    import numpy as np
 
-        A = np.array([[a11, a12], [a21, a22]])
-        B = np.array([[b11, b12], [b21, b22]])
+    pi = np.pi
+    names, single = _spectra_outputs(outputs)
 
-        for q in range(n - 1):
-            u[:, q + 1] = np.dot(A, u[:, q]) + np.dot(B, np.array([s[q], s[q + 1]]))
+    T = np.asarray(T, dtype=float)
+    nper = np.size(T)  # number of natural periods
 
-        at = -2 * wn * zi * u[1, :] - (wn ** 2) * u[0, :]
+    SD = np.zeros(nper)  # rel. displac. spectrum
+    SV = np.zeros(nper)  # rel. vel. spectrum
+    SA = np.zeros(nper)  # total acc. spectrum
 
-        SD[k] = np.max(np.abs(u[0, :]))
-        SV[k] = np.max(np.abs(u[1, :]))
-        SA[k] = np.max(np.abs(at))
+    for blk, resp in pwblocks(T, s, zi, dt, kinds=_spectra_kinds(names)):
+        if 'd' in resp:
+            SD[blk] = np.max(np.abs(resp['d']), axis=-1)
+        if 'v' in resp:
+            SV[blk] = np.max(np.abs(resp['v']), axis=-1)
+        if 'a' in resp:
+            SA[blk] = np.max(np.abs(resp['a']), axis=-1)
 
     PSV = (2 * pi / T) * SD  # pseudo-vel. spectrum
     PSA = (2 * pi / T) ** 2 * SD  # pseudo-accel. spectrum
 
-    return PSA, PSV, SA, SV, SD
+    spectra = {'PSA': PSA, 'PSV': PSV, 'SA': SA, 'SV': SV, 'SD': SD}
+    return _spectra_pack(spectra, names, single)
 
 
-def RSFD(T, s, z, dt):
+def RSFD(T, s, z, dt, outputs=None, padding=None, quiet=None):
     '''   
     luis.montejo@upr.edu 
     
     Response spectra (operations in the frequency domain)
     
+    The transfer functions of all the periods are evaluated at once on the
+    half spectrum and taken back to the time domain with real-input FFTs,
+    processing the periods in blocks (see fdblocks) to bound memory use.
+    Only the inverse transforms needed for the requested outputs are
+    performed (PSA, PSV and SD only need the displacements).
+    
     Input:
         T: vector with periods (s)
         s: acceleration time series
         z: damping ratio
         dt: time steps for s
+        outputs: quantities to compute (default None, all of them),
+                 see ResponseSpectrum
+        padding, quiet: zero padding policy and quiet time (default None,
+                        the ones set with set_fd_padding), see fdlength
     
     Returns:
-        PSA, PSV, SA, SV, SD
+        PSA, PSV, SA, SV, SD (or the requested outputs)
     
     '''
     import numpy as np
-    from numpy.fft import fft, ifft
 
     pi = np.pi
+    names, single = _spectra_outputs(outputs)
 
-    npo = np.size(s)
+    T = np.asarray(T, dtype=float)
     nT = np.size(T)
     SD = np.zeros(nT)
     SV = np.zeros(nT)
     SA = np.zeros(nT)
 
-    n = int(2 ** np.ceil(np.log2(npo + 10 * np.max(T) / dt)))  # add zeros to provide enough quiet time
-    fs = 1 / dt;
-    s = np.append(s, np.zeros(n - npo))
+    for blk, resp in fdblocks(T, s, z, dt, kinds=_spectra_kinds(names), padding=padding, quiet=quiet):
+        if 'd' in resp:
+            SD[blk] = np.max(np.abs(resp['d']), axis=-1)
+        if 'v' in resp:
+            SV[blk] = np.max(np.abs(resp['v']), axis=-1)
+        if 'a' in resp:
+            SA[blk] = np.max(np.abs(resp['a']), axis=-1)
 
-    fres = fs / n  # frequency resolution
-    nfrs = int(np.ceil(n / 2))  # number of frequencies
-    freqs = fres * np.arange(0, nfrs + 1, 1)  # vector with frequencies
-    ww = 2 * pi * freqs  # vector with frequencies [rad/s]
-    ffts = fft(s);
+    PSV = (2 * pi / T) * SD
+    PSA = (2 * pi / T) ** 2 * SD
 
-    m = 1
-    for kk in range(nT):
-        w = 2 * pi / T[kk];
-        k = m * w ** 2;
-        c = 2 * z * m * w
+    spectra = {'PSA': PSA, 'PSV': PSV, 'SA': SA, 'SV': SV, 'SD': SD}
+    return _spectra_pack(spectra, names, single)
 
-        H1 = 1 / (-m * ww ** 2 + k + 1j * c * ww)  # Transfer function (half) - Receptance
-        H2 = 1j * ww / (-m * ww ** 2 + k + 1j * c * ww)  # Transfer function (half) - Mobility
-        H3 = -ww ** 2 / (-m * ww ** 2 + k + 1j * c * ww)  # Transfer function (half) - Accelerance
 
-        H1 = np.append(H1, np.conj(H1[n // 2 - 1:0:-1]))
-        H1[n // 2] = np.real(H1[n // 2])  # Transfer function (complete) - Receptance
+def fdblocks(T, s, z, dt, kinds=('d',), maxbytes=None, padding=None, quiet=None):
+    '''
+    fdblocks - Batched frequency domain response of SDOF oscillators,
+    yields the response time histories for blocks of periods
+    
+    The record is zero padded to provide enough quiet time, transformed
+    once with a real-input FFT and multiplied by the transfer functions
+    (receptance, mobility, accelerance) of a block of periods on the half
+    spectrum; a single inverse real FFT per quantity brings the whole
+    block back to the time domain. The transfer functions are taken from
+    the cached SpectralOperator for the record geometry.
+    
+    Input:
+        T: vector with periods (s)
+        s: acceleration time series (vector), or 2D array with one
+           series per row (e.g. two horizontal components)
+        z: damping ratio
+        dt: time steps for s
+        kinds: responses to compute, any of 'd' (rel. displacement),
+               'v' (rel. velocity) and 'a' (total acceleration)
+        maxbytes: memory budget for the block work arrays
+                  (default RS_BLOCK_BYTES)
+        padding, quiet: zero padding policy and quiet time (default None,
+                        the ones set with set_fd_padding), see fdlength
+    
+    Yields:
+        blk: slice with the period indices of the block
+        resp: dictionary with the requested responses, each an array of
+              shape (..., periods in block, padded length)
+    '''
+    import numpy as np
 
-        H2 = np.append(H2, np.conj(H2[n // 2 - 1:0:-1]))
-        H2[n // 2] = np.real(H2[n // 2])  # Transfer function (complete) - Mobility
+    op = spectral_operator(np.shape(s)[-1], dt, T, z, method='fd', padding=padding, quiet=quiet)
+    return op.blocks(s, kinds, maxbytes)
 
-        H3 = np.append(H3, np.conj(H3[n // 2 - 1:0:-1]))
-        H3[n // 2] = np.real(H3[n // 2])  # Transfer function (complete) - Accelerance
 
-        CoF1 = H1 * ffts  # frequency domain convolution
-        d = ifft(CoF1)  # go back to the time domain (displacement)
-        SD[kk] = np.max(np.abs(d))
+def pwblocks(T, s, z, dt, kinds=('d',)):
+    '''
+    pwblocks - Piecewise exact response of SDOF oscillators evaluated as
+    linear recursive filters, yields the response time histories period
+    by period
+    
+    The recurrence u[q+1] = A u[q] + B [s[q], s[q+1]] (state u with the
+    displacement and velocity, input linearly interpolated between
+    samples) is rewritten as the equivalent second order filter
+    (numerator from adj(zI - A) B, denominator det(zI - A)) and run with
+    scipy.signal.lfilter over all the records at once. Initial
+    conditions reproduce u[0] = 0. The filter coefficients are taken 
+    from the cached SpectralOperator for the record geometry.
+    
+    Input:
+        T: vector with periods (s)
+        s: acceleration time series (vector), or 2D array with one
+           series per row (e.g. two horizontal components)
+        z: damping ratio
+        dt: time steps for s
+        kinds: responses to compute, any of 'd' (rel. displacement),
+               'v' (rel. velocity) and 'a' (total acceleration)
+    
+    Yields:
+        blk: slice with the index of the period
+        resp: dictionary with the requested responses, each an array of
+              shape (..., 1, record length)
+    '''
+    import numpy as np
 
-        CoF2 = H2 * ffts  # frequency domain convolution
-        v = ifft(CoF2)  # go back to the time domain (velocity)
-        SV[kk] = np.max(np.abs(v))
+    op = spectral_operator(np.shape(s)[-1], dt, T, z, method='pw')
+    return op.blocks(s, kinds)
 
-        CoF3 = H3 * ffts  # frequency domain convolution
-        a = ifft(CoF3)  # go back to the time domain (acceleration)
-        a = a - s
-        SA[kk] = np.max(np.abs(a))
 
-    PSV = (2 * pi / T) * SD
-    PSA = (2 * pi / T) ** 2 * SD
+class SpectralOperator:
+    '''
+    SpectralOperator - SDOF kernels precomputed for a record geometry
+    (record length n, time step dt, periods T, damping z; nfft optionally
+    fixes the padded length of the frequency domain method, otherwise it
+    is chosen by fdlength with the given padding policy and quiet time)
+    
+    method 'fd' keeps the padded FFT length, the frequency vector and the
+    receptance of every period on the half spectrum (the matrix is only
+    stored while below OPERATOR_KERNEL_BYTES, otherwise it is rebuilt per
+    block); method 'pw' keeps the coefficients of the piecewise exact 
+    filters. Use spectral_operator to get the (cached) instance for a
+    geometry, so repeated spectra of records with the same geometry
+    (e.g. the iterations of the matching procedures) reuse the kernels.
+    
+    attributes:
+        n, dt, T, z, method: geometry of the operator
+        nfft: padded transform length ('fd', see fdlength)
+        ww: frequencies of the half spectrum [rad/s] ('fd')
+        H1: receptances (periods x frequencies) or None ('fd')
+        nbytes: memory held by the kernels
+    '''
+
+    def __init__(self, n, dt, T, z, method='fd', nfft=None, padding=None, quiet=None):
+        import numpy as np
+
+        pi = np.pi
+
+        self.n = int(n)
+        self.dt = float(dt)
+        self.T = np.array(T, dtype=float).reshape(-1)
+        self.z = float(z)
+        self.method = method
+        self.T.setflags(write=False)
+
+        if method == 'fd':
+            if nfft is None:
+                nfft = fdlength(self.n, self.dt, self.T, padding, quiet)  # add zeros to provide enough quiet time
+            self.nfft = int(nfft)
+            self.ww = 2 * pi * np.fft.rfftfreq(self.nfft, self.dt)  # vector with frequencies [rad/s] (half spectrum)
+            self.H1 = None
+            if np.size(self.T) * np.size(self.ww) * 16 <= OPERATOR_KERNEL_BYTES:
+                self.H1 = self._receptance(slice(None))
+        elif method == 'pw':
+            a11, a12, a21, a22, b11, b12, b21, b22 = pwcoefs(self.T, self.z, self.dt)
+            self.wn = 2 * pi / self.T
+            self.den = np.column_stack((np.ones_like(a11), -(a11 + a22), a11 * a22 - a12 * a21))  # det(zI - A)
+            self.numd = np.column_stack((b12, b11 - a22 * b12 + a12 * b22, a12 * b21 - a22 * b11))
+            self.numv = np.column_stack((b22, a21 * b12 + b21 - a11 * b22, a21 * b11 - a11 * b21))
+            self.c = np.column_stack((b11, b12, b21, b22))  # first step from u[0] = 0
+        else:
+            raise ValueError("method must be 'fd' or 'pw'")
+
+    @property
+    def nbytes(self):
+        if self.method == 'fd':
+            return self.ww.nbytes + (0 if self.H1 is None else self.H1.nbytes)
+        return self.den.nbytes + self.numd.nbytes + self.numv.nbytes + self.c.nbytes
+
+    def _receptance(self, blk):
+        '''
+        receptance (m = 1) of the periods in blk on the half spectrum
+        '''
+        import numpy as np
+
+        w = 2 * np.pi / self.T[blk, None]
+        return 1 / (w ** 2 - self.ww ** 2 + 2j * self.z * w * self.ww)
+
+    def blocks(self, s, kinds=('d',), maxbytes=None, periods=None, ffts=None):
+        '''
+        yields (blk, resp) with the responses of s for blocks of periods,
+        see fdblocks and pwblocks; periods (slice) restricts the output to
+        a contiguous range of the operator periods (blk keeps indexing
+        the full period vector); ffts are the spectra of s over the
+        padded length (see spectra), computed here when None
+        '''
+        import numpy as np
+
+        s = np.asarray(s, dtype=float)
+        if s.shape[-1] != self.n:
+            raise ValueError('record length %i does not match the operator (%i)'
+                             % (s.shape[-1], self.n))
+        if periods is None:
+            periods = slice(None)
+        start, stop, _ = periods.indices(self.T.size)
+        if self.method == 'fd':
+            return self._fdblocks(s, kinds, maxbytes, start, stop, ffts)
+        return self._pwblocks(s, kinds, start, stop)
+
+    def spectra(self, s):
+        '''
+        real-input FFTs of s over the padded length, to share between
+        calls of blocks for the same record (frequency domain only)
+        '''
+        return _rfft(s, self.nfft)
+
+    def _fdblocks(self, s, kinds, maxbytes, start, stop, ffts=None):
+        import numpy as np
+
+        n = self.nfft
+        ww = self.ww
+        if ffts is None:
+            ffts = self.spectra(s)
+        ffts = ffts[..., None, :]  # one spectrum per record, broadcast over periods
+
+        if maxbytes is None:
+            maxbytes = RS_BLOCK_BYTES
+        nrec = int(np.prod(s.shape[:-1]))
+        for blk in _period_blocks(stop - start, nrec * n * (16 + 8 * len(kinds)), maxbytes):
+            blk = slice(start + blk.start, start + blk.stop)
+            H1 = self._receptance(blk) if self.H1 is None else self.H1[blk]
+            CoF = H1 * ffts  # frequency domain convolution
+            resp = {}
+            if 'd' in kinds:
+                resp['d'] = _irfft(CoF, n)  # displacement
+            if 'v' in kinds:
+                resp['v'] = _irfft(1j * ww * CoF, n)  # velocity (mobility)
+            if 'a' in kinds:
+                resp['a'] = _irfft(-ww ** 2 * CoF, n)  # relative acceleration (accelerance)
+                resp['a'][..., :self.n] -= s[..., None, :]
+            yield blk, resp
+
+    def _pwblocks(self, s, kinds, start, stop):
+        for k in range(start, stop):
+            resp = {}
+            if 'd' in kinds or 'a' in kinds:
+                resp['d'] = _pwfilter(self.numd[k], self.den[k], self.c[k, 0], self.c[k, 1], s)
+            if 'v' in kinds or 'a' in kinds:
+                resp['v'] = _pwfilter(self.numv[k], self.den[k], self.c[k, 2], self.c[k, 3], s)
+            if 'a' in kinds:
+                wn = self.wn[k]
+                resp['a'] = -2 * wn * self.z * resp['v'] - (wn ** 2) * resp['d']
+                if 'v' not in kinds:
+                    del resp['v']
+                if 'd' not in kinds:
+                    del resp['d']
+
+            yield slice(k, k + 1), {key: val[..., None, :] for key, val in resp.items()}
+
+
+def spectral_operator(n, dt, T, z, method=None, nfft=None, padding=None, quiet=None):
+    '''
+    spectral_operator - returns the SpectralOperator for a record geometry,
+    reusing a previously built one when available (LRU cache holding up
+    to SPECTRAL_CACHE_SIZE operators, see spectral_cache_info and
+    clear_spectral_cache)
+    
+    input:
+        n: number of points in the record
+        dt: time step [s]
+        T: vector with periods [s]
+        z: damping ratio
+        method: 'fd' (frequency domain) or 'pw' (piecewise), default
+                chosen based on damping (>=4% 'fd', <4% 'pw')
+        nfft: padded length for 'fd' (default None, from the record
+              length and the longest period, see fdlength)
+        padding, quiet: zero padding policy and quiet time used when nfft
+                        is not given (default None, see set_fd_padding)
+    
+    returns:
+        op: SpectralOperator
+    '''
+    import numpy as np
+
+    if method is None:
+        method = 'fd' if z >= 0.04 else 'pw'
+    T = np.asarray(T, dtype=float).reshape(-1)
+    if method == 'fd' and nfft is None:
+        nfft = fdlength(n, dt, T, padding, quiet)  # operators with the same length are shared
+    key = (int(n), float(dt), T.tobytes(), float(z), method, nfft)
+    op = _SPECTRAL_CACHE.get(key)
+    if op is None:
+        op = SpectralOperator(n, dt, T, z, method, nfft)
+        _SPECTRAL_CACHE.put(key, op, op.nbytes)
+    return op
+
+
+def spectral_cache_info():
+    '''
+    spectral_cache_info - statistics of the spectral operators cache
+    
+    returns:
+        dictionary with hits, misses, entries (currently cached) and nbytes
+    '''
+    return _SPECTRAL_CACHE.info()
+
+
+def clear_spectral_cache():
+    '''
+    clear_spectral_cache - removes all the cached spectral operators
+    '''
+    _SPECTRAL_CACHE.clear()
+
+
+def fdlength(n, dt, T, padding=None, quiet=None):
+    '''
+    fdlength - padded transform length of the frequency domain spectra
+    
+    The record is followed by at least quiet times the longest period of
+    zeros so the free vibration of the oscillators decays before wrapping
+    around (the wrapped amplitude at the longest period is about
+    exp(-2 pi z quiet) of the one at the end of the padding, 4% for 
+    z = 5% and quiet = 10). Policy 'pow2' rounds the length up to the 
+    next power of 2 (the original approach, up to twice the needed 
+    length, the extra zeros add quiet time), 'fast' to the next 2-3-5 
+    smooth length (scipy.fft.next_fast_len), which is never longer and
+    transforms as fast. As 'fast' pads close to the minimum, use a 
+    larger quiet (e.g. 15 to 20) to keep the accuracy of 'pow2' at the
+    longest periods.
+    
+    input:
+        n: number of points in the record
+        dt: time step [s]
+        T: vector with periods [s]
+        padding: 'pow2' or 'fast' (default None, see set_fd_padding)
+        quiet: quiet time in multiples of the longest period (default 
+               None, see set_fd_padding)
+    
+    returns:
+        nfft: padded length
+    '''
+    import numpy as np
+
+    if padding is None:
+        padding = _FD_PADDING
+    if quiet is None:
+        quiet = _FD_QUIET
+    if padding not in FD_PADDINGS:
+        raise ValueError('padding must be one of %s' % ', '.join(FD_PADDINGS))
+
+    nmin = n + quiet * np.max(T) / dt
+    if padding == 'pow2':
+        return int(2 ** np.ceil(np.log2(nmin)))
+
+    from scipy.fft import next_fast_len
+
+    return next_fast_len(int(np.ceil(nmin)), real=True)
+
+
+def set_fd_padding(padding='pow2', quiet=10):
+    '''
+    set_fd_padding - sets the default zero padding policy and quiet time
+    of the frequency domain spectra (see fdlength), used by RSFD, 
+    RSFDtheta and the matching procedures when not given per call
+    
+    input:
+        padding: 'pow2' (default) or 'fast'
+        quiet: quiet time in multiples of the longest period (default 10)
+    
+    returns:
+        (padding, quiet) previously set
+    '''
+    global _FD_PADDING, _FD_QUIET
+
+    if padding not in FD_PADDINGS:
+        raise ValueError('padding must be one of %s' % ', '.join(FD_PADDINGS))
+
+    previous = (_FD_PADDING, _FD_QUIET)
+    _FD_PADDING = padding
+    _FD_QUIET = quiet
+    return previous
+
+
+def get_fd_padding():
+    '''
+    get_fd_padding - returns the default (padding, quiet), see set_fd_padding
+    '''
+    return _FD_PADDING, _FD_QUIET
 
-    return PSA, PSV, SA, SV, SD
+
+def set_fft_backend(backend='numpy', workers=None):
+    '''
+    set_fft_backend - selects the library performing the FFTs of the
+    spectra (SpectralOperator) and wavelet (WaveletFilterBank) routines
+    
+    The setting is process wide (the threads started with the workers
+    option of REQPYrotdnn share it, combine both with care to avoid
+    oversubscribing the CPUs) and is passed to the REQPY_batch workers.
+    scipy.fft and pyFFTW keep the plans of the transforms they performed,
+    so the identical length FFTs of the iterations reuse them.
+    
+    input:
+        backend: 'numpy' (numpy.fft, default), 'scipy' (scipy.fft) or
+                 'pyfftw' (pyfftw.interfaces, with its plans cache enabled)
+        workers: number of threads per transform for 'scipy' and 'pyfftw'
+                 (default None, one; negative values count from the
+                 number of CPUs as in scipy.fft)
+    
+    returns:
+        (backend, workers) previously set
+    '''
+    global _FFT_BACKEND, _FFT_WORKERS
+
+    if backend not in FFT_BACKENDS:
+        raise ValueError('backend must be one of %s' % ', '.join(FFT_BACKENDS))
+    if backend == 'pyfftw':
+        try:
+            import pyfftw.interfaces.cache
+        except ImportError:
+            raise ImportError("the 'pyfftw' backend requires pyFFTW (pip install pyfftw)")
+        pyfftw.interfaces.cache.enable()
+
+    previous = (_FFT_BACKEND, _FFT_WORKERS)
+    _FFT_BACKEND = backend
+    _FFT_WORKERS = workers
+    return previous
+
+
+def get_fft_backend():
+    '''
+    get_fft_backend - returns the (backend, workers) currently used for
+    the FFTs, see set_fft_backend
+    '''
+    return _FFT_BACKEND, _FFT_WORKERS
+
+
+class fft_backend:
+    '''
+    fft_backend - context manager selecting the FFT backend within a 
+    block, the previous one is restored on exit (see set_fft_backend)
+    
+        with fft_backend('scipy', workers=4):
+            PSA = ResponseSpectrum(T, s, z, dt, outputs='PSA')
+    '''
+
+    def __init__(self, backend, workers=None):
+        self.backend = backend
+        self.workers = workers
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = set_fft_backend(self.backend, self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        set_fft_backend(*self._previous)
+        return False
+
+
+def _rfft(x, n):
+    '''
+    _rfft - real input FFT of x along the last axis (padded/cropped to n)
+    with the selected backend
+    '''
+    backend, workers = _FFT_BACKEND, _FFT_WORKERS
+    if backend == 'scipy':
+        import scipy.fft
+        return scipy.fft.rfft(x, n, workers=workers)
+    if backend == 'pyfftw':
+        import pyfftw.interfaces.numpy_fft
+        return pyfftw.interfaces.numpy_fft.rfft(x, n, threads=_fftw_threads(workers))
+    import numpy as np
+    return np.fft.rfft(x, n)
+
+
+def _irfft(X, n):
+    '''
+    _irfft - inverse of _rfft, n real samples along the last axis
+    '''
+    backend, workers = _FFT_BACKEND, _FFT_WORKERS
+    if backend == 'scipy':
+        import scipy.fft
+        return scipy.fft.irfft(X, n, workers=workers)
+    if backend == 'pyfftw':
+        import pyfftw.interfaces.numpy_fft
+        return pyfftw.interfaces.numpy_fft.irfft(X, n, threads=_fftw_threads(workers))
+    import numpy as np
+    return np.fft.irfft(X, n)
+
+
+def _fftw_threads(workers):
+    import os
+
+    if workers is None:
+        return 1
+    if workers < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + workers)
+    return workers
+
+
+class _LRUCache:
+    '''
+    _LRUCache - thread-safe least recently used cache bounded by the
+    number of entries and by their total size in bytes
+    '''
+
+    def __init__(self, maxsize, maxbytes=None):
+        import threading
+        from collections import OrderedDict
+
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, nbytes = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, nbytes=0):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self._data and (len(self._data) > self.maxsize or
+                                  (self.maxbytes is not None and self.nbytes > self.maxbytes
+                                   and len(self._data) > 1)):
+                _, (_, old) = self._data.popitem(last=False)
+                self.nbytes -= old
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._data), 'nbytes': self.nbytes}
+
+
+_SPECTRAL_CACHE = _LRUCache(SPECTRAL_CACHE_SIZE, maxbytes=4 * OPERATOR_KERNEL_BYTES)
+_FILTERBANK_CACHE = _LRUCache(FILTERBANK_CACHE_SIZE, maxbytes=FILTERBANK_CACHE_BYTES)
+_FILTERBANK_CACHE_DIR = None  # directory where the filter banks are persisted
+_FFT_BACKEND = 'numpy'  # library performing the FFTs, see set_fft_backend
+_FFT_WORKERS = None  # threads per transform (scipy and pyfftw backends)
+_FD_PADDING = 'pow2'  # default padding policy, see set_fd_padding
+_FD_QUIET = 10  # default quiet time, in multiples of the longest period
+_SPECTRA_CACHE = {'cachedir': None, 'maxbytes': SPECTRA_CACHE_BYTES, 'hits': 0, 'misses': 0}
+
+
+def pwcoefs(T, z, dt):
+    '''
+    pwcoefs - Coefficients of the piecewise exact recurrence
+    u[q+1] = A u[q] + B [s[q], s[q+1]] for SDOF oscillators
+    
+    input:
+        T: vector with periods (s)
+        z: damping ratio
+        dt: time step (s)
+    
+    returns:
+        a11, a12, a21, a22, b11, b12, b21, b22: vectors with the entries
+        of the A and B matrices for each period
+    '''
+    import numpy as np
+
+    pi = np.pi
+
+    wn = 2 * pi / np.asarray(T, dtype=float)
+    wd = wn * (1 - z ** 2) ** (1 / 2)
+
+    ex = np.exp(-z * wn * dt)
+    cwd = np.cos(wd * dt)
+    swd = np.sin(wd * dt)
+    zisq = 1 / (np.sqrt(1 - (z ** 2)))
+
+    a11 = ex * (cwd + z * zisq * swd)
+    a12 = (ex / wd) * swd
+    a21 = -wn * zisq * ex * swd
+    a22 = ex * (cwd - z * zisq * swd)
+
+    b11 = ex * (((2 * z ** 2 - 1) / ((wn ** 2) * dt) + z / wn) * (1 / wd) * np.sin(wd * dt) +
+                (2 * z / ((wn ** 3) * dt) + 1 / (wn ** 2)) * np.cos(wd * dt)) - 2 * z / ((wn ** 3) * dt)
+    b12 = -ex * (((2 * z ** 2 - 1) / ((wn ** 2) * dt)) * (1 / wd) * np.sin(wd * dt) +
+                 (2 * z / ((wn ** 3) * dt)) * np.cos(wd * dt)) - (1 / (wn ** 2)) + 2 * z / ((wn ** 3) * dt)
+    b21 = -((a11 - 1) / ((wn ** 2) * dt)) - a12
+    b22 = -b21 - a12
+
+    return a11, a12, a21, a22, b11, b12, b21, b22
+
+
+def _pwfilter(num, den, c0, c1, s):
+    '''
+    _pwfilter - runs one row of the piecewise recurrence as a second
+    order filter; the first two samples (y[0] = 0, y[1] = c0 s[0] + c1 s[1])
+    are set explicitly and the remaining ones filtered from that state
+    '''
+    import numpy as np
+    from scipy import signal
+
+    n = s.shape[-1]
+    y = np.zeros(s.shape)
+    if n > 1:
+        y[..., 1] = c0 * s[..., 0] + c1 * s[..., 1]
+    if n > 2:
+        zi = np.stack((num[1] * s[..., 1] + num[2] * s[..., 0] - den[1] * y[..., 1],
+                       num[2] * s[..., 1] - den[2] * y[..., 1]), axis=-1)
+        y[..., 2:], _ = signal.lfilter(num, den, s[..., 2:], zi=zi)
+    return y
+
+
+def _period_blocks(nT, nbytes, maxbytes):
+    '''
+    _period_blocks - splits nT periods in contiguous blocks (slices) so
+    that nbytes per period times the block size stays below maxbytes
+    '''
+    size = max(1, int(maxbytes // max(nbytes, 1)))
+    return [slice(i, min(i + size, nT)) for i in range(0, nT, size)]
+
+
+def _period_parts(nT, parts):
+    '''
+    _period_parts - splits nT periods in up to parts contiguous ranges
+    (slices) of similar size, one per worker thread
+    '''
+    parts = max(1, min(int(parts or 1), nT))
+    bounds = [nT * k // parts for k in range(parts + 1)]
+    return [slice(bounds[k], bounds[k + 1]) for k in range(parts)]
+
+
+def _threadmap(func, items, workers=None):
+    '''
+    _threadmap - list(map(func, items)) evaluated by a pool of workers
+    threads (serially when workers is None or 1); used for the 
+    independent FFT and filtering stages, which release the GIL
+    '''
+    items = list(items)
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
 
 
 def basecorr(t, xg, CT, imax=80, tol=0.01):
@@ -902,7 +2501,7 @@ def basecorr(t, xg, CT, imax=80, tol=0.01):
         t: time vector [s]
         xg: time history of accelerations
         CT: time for correction [s]
-        omax: maximum number of iterations (fefault 80)
+        imax: maximum number of iterations (default 80)
         tol: tolerance (percent of the max, default 0.01)
     
     return:
@@ -913,75 +2512,130 @@ def basecorr(t, xg, CT, imax=80, tol=0.01):
         cdespl: baseline-corrected history of displacements
     '''
     import numpy as np
-    from scipy import integrate
 
-    n = np.size(xg)
-    cxg = np.copy(xg)
+    vel, despl, cxg, cvel, cdespl = basecorr_batch(t, np.asarray(xg)[None, :], CT, imax, tol)
 
-    vel = integrate.cumtrapz(xg, t, initial=0)
-    despl = integrate.cumtrapz(vel, t, initial=0)
-    dt = t[1] - t[0]
-    L = int(np.ceil(CT / (dt)) - 1)
-    M = n - L
-
-    for q in range(imax):
+    return vel[0], despl[0], cxg[0], cvel[0], cdespl[0]
 
-        dU, ap, an = 0, 0, 0
-        dV, vp, vn = 0, 0, 0
 
-        for i in range(n - 1):
-            dU = dU + (t[-1] - t[i + 1]) * cxg[i + 1] * dt
+def basecorr_batch(t, xg, CT, imax=80, tol=0.01):
+    '''
+    basecorr_batch - performs the baseline correction of basecorr for 
+    several records at once
+    
+    The loops of the original algorithm are evaluated with masked 
+    arrays: the weights of the correction windows are computed once and
+    the sums are accumulated with cumulative sums (same summation order
+    as the loops, so the results are identical to basecorr). Each record
+    stops iterating as soon as it meets the tolerance.
+    
+    input:
+        t: time vector [s]
+        xg: 2D array with the time histories of accelerations (one record
+            per row, all sampled at t)
+        CT: time for correction [s], single value or one per record
+        imax: maximum number of iterations (default 80)
+        tol: tolerance (percent of the max, default 0.01)
+    
+    return:
+        vel, despl, cxg, cvel, cdespl: 2D arrays as returned by basecorr
+    '''
+    import numpy as np
+    from scipy import integrate
 
-        for i in range(L + 1):
-            aux = ((L - i) / L) * (t[-1] - t[i]) * cxg[i] * dt
-            if aux >= 0:
-                ap = ap + aux
-            else:
-                an = an + aux
+    t = np.asarray(t, dtype=float)
+    xg = np.atleast_2d(np.asarray(xg, dtype=float))
 
-        alfap = -dU / (2 * ap)
-        alfan = -dU / (2 * an)
+    vel = integrate.cumtrapz(xg, t, initial=0, axis=-1)
+    despl = integrate.cumtrapz(vel, t, initial=0, axis=-1)
+    cxg, cvel, cdespl = _basecorr_iterate(t, xg, vel, despl, CT, imax, tol)
 
-        for i in range(1, L + 1):
+    return vel, despl, cxg, cvel, cdespl
 
-            if cxg[i] > 0:
-                cxg[i] = (1 + alfap * (L - i) / L) * cxg[i]
-            else:
-                cxg[i] = (1 + alfan * (L - i) / L) * cxg[i]
 
-        for i in range(n - 1):
-            dV = dV + cxg[i + 1] * dt
+def _basecorr_iterate(t, xg, vel, despl, CT, imax, tol):
+    '''
+    _basecorr_iterate - correction iterations of basecorr_batch for the
+    records xg (2D) with their uncorrected velocities and displacements
+    (computed once by the caller), returns cxg, cvel, cdespl
+    '''
+    import numpy as np
+    from scipy import integrate
 
-        for i in range(M - 1, n):
-            auxv = ((i + 1 - M) / (n - M)) * cxg[i] * dt
-            if auxv >= 0:
-                vp = vp + auxv
-            else:
-                vn = vn + auxv
+    nrec, n = xg.shape
+    cxg = np.array(xg)
+    cvel = np.array(vel)
+    cdespl = np.array(despl)
+    dt = t[1] - t[0]
+    CT = np.broadcast_to(np.asarray(CT, dtype=float), (nrec,))
+    L = (np.ceil(CT / dt) - 1).astype(int)[:, None]
+    M = n - L
 
-        valfap = -dV / (2 * vp)
-        valfan = -dV / (2 * vn)
+    i = np.arange(n)
+    wd = t[-1] - t[1:]  # weights of the displacement at the end
+    wa = ((L - i) / L) * (t[-1] - t)  # initial window
+    ina = i <= L
+    ins = (i >= 1) & ina
+    wv = ((i + 1 - M) / (n - M))  # final window
+    inv = i >= M - 1
 
-        for i in range(M - 1, n):
+    active = np.arange(nrec)
+    for q in range(imax):
+        x = cxg[active]
+        Lq, waq, inaq, insq = L[active], wa[active], ina[active], ins[active]
+        wvq, invq = wv[active], inv[active]
+
+        dU = _cumsum_last((wd * x[:, 1:]) * dt)
+        aux = waq * x * dt
+        pos = aux >= 0
+        ap = _cumsum_last(np.where(inaq & pos, aux, 0))
+        an = _cumsum_last(np.where(inaq & ~pos, aux, 0))
+
+        alfap = (-dU / (2 * ap))[:, None]
+        alfan = (-dU / (2 * an))[:, None]
+        alfa = np.where(x > 0, alfap, alfan)
+        x = np.where(insq, (1 + alfa * (Lq - i) / Lq) * x, x)
+
+        dV = _cumsum_last(x[:, 1:] * dt)
+        auxv = wvq * x * dt
+        pos = auxv >= 0
+        vp = _cumsum_last(np.where(invq & pos, auxv, 0))
+        vn = _cumsum_last(np.where(invq & ~pos, auxv, 0))
+
+        valfap = (-dV / (2 * vp))[:, None]
+        valfan = (-dV / (2 * vn))[:, None]
+        valfa = np.where(x > 0, valfap, valfan)
+        x = np.where(invq, (1 + valfa * wvq) * x, x)
+
+        v = integrate.cumtrapz(x, t, initial=0, axis=-1)
+        d = integrate.cumtrapz(v, t, initial=0, axis=-1)
+        cxg[active] = x
+        cvel[active] = v
+        cdespl[active] = d
+
+        errv = np.abs(v[:, -1] / np.max(np.abs(v), axis=-1))
+        errd = np.abs(d[:, -1] / np.max(np.abs(d), axis=-1))
+
+        active = active[~((errv <= tol) & (errd <= tol))]
+        if active.size == 0:
+            break
 
-            if cxg[i] > 0:
-                cxg[i] = (1 + valfap * ((i + 1 - M) / (n - M))) * cxg[i]
-            else:
-                cxg[i] = (1 + valfan * ((i + 1 - M) / (n - M))) * cxg[i]
+    return cxg, cvel, cdespl
 
-        cvel = integrate.cumtrapz(cxg, t, initial=0)
-        cdespl = integrate.cumtrapz(cvel, t, initial=0)
 
-        errv = np.abs(cvel[-1] / np.max(np.abs(cvel)))
-        errd = np.abs(cdespl[-1] / np.max(np.abs(cdespl)))
-
-        if errv <= tol and errd <= tol:
-            break
+def _cumsum_last(x):
+    '''
+    _cumsum_last - sums along the last axis accumulating from left to 
+    right (as a Python loop would, unlike the pairwise np.sum)
+    '''
+    import numpy as np
 
-    return vel, despl, cxg, cvel, cdespl
+    if x.shape[-1] == 0:
+        return np.zeros(x.shape[:-1])
+    return np.cumsum(x, axis=-1)[..., -1]
 
 
-def baselinecorrect(sc, t):
+def baselinecorrect(sc, t, search='linear'):
     '''
     baselinecorrect - performs baseline correction iteratively 
     calling basecorr
@@ -999,39 +2653,90 @@ def baselinecorrect(sc, t):
     input:
         sc: uncorrected acceleration time series
         t: time vector
+        search: how the time to correct is searched when the correction
+                fails (NaNs), 'linear' tries CT, 2CT, 3CT, ... up to the
+                median of t and keeps the first one that works (default);
+                'bisect' doubles the multiple of CT until one works and
+                bisects back for the shortest one, which needs fewer
+                attempts and gives the same result when the longer times
+                to correct keep working
     returns:
         ccs,cvel,cdespl: corrected acc., vel. and disp.
         
     '''
-    import numpy as np
-
-    CT = np.max(np.array([1, t[-1] / 20]))  # time to correct
-    vel, despl, ccs, cvel, cdespl = basecorr(t, sc, CT)
-    kka = 1;
-    flbc = True
-
-    while any(np.isnan(ccs)):
-        kka = kka + 1
-        CTn = kka * CT
-        if CTn >= np.median(t):
-            print('=' * 40)
-            print('**baseline correction failed**')
-            print('=' * 40)
-            flbc = False;
-            ccs = sc;
-            cvel = vel;
-            cdespl = despl
-            break
-        vel, despl, ccs, cvel, cdespl = basecorr(t, sc, CTn)
+    ccs, cvel, cdespl, flbc = _baselinecorrect(sc, t, search)
+    print('=' * 40)
     if flbc:
-        print('=' * 40)
         print('**baseline correction was succesful**')
-        print('=' * 40)
+    else:
+        print('**baseline correction failed**')
+    print('=' * 40)
 
     return ccs, cvel, cdespl
 
 
-def ResponseSpectrumTheta(T, s1, s2, z, dt, theta):
+def _baselinecorrect(sc, t, search='linear'):
+    '''
+    _baselinecorrect - search of the time to correct of baselinecorrect,
+    returns ccs, cvel, cdespl and whether the correction succeeded (the
+    uncorrected record and its integrals otherwise)
+    
+    The uncorrected velocities and displacements are integrated once and
+    shared by all the attempts.
+    '''
+    import numpy as np
+    from scipy import integrate
+
+    if search not in ('linear', 'bisect'):
+        raise ValueError("search must be 'linear' or 'bisect'")
+
+    t = np.asarray(t, dtype=float)
+    xg = np.asarray(sc, dtype=float)[None, :]
+    vel = integrate.cumtrapz(xg, t, initial=0, axis=-1)
+    despl = integrate.cumtrapz(vel, t, initial=0, axis=-1)
+
+    CT = np.max(np.array([1, t[-1] / 20]))  # time to correct
+    kk = [1]  # multiples of CT that can be tried
+    while (kk[-1] + 1) * CT < np.median(t):
+        kk.append(kk[-1] + 1)
+
+    attempts = {}
+
+    def attempt(q):
+        if q not in attempts:
+            ccs, cvel, cdespl = _basecorr_iterate(t, xg, vel, despl, kk[q] * CT, 80, 0.01)
+            attempts[q] = (ccs[0], cvel[0], cdespl[0]) if not np.any(np.isnan(ccs)) else None
+        return attempts[q]
+
+    found = None
+    if search == 'linear':
+        for q in range(len(kk)):
+            if attempt(q) is not None:
+                found = q
+                break
+    else:
+        lo, q = -1, 0  # lo: last multiple known to fail
+        while q < len(kk):  # doubling steps until one works
+            if attempt(q) is not None:
+                found = q
+                break
+            lo, q = q, 2 * q + 1
+        if found is None and lo < len(kk) - 1 and attempt(len(kk) - 1) is not None:
+            found = len(kk) - 1
+        while found is not None and found - lo > 1:  # shortest one between lo and found
+            mid = (lo + found) // 2
+            if attempt(mid) is not None:
+                found = mid
+            else:
+                lo = mid
+
+    if found is None:
+        return sc, vel[0], despl[0], False
+    ccs, cvel, cdespl = attempts[found]
+    return ccs, cvel, cdespl, True
+
+
+def ResponseSpectrumTheta(T, s1, s2, z, dt, theta, workers=None, cache=False):
     '''
     ResponseSpectrumTheta - decides what approach to use to estimate 
     the response spectrum based on damping value 
@@ -1043,24 +2748,34 @@ def ResponseSpectrumTheta(T, s1, s2, z, dt, theta):
         z: damping ratio
         dt: time steps for s
         theta: vector with the angles to calculate the spectra (deg)
+        workers: number of threads sharing the periods (default None,
+                 serial)
+        cache: True/False, whether the spectra disk cache is used when
+               enabled (see set_spectra_cache, default False)
     
     Returns:
         PSA,PSV,SD
     '''
 
+    if cache and _SPECTRA_CACHE['cachedir'] is not None:
+        return _cached_spectra(('ResponseSpectrumTheta', z, dt, _fd_key(z)), (T, s1, s2, theta),
+                               lambda: ResponseSpectrumTheta(T, s1, s2, z, dt, theta, workers))
+
     if z >= 0.04:
-        PSA, PSV, SD = RSFDtheta(T, s1, s2, z, dt, theta)
+        PSA, PSV, SD = RSFDtheta(T, s1, s2, z, dt, theta, workers)
     else:
-        PSA, PSV, SD = RSPWtheta(T, s1, s2, z, dt, theta)
+        PSA, PSV, SD = RSPWtheta(T, s1, s2, z, dt, theta, workers)
 
     return PSA, PSV, SD
 
 
-def RSFDtheta(T, s1, s2, z, dt, theta):
+def RSFDtheta(T, s1, s2, z, dt, theta, workers=None, padding=None, quiet=None):
     '''   
    
     RSFDtheta - Rotated response spectra in the frequency domain, 
     returns the spectra for each theta accomodated in 2D arrays
+    (both components are transformed together, see fdblocks, and the
+    rotation is evaluated in tiles, see rotdsd)
     
     Input:
         T: vector with periods (s)
@@ -1068,62 +2783,29 @@ def RSFDtheta(T, s1, s2, z, dt, theta):
         z: damping ratio
         dt: time steps for s
         theta: vector with the angles to calculate the spectra (deg)
+        workers: number of threads sharing the periods (default None,
+                 serial)
+        padding, quiet: zero padding policy and quiet time (default None,
+                        the ones set with set_fd_padding), see fdlength
     
     Returns:
         2D arrays of PSA,PSV,SD
     
     '''
     import numpy as np
-    from numpy.fft import fft, ifft
 
     pi = np.pi
-    theta = theta * pi / 180
 
+    T = np.asarray(T, dtype=float)
     ntheta = np.size(theta)
-    npo = np.max([np.size(s1), np.size(s2)])
     nT = np.size(T)
 
     SD = np.zeros((ntheta, nT))
 
-    nor = npo
+    def store(blk, d1, d2):
+        SD[:, blk] = rotdsd(d1, d2, theta)
 
-    n = int(2 ** np.ceil(np.log2(npo + 10 * np.max(T) / dt)))  # add zeros to provide enough quiet time
-    fs = 1 / dt;
-    s1 = np.append(s1, np.zeros(n - npo))
-    s2 = np.append(s2, np.zeros(n - npo))
-
-    fres = fs / n  # frequency resolution
-    nfrs = int(np.ceil(n / 2))  # number of frequencies
-    freqs = fres * np.arange(0, nfrs + 1, 1)  # vector with frequencies
-    ww = 2 * pi * freqs  # vector with frequencies [rad/s]
-    ffts1 = fft(s1)
-    ffts2 = fft(s2)
-
-    m = 1
-    for kk in range(nT):
-        w = 2 * pi / T[kk];
-        k = m * w ** 2;
-        c = 2 * z * m * w
-
-        H1 = 1 / (-m * ww ** 2 + k + 1j * c * ww)  # Transfer function (half) - Receptance
-
-        H1 = np.append(H1, np.conj(H1[n // 2 - 1:0:-1]))
-        H1[n // 2] = np.real(H1[n // 2])  # Transfer function (complete) - Receptance
-
-        CoFd1 = H1 * ffts1  # frequency domain convolution
-        d1 = ifft(CoFd1)  # go back to the time domain (displacement)
-        d1 = d1[:nor]
-
-        CoFd2 = H1 * ffts2  # frequency domain convolution
-        d2 = ifft(CoFd2)  # go back to the time domain (displacement)
-        d2 = d2[:nor]
-
-        Md1, Mtheta = np.meshgrid(d1, theta, sparse=True, copy=False)
-        Md2, _ = np.meshgrid(d2, theta, sparse=True, copy=False)
-
-        drot = Md1 * np.cos(Mtheta) + Md2 * np.sin(Mtheta)
-
-        SD[:, kk] = np.max(np.abs(drot), axis=1)
+    _rotdapply(T, s1, s2, z, dt, True, store, workers, padding, quiet)
 
     PSV = (2 * pi / T) * SD
     PSA = (2 * pi / T) ** 2 * SD
@@ -1131,11 +2813,13 @@ def RSFDtheta(T, s1, s2, z, dt, theta):
     return PSA, PSV, SD
 
 
-def RSPWtheta(T, s1, s2, z, dt, theta):
+def RSPWtheta(T, s1, s2, z, dt, theta, workers=None):
     '''  
     
     RSPWtheta - Rotated response spectra using piecewise, 
     returns the spectra for each theta accomodated in 2D arrays
+    (both components are filtered together, see pwblocks, and the
+    rotation is evaluated in tiles, see rotdsd)
     
     Input:
         T: vector with periods (s)
@@ -1143,6 +2827,8 @@ def RSPWtheta(T, s1, s2, z, dt, theta):
         z: damping ratio
         dt: time steps for s
         theta: vector with the angles to calculate the spectra (deg)
+        workers: number of threads sharing the periods (default None,
+                 serial)
     
     Returns:
         2D arrays of PSA,PSV,SD
@@ -1151,67 +2837,274 @@ def RSPWtheta(T, s1, s2, z, dt, theta):
     import numpy as np
 
     pi = np.pi
-    theta = theta * pi / 180
-    ntheta = np.size(theta)
 
+    T = np.asarray(T, dtype=float)
+    ntheta = np.size(theta)
     nT = np.size(T)  # number of natural periods
+
     SD = np.zeros((ntheta, nT))
-    n1 = np.size(s1);
-    n2 = np.size(s2)
 
-    if n1 > n2:
-        n = n2
-        s1 = s1[:n]
-    else:
-        n = n1
-        s2 = s2[:n]
+    def store(blk, d1, d2):
+        SD[:, blk] = rotdsd(d1, d2, theta)
 
-    for k in range(nT):
-        wn = 2 * pi / T[k]
-        wd = wn * (1 - z ** 2) ** (1 / 2)
+    _rotdapply(T, s1, s2, z, dt, False, store, workers)
 
-        u1 = np.zeros((2, n))  # matrix with velocities and displacements
-        u2 = np.zeros((2, n))  # matrix with velocities and displacements
+    PSV = (2 * pi / T) * SD  # pseudo-vel. spectrum
+    PSA = (2 * pi / T) ** 2 * SD  # pseudo-accel. spectrum
 
-        ex = np.exp(-z * wn * dt)
-        cwd = np.cos(wd * dt)
-        swd = np.sin(wd * dt)
-        zisq = 1 / (np.sqrt(1 - (z ** 2)))
+    return PSA, PSV, SD
 
-        a11 = ex * (cwd + z * zisq * swd)
-        a12 = (ex / wd) * swd
-        a21 = -wn * zisq * ex * swd
-        a22 = ex * (cwd - z * zisq * swd)
 
-        b11 = ex * (((2 * z ** 2 - 1) / ((wn ** 2) * dt) + z / wn) * (1 / wd) * np.sin(wd * dt) +
-                    (2 * z / ((wn ** 3) * dt) + 1 / (wn ** 2)) * np.cos(wd * dt)) - 2 * z / ((wn ** 3) * dt)
-        b12 = -ex * (((2 * z ** 2 - 1) / ((wn ** 2) * dt)) * (1 / wd) * np.sin(wd * dt) +
-                     (2 * z / ((wn ** 3) * dt)) * np.cos(wd * dt)) - (1 / (wn ** 2)) + 2 * z / ((wn ** 3) * dt)
-        b21 = -((a11 - 1) / ((wn ** 2) * dt)) - a12
-        b22 = -b21 - a12
+def ResponseSpectrumRotDnn(T, s1, s2, z, dt, nn, theta=None, workers=None, cache=False):
+    '''
+    ResponseSpectrumRotDnn - RotDnn response spectra, chooses the
+    frequency domain (>=4%) or piecewise (<4%) approach based on damping
+    
+    For nn = 100 the peak over all the orientations is obtained in closed
+    form as the peak of sqrt(d1^2 + d2^2), no rotation is performed (this
+    is the exact supremum over a continuous angle, with the default 1 deg
+    spacing the rotated maxima are at most 0.004% lower). For any other
+    percentile the spectra at each angle are evaluated in angle/time
+    tiles (see rotdsd) so memory does not grow with the record length.
+    
+    Input:
+        T: vector with periods (s)
+        s1,s2: accelerations time series
+        z: damping ratio
+        dt: time steps for s
+        nn: percentile at which the spectrum is defined (e.g. 50, 100)
+        theta: vector with the angles to calculate the spectra 
+               (deg, default 0 to 179 each 1 deg)
+        workers: number of threads sharing the periods (default None,
+                 serial)
+        cache: True/False, whether the spectra disk cache is used when
+               enabled (see set_spectra_cache, default False)
+    
+    Returns:
+        PSA,PSV,SD RotDnn vectors
+    '''
+    import numpy as np
 
-        A = np.array([[a11, a12], [a21, a22]])
-        B = np.array([[b11, b12], [b21, b22]])
+    pi = np.pi
 
-        for q in range(n - 1):
-            u1[:, q + 1] = np.dot(A, u1[:, q]) + np.dot(B, np.array([s1[q], s1[q + 1]]))
-            u2[:, q + 1] = np.dot(A, u2[:, q]) + np.dot(B, np.array([s2[q], s2[q + 1]]))
+    T = np.asarray(T, dtype=float)
+    if theta is None:
+        theta = np.arange(0, 180, 1)
 
-        d1 = u1[0, :];
-        d2 = u2[0, :]
+    n = np.min((np.size(s1), np.size(s2)))
+    s1 = np.asarray(s1)[:n]
+    s2 = np.asarray(s2)[:n]
 
-        Md1, Mtheta = np.meshgrid(d1, theta, sparse=True, copy=False)
-        Md2, _ = np.meshgrid(d2, theta, sparse=True, copy=False)
+    if cache and _SPECTRA_CACHE['cachedir'] is not None:
+        return _cached_spectra(('ResponseSpectrumRotDnn', nn, z, dt, _fd_key(z)), (T, s1, s2, theta),
+                               lambda: ResponseSpectrumRotDnn(T, s1, s2, z, dt, nn, theta, workers))
 
-        drot = Md1 * np.cos(Mtheta) + Md2 * np.sin(Mtheta)
-        SD[:, k] = np.max(np.abs(drot), axis=1)
+    SD = np.zeros(np.size(T))
 
-    PSV = (2 * pi / T) * SD  # pseudo-vel. spectrum
-    PSA = (2 * pi / T) ** 2 * SD  # pseudo-accel. spectrum
+    def store(blk, d1, d2):
+        if nn == 100:
+            SD[blk] = np.max(np.hypot(d1, d2), axis=-1)
+        else:
+            SD[blk] = np.percentile(rotdsd(d1, d2, theta), nn, axis=0)
+
+    _rotdapply(T, s1, s2, z, dt, z >= 0.04, store, workers)
+
+    PSV = (2 * pi / T) * SD
+    PSA = (2 * pi / T) ** 2 * SD
 
     return PSA, PSV, SD
 
 
+def rotdsd(d1, d2, theta, maxbytes=None):
+    '''
+    rotdsd - Peak rotated displacements, max(abs(d1 cos(theta) + d2 sin(theta)))
+    over time for each angle, evaluated in angle/time tiles so the full
+    angle x time matrix is never stored
+    
+    input:
+        d1, d2: displacement time histories in two orthogonal directions,
+                vectors or 2D arrays (one period per row)
+        theta: vector with the angles (deg)
+        maxbytes: memory budget for the tiles (default RS_BLOCK_BYTES)
+    
+    returns:
+        SD: peak displacements (angles x periods, or vector for 1D input)
+    '''
+    import numpy as np
+
+    pi = np.pi
+
+    d1 = np.asarray(d1, dtype=float)
+    d2 = np.asarray(d2, dtype=float)
+    vector = d1.ndim == 1
+    d1 = np.atleast_2d(d1)
+    d2 = np.atleast_2d(d2)
+    nper, n = d1.shape
+
+    theta = np.asarray(theta, dtype=float).reshape(-1) * pi / 180
+    ntheta = np.size(theta)
+
+    if maxbytes is None:
+        maxbytes = RS_BLOCK_BYTES
+    per_sample = 16 * nper  # working array and its temporary (8 bytes each)
+    na = min(ntheta, max(1, int(maxbytes // (per_sample * min(n, 1024)))))  # angles per tile
+    nt = max(1, int(maxbytes // (per_sample * na)))  # samples per tile
+
+    SD = np.zeros((ntheta, nper))
+    for ia in range(0, ntheta, na):
+        ang = slice(ia, min(ia + na, ntheta))
+        c = np.cos(theta[ang])[:, None, None]
+        sn = np.sin(theta[ang])[:, None, None]
+        for it in range(0, n, nt):
+            tt = slice(it, min(it + nt, n))
+            drot = c * d1[None, :, tt]
+            drot += sn * d2[None, :, tt]
+            np.abs(drot, out=drot)
+            np.maximum(SD[ang], np.max(drot, axis=-1), out=SD[ang])
+
+    return SD[:, 0] if vector else SD
+
+
+def _rotdblocks(T, s1, s2, z, dt, fd, parts=(None,), padding=None, quiet=None):
+    '''
+    _rotdblocks - displacement time histories of both horizontal 
+    components for blocks of periods (frequency domain, fd=True, over
+    the length of the longest component; otherwise piecewise over the
+    length of the shortest one, padding and quiet as in fdlength); 
+    parts (slices, None for all the periods) are contiguous ranges of T
+    
+    The spectral operator and the spectra of the components are computed
+    once when called and shared by the parts, the responses are computed
+    lazily as the returned generators are consumed.
+    
+    returns:
+        list with a generator per part yielding blk (slice with the 
+        period indices of the block) and d1, d2 (2D arrays, periods in
+        block x samples)
+    '''
+    import numpy as np
+
+    s1 = np.asarray(s1, dtype=float)
+    s2 = np.asarray(s2, dtype=float)
+    n1 = np.size(s1)
+    n2 = np.size(s2)
+
+    if fd:
+        nor = max(n1, n2)
+        S = np.zeros((2, nor))
+        S[0, :n1] = s1
+        S[1, :n2] = s2
+        op = spectral_operator(nor, dt, T, z, method='fd', padding=padding, quiet=quiet)
+        ffts = op.spectra(S)
+        return [((blk, resp['d'][0, :, :nor], resp['d'][1, :, :nor])
+                 for blk, resp in op.blocks(S, periods=part, ffts=ffts)) for part in parts]
+
+    n = min(n1, n2)
+    op = spectral_operator(n, dt, T, z, method='pw')
+    S = np.vstack((s1[:n], s2[:n]))
+    return [((blk, resp['d'][0], resp['d'][1])
+             for blk, resp in op.blocks(S, periods=part)) for part in parts]
+
+
+def _rotdapply(T, s1, s2, z, dt, fd, func, workers=None, padding=None, quiet=None):
+    '''
+    _rotdapply - calls func(blk, d1, d2) for all the blocks of periods of
+    _rotdblocks; with workers > 1 the periods are split in contiguous
+    ranges processed concurrently by a pool of threads (func must only
+    write the entries of its own block)
+    '''
+    import numpy as np
+
+    parts = _rotdblocks(T, s1, s2, z, dt, fd, _period_parts(np.size(T), workers), padding, quiet)
+
+    def run(blocks):
+        for blk, d1, d2 in blocks:
+            func(blk, d1, d2)
+
+    _threadmap(run, parts, workers)
+
+
+def detailresponses(T, D, scales, z, dt, locs=None, truncate=False):
+    '''
+    detailresponses - SDOF displacement responses of the detail functions
+    for linear superposition
+    
+    Since the record is rebuilt from the details by the trapezoidal rule,
+    np.trapz(D.T, scales) = sum_j c[j] D[j], the responses are scaled by
+    the quadrature weights c; the response at T[k] of a record rebuilt
+    from the details scaled by F is then sum_j F[j] R[k, j] 
+    (see superposition_sd). Memory: periods x details x samples floats.
+    
+    input:
+        T: vector with periods (s)
+        D: 2D array with the detail functions (details x samples)
+        scales: vector with the scales of the details
+        z: damping ratio
+        dt: time step (s)
+        locs: indices of the periods for which the responses are needed
+              (default None, all of them); the padded length is still 
+              defined by all the periods in T, as in ResponseSpectrum
+        truncate: True/False, whether the frequency domain responses are
+                  cut to the record length (as in the rotated spectra) or
+                  kept over the padded length (as in RSFD)
+    
+    returns:
+        R: 3D array (periods x details x samples) with the weighted responses
+    '''
+    import numpy as np
+
+    D = np.asarray(D, dtype=float)
+    nd, n = D.shape
+    dx = np.diff(scales)
+    c = np.zeros(nd)  # trapezoidal rule weights
+    c[:-1] += dx / 2
+    c[1:] += dx / 2
+
+    T = np.asarray(T, dtype=float).reshape(-1)
+    nfft = fdlength(n, dt, T) if z >= 0.04 else None  # padded length of all the periods
+    if locs is not None:
+        T = T[locs]
+    op = spectral_operator(n, dt, T, z, nfft=nfft)
+    nlen = op.nfft if (op.method == 'fd' and not truncate) else n
+    R = np.empty((np.size(T), nd, nlen))
+    for blk, resp in op.blocks(D):
+        R[blk] = np.swapaxes(resp['d'][..., :nlen], 0, 1)
+    R *= c[:, None]
+
+    return R
+
+
+def superposition_sd(R, F, R2=None, nn=100, theta=None):
+    '''
+    superposition_sd - Displacement spectrum of a record rebuilt from
+    detail functions scaled by F, by superposition of their responses
+    
+    input:
+        R: weighted responses of the details (see detailresponses)
+        F: vector with the scaling factors of the details
+        R2: weighted responses of the details of the second horizontal
+            component, if given the RotDnn spectrum is returned
+        nn: percentile for RotDnn (default 100)
+        theta: angles for RotDnn (deg, default 0 to 179 each 1 deg)
+    
+    returns:
+        SD: displacement spectrum (RotDnn when R2 is given) at the periods
+            of R
+    '''
+    import numpy as np
+
+    d1 = np.tensordot(F, R, axes=(0, 1))  # periods x samples
+    if R2 is None:
+        return np.max(np.abs(d1), axis=-1)
+
+    d2 = np.tensordot(F, R2, axes=(0, 1))
+    if nn == 100:
+        return np.max(np.hypot(d1, d2), axis=-1)
+    if theta is None:
+        theta = np.arange(0, 180, 1)
+    return np.percentile(rotdsd(d1, d2, theta), nn, axis=0)
+
+
 def rotdnn(s1, s2, dt, zi, T, nn):
     '''
     rotdnn - computes rotated and rotdnn spectra
@@ -1268,6 +3161,6 @@ def load_PEERNGA_record(filepath):
         line = next(fp).split(',')
         npts = int(line[0].split('=')[1])
         dt = float(line[1].split('=')[1].split()[0])
-        acc = np.array([p for l in fp for p in l.split()]).astype(float)
+        acc = np.fromstring(fp.read(), sep=' ')  # whole body in one vectorized call
 
     return acc, dt, npts, eqname
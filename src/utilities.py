@@ -1,12 +1,362 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import namedtuple
+
 import numpy as np
 from typing import List, Tuple, Any
 from numpy import ndarray
 import matplotlib.pyplot as plt
 
-__all__ = ['ec8_rs', 'processNGAfile', 'processTwoCfile', 'processOneCfile']
+__all__ = ['ec8_rs', 'processNGAfile', 'processTwoCfile', 'processOneCfile', 'read_record', 'Record',
+           'RecordCache', 'read_at2_header', 'synthetic_record']
+
+RECORD_FORMATS = ('nga', 'one', 'two')  # file formats understood by read_record
+
+
+class Record(namedtuple('Record', ['acc', 'dt', 'npts', 'eqname'])):
+    """
+    Acceleration record as returned by read_record (it unpacks as the
+    acc, dt, npts, eqname tuple of reqpy.load_PEERNGA_record).
+
+    Attributes
+    ----------
+    acc : ndarray
+        Acceleration time series
+    dt : float
+        Time step
+    npts : int
+        Number of points in the record
+    eqname : str
+        Record name (year_name_station_component for PEER NGA files,
+        the file name otherwise)
+    time : ndarray
+        Time vector, computed from dt when accessed
+    """
+    __slots__ = ()
+
+    @property
+    def time(self) -> ndarray:
+        return np.arange(self.npts) * self.dt
+
+
+def read_record(filepath: str, fmt: str = 'nga', dt: float = None, scalefactor: float = 1) -> Record:
+    """
+    Reads an acceleration record. The header (if any) is parsed once and
+    the numeric body is converted in a single vectorized call.
 
+    Parameters
+    ----------
+    filepath : str
+        File path in order to read the file data
+    fmt : str
+        'nga' (PEER NGA .AT2 file, both the "NPTS=..., DT=..." and the
+        "npts dt NPTS, DT" headers), 'one' (one column with the 
+        accelerations) or 'two' (two columns with time and acceleration,
+        lines starting with # are skipped)
+    dt : float
+        Time interval of the acceleration history data, required for the
+        one column format and for two column files with a single row (the
+        other formats provide it)
+    scalefactor : float
+        Scale factor in which the acceleration values will be multiplied.
 
-def processTwoCfile(filepath: str, scalefactor: float = 1) -> Tuple[List, List]:
+    Returns
+    -------
+    record : Record
+        Named tuple with acc, dt, npts and eqname (and the time property)
+    """
+    if fmt not in RECORD_FORMATS:
+        raise ValueError('fmt must be one of %s' % ', '.join(RECORD_FORMATS))
+
+    with open(filepath, 'r') as file:
+        if fmt == 'nga':
+            header = _at2_header([next(file) for _ in range(4)])
+            npts, dt, eqname = header['npts'], header['dt'], header['eqname']
+        body = file.read()
+
+    if fmt == 'nga':
+        acc = np.fromstring(body, sep=' ')[:npts]
+    elif fmt == 'one':
+        if dt is None:
+            raise ValueError('dt is required to read one column files')
+        acc = np.fromstring(body, sep=' ')
+    else:
+        data = np.loadtxt(body.splitlines(), ndmin=2)  # skips the # comment lines
+        if data.shape[1] != 2:
+            raise ValueError('%s does not have two columns' % filepath)
+        acc = data[:, 1]
+        if len(data) > 1:
+            dt = data[1, 0] - data[0, 0]
+        elif dt is None:
+            raise ValueError('dt is required to read two column files with a single row')
+    if fmt != 'nga':
+        eqname = os.path.splitext(os.path.basename(filepath))[0]
+
+    if scalefactor != 1:
+        acc = acc * scalefactor
+    return Record(acc, float(dt), acc.size, eqname)
+
+
+class RecordCache:
+    """
+    Binary cache of parsed records. Each record is stored once as a .npy
+    file (unscaled accelerations) and described in a JSON index with its
+    source path, format, size, modification time, dt, npts and eqname.
+    Records whose source file did not change are loaded memory-mapped,
+    skipping the parsing, so processes reading the same records share
+    the pages.
+
+    New entries are kept in memory and merged into the index file by
+    flush (called every flush_every new entries, on exit of a with block
+    and by clear); concurrent writers merge their entries, an entry lost
+    to a simultaneous flush is simply parsed again.
+
+    Parameters
+    ----------
+    cachedir : str
+        Directory of the cache (created when needed)
+    flush_every : int
+        Number of new entries after which the index is written
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, cachedir: str, flush_every: int = 256):
+        self.cachedir = cachedir
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._index = {}
+        self._index_mtime = None
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
+
+    def load(self, filepath: str, fmt: str = 'nga', dt: float = None, scalefactor: float = 1) -> Record:
+        """
+        Returns the record of filepath (see read_record), from the cache
+        when its source did not change.
+
+        Parameters
+        ----------
+        filepath : str
+            File path in order to read the file data
+        fmt : str
+            'nga', 'one' or 'two', see read_record
+        dt : float
+            Time interval, required for the one column format
+        scalefactor : float
+            Scale factor in which the acceleration values will be multiplied.
+
+        Returns
+        -------
+        record : Record
+            Named tuple with acc (memory-mapped when read from the cache
+            and not scaled), dt, npts and eqname
+        """
+        path = os.path.abspath(filepath)
+        key = '%s|%s|%r' % (path, fmt, dt)
+        stat = os.stat(path)
+
+        entry = self._entry(key)
+        acc = None
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            try:
+                acc = np.load(os.path.join(self.cachedir, entry['file']), mmap_mode='r')
+            except (OSError, ValueError):
+                acc = None
+
+        if acc is None:
+            self.misses += 1
+            record = read_record(path, fmt, dt)
+            entry = self._store(key, path, fmt, stat, record)
+            acc = record.acc
+        else:
+            self.hits += 1
+
+        if scalefactor != 1:
+            acc = acc * scalefactor
+        return Record(acc, entry['dt'], entry['npts'], entry['eqname'])
+
+    def flush(self):
+        """
+        Merges the new entries into the index file.
+        """
+        if not self._pending:
+            return
+        os.makedirs(self.cachedir, exist_ok=True)
+        index = self._read_index()
+        index.update(self._pending)
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix='.json.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(index, file)
+            os.replace(tmp, os.path.join(self.cachedir, self.INDEX))  # readers never see partial files
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._index = index
+        self._index_mtime = self._mtime()
+        self._pending = {}
+
+    def clear(self):
+        """
+        Removes the cached records and the index.
+        """
+        self.flush()
+        for entry in self._read_index().values():
+            path = os.path.join(self.cachedir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+        path = os.path.join(self.cachedir, self.INDEX)
+        if os.path.exists(path):
+            os.remove(path)
+        self._index = {}
+        self._index_mtime = None
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        """
+        Statistics of the cache.
+
+        Returns
+        -------
+        info : dict
+            hits, misses, entries (in the index or pending) and cachedir
+        """
+        self._refresh()
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(set(self._index) | set(self._pending)), 'cachedir': self.cachedir}
+
+    def _entry(self, key: str):
+        if key in self._pending:
+            return self._pending[key]
+        self._refresh()
+        return self._index.get(key)
+
+    def _store(self, key: str, path: str, fmt: str, stat, record: Record) -> dict:
+        os.makedirs(self.cachedir, exist_ok=True)
+        name = hashlib.sha1(key.encode()).hexdigest() + '.npy'
+        fd, tmp = tempfile.mkstemp(dir=self.cachedir, suffix='.npy.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, np.asarray(record.acc, dtype=float))
+            os.replace(tmp, os.path.join(self.cachedir, name))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        entry = {'path': path, 'fmt': fmt, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                 'dt': record.dt, 'npts': int(record.npts), 'eqname': record.eqname, 'file': name}
+        self._pending[key] = entry
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+        return entry
+
+    def _mtime(self):
+        try:
+            return os.stat(os.path.join(self.cachedir, self.INDEX)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self):
+        mtime = self._mtime()
+        if mtime != self._index_mtime:  # written by another process (or first use)
+            self._index = self._read_index()
+            self._index_mtime = mtime
+
+    def _read_index(self) -> dict:
+        try:
+            with open(os.path.join(self.cachedir, self.INDEX), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+
+def read_at2_header(filepath: str) -> dict:
+    """
+    Reads the header of a PEER NGA .AT2 file (the first four lines), the
+    accelerations are not read.
+
+    Parameters
+    ----------
+    filepath : str
+        File path in order to read the file data
+
+    Returns
+    -------
+    header : dict
+        event, year (int or None), station, component, npts, dt and
+        eqname (year_event_station_comp_component)
+    """
+    with open(filepath, 'r') as file:
+        return _at2_header([next(file) for _ in range(4)])
+
+
+def _at2_header(lines: List[str]) -> dict:
+    """
+    Fields of the first four lines of an .AT2 file.
+    """
+    npts, dt = _at2_npts_dt(lines[3])
+    event, year, station, component = _at2_fields(lines[1])
+    if year is not None:
+        eqname = '%s_%s_%s_comp_%s' % (year, event, station, component)
+    else:
+        eqname = '_'.join(field for field in (event, station, component) if field)
+    return {'event': event, 'year': year, 'station': station, 'component': component,
+            'npts': npts, 'dt': dt, 'eqname': eqname}
+
+
+def _at2_npts_dt(line: str) -> Tuple[int, float]:
+    """
+    Number of points and time step from the fourth line of an .AT2 file.
+    """
+    if 'NPTS=' in line.upper():
+        npts = re.search(r'NPTS=\s*(\d+)', line, re.IGNORECASE).group(1)
+        dt = re.search(r'DT=\s*([-+0-9.eE]+)', line, re.IGNORECASE).group(1)
+    else:
+        npts, dt = line.split()[:2]
+    return int(npts), float(dt)
+
+
+def _at2_fields(line: str) -> Tuple[str, Any, str, str]:
+    """
+    Event, year, station and component from the second line of an .AT2
+    file, either "event, m/d/yyyy, station, component" or
+    "EVENT mm/dd/yy hhmm, STATION, COMPONENT" (two digit years after 30
+    are taken as 19xx).
+    """
+    fields = [field.strip() for field in line.split(',')]
+    if len(fields) >= 4 and fields[1].count('/') == 2:
+        match = re.search(r'\d{1,2}/\d{1,2}/(\d{2,4})', fields[1])
+        return fields[0], _at2_year(match.group(1)) if match else None, fields[2], fields[3]
+    match = re.match(r'(.*?)\s+\d{1,2}/\d{1,2}/(\d{2,4})\b', fields[0])
+    if match and len(fields) >= 3:
+        return match.group(1).strip(), _at2_year(match.group(2)), fields[1], fields[-1]
+    station = fields[1] if len(fields) > 2 else ''
+    return fields[0], None, station, fields[-1] if len(fields) > 1 else ''
+
+
+def _at2_year(text: str) -> int:
+    """
+    Year of an .AT2 header date (two digit years after 30 are 19xx).
+    """
+    year = int(text)
+    if year < 100:
+        year += 1900 if year > 30 else 2000
+    return year
+
+
+def processTwoCfile(filepath: str, scalefactor: float = 1) -> Tuple[ndarray, ndarray]:
     """
     This function process acceleration history data saved in Two column format.
 
@@ -20,16 +370,16 @@ def processTwoCfile(filepath: str, scalefactor: float = 1) -> Tuple[List, List]:
 
     Returns
     -------
-    time : List
-        A list of time intervals
-    accel : List
-        A list of acceleration data points
+    time : ndarray
+        Time vector (first column)
+    accel : ndarray
+        Acceleration data points
     """
-    data = np.loadtxt(filepath)
+    data = np.loadtxt(filepath, ndmin=2)
     return data[:, 0], data[:, 1] * scalefactor
 
 
-def processOneCfile(filepath: str, dt: float, scalefactor: float = 1) -> Tuple[List, List, float]:
+def processOneCfile(filepath: str, dt: float, scalefactor: float = 1) -> Tuple[ndarray, ndarray, float]:
     """
     This function process acceleration history data saved in One column format.
 
@@ -44,21 +394,19 @@ def processOneCfile(filepath: str, dt: float, scalefactor: float = 1) -> Tuple[L
 
     Returns
     -------
-    time : List
-        A list of time intervals
-    accel : List
-        A list of acceleration data points
+    time : ndarray
+        Time vector
+    accel : ndarray
+        Acceleration data points
+    dt : float
+        Time interval
 
     """
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-    file.close()
-    accel = [float(line.split('\n')[0]) * scalefactor for line in lines]
-    time = [i * dt for i in range(len(accel))]
-    return time, accel, dt
+    record = read_record(filepath, 'one', dt, scalefactor)
+    return record.time, record.acc, record.dt
 
 
-def processNGAfile(filepath, scalefactor: float = 1):
+def processNGAfile(filepath: str, scalefactor: float = 1) -> Tuple[ndarray, ndarray, float]:
     """
     This function process acceleration history for NGA data file (.AT2 format)
     to a single column value and return the total number of data points and time interval of the recording.
@@ -72,28 +420,45 @@ def processNGAfile(filepath, scalefactor: float = 1):
 
     Returns
     -------
-    time : List
-        A list of time intervals
-    accel : List
-        A list of acceleration data points
+    time : ndarray
+        Time vector
+    accel : ndarray
+        Acceleration data points
+    dt : float
+        Time interval
     """
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-    file.close()
-    accel = []
-    time = []
-    dt_line = lines[3].split(' ')
-    dt_line = [item for item in dt_line if item != '']
-    dt = float(dt_line[1])
-    time_counter = 0
-    for value in lines[4:]:
-        data = value.split(' ')
-        data = [item for item in data if item != '']
-        for dat in data:
-            accel.append(float(dat) * scalefactor)
-            time.append(dt * time_counter)
-            time_counter += 1
-    return time, accel, dt
+    record = read_record(filepath, 'nga', scalefactor=scalefactor)
+    return record.time, record.acc, record.dt
+
+
+def synthetic_record(n: int, fs: float, seed: int = 0) -> ndarray:
+    """
+    Synthetic acceleration record (g) for tests and benchmarks: white
+    noise band-limited to 0.1-20 Hz (or 0.4 fs) with a build-up / decay
+    envelope.
+
+    Parameters
+    ----------
+    n : int
+        Number of points
+    fs : float
+        Sampling frequency (Hz)
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    acc : ndarray
+        Acceleration time series, peak 0.3 g
+    """
+    rng = np.random.default_rng(seed)
+    f = np.fft.rfftfreq(n, 1 / fs)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    spectrum[(f < 0.1) | (f > min(20., 0.4 * fs))] = 0
+    acc = np.fft.irfft(spectrum, n)
+    x = np.linspace(0, 1, n)
+    acc *= (4 * x) ** 2 * np.exp(-8 * x)
+    return 0.3 * acc / np.max(np.abs(acc))
 
 
 def ec8_rs(agr: int, ground_type: str, resp_type: int, orientation: str = 'horizontal', importance_class: int = 2,
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utilities import synthetic_record  # noqa: E402
+
+DT = 0.01  # time step of the synthetic records
+
+
+def write_at2(filepath: str, acc: np.ndarray, dt: float = DT,
+              description: str = 'Northridge-01, 1/17/1994, Sylmar, 360', layout: str = 'new'):
+    """
+    Writes a PEER NGA .AT2 file with the "NPTS=..., DT=..." header
+    (layout 'new') or the "npts dt NPTS, DT" header (layout 'old').
+    """
+    npts = np.size(acc)
+    if layout == 'new':
+        size = 'NPTS=%7d, DT= %.4f SEC' % (npts, dt)
+    else:
+        size = '%i %.4f NPTS, DT' % (npts, dt)
+    rows = np.resize(np.append(acc, np.zeros(-npts % 5)), (-(-npts // 5), 5))
+    with open(filepath, 'w') as file:
+        file.write('PEER NGA STRONG MOTION DATABASE RECORD\n%s\n' % description)
+        file.write('ACCELERATION TIME SERIES IN UNITS OF G\n%s\n' % size)
+        for k, row in enumerate(rows):
+            count = min(5, npts - 5 * k)
+            file.write(''.join(' %15.7E' % value for value in row[:count]) + '\n')
+
+
+@pytest.fixture
+def record():
+    return synthetic_record(1500, 1 / DT)
+
+
+@pytest.fixture
+def target():
+    """
+    Smooth design spectrum (g): linear rise, plateau between 0.15 and
+    0.5 s and 1/T decay.
+    """
+    To = np.geomspace(0.02, 5, 80)
+    dso = np.where(To < 0.15, 0.3 + 0.45 * To / 0.15, np.where(To < 0.5, 0.75, 0.375 / To))
+    return To, dso
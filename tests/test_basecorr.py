@@ -0,0 +1,122 @@
+import numpy as np
+from scipy import integrate
+
+import reqpy
+from conftest import DT
+from utilities import synthetic_record
+
+
+def basecorr_loop(t, xg, CT, imax=80, tol=0.01):
+    """
+    Baseline correction with the loops of the original basecorr
+    (reference for the masked array implementation).
+    """
+    n = np.size(xg)
+    cxg = np.copy(xg)
+
+    vel = integrate.cumtrapz(xg, t, initial=0)
+    despl = integrate.cumtrapz(vel, t, initial=0)
+    dt = t[1] - t[0]
+    L = int(np.ceil(CT / (dt)) - 1)
+    M = n - L
+
+    for q in range(imax):
+        dU, ap, an = 0, 0, 0
+        dV, vp, vn = 0, 0, 0
+
+        for i in range(n - 1):
+            dU = dU + (t[-1] - t[i + 1]) * cxg[i + 1] * dt
+
+        for i in range(L + 1):
+            aux = ((L - i) / L) * (t[-1] - t[i]) * cxg[i] * dt
+            if aux >= 0:
+                ap = ap + aux
+            else:
+                an = an + aux
+
+        alfap = -dU / (2 * ap)
+        alfan = -dU / (2 * an)
+
+        for i in range(1, L + 1):
+            if cxg[i] > 0:
+                cxg[i] = (1 + alfap * (L - i) / L) * cxg[i]
+            else:
+                cxg[i] = (1 + alfan * (L - i) / L) * cxg[i]
+
+        for i in range(n - 1):
+            dV = dV + cxg[i + 1] * dt
+
+        for i in range(M - 1, n):
+            auxv = ((i + 1 - M) / (n - M)) * cxg[i] * dt
+            if auxv >= 0:
+                vp = vp + auxv
+            else:
+                vn = vn + auxv
+
+        valfap = -dV / (2 * vp)
+        valfan = -dV / (2 * vn)
+
+        for i in range(M - 1, n):
+            if cxg[i] > 0:
+                cxg[i] = (1 + valfap * ((i + 1 - M) / (n - M))) * cxg[i]
+            else:
+                cxg[i] = (1 + valfan * ((i + 1 - M) / (n - M))) * cxg[i]
+
+        cvel = integrate.cumtrapz(cxg, t, initial=0)
+        cdespl = integrate.cumtrapz(cvel, t, initial=0)
+
+        errv = np.abs(cvel[-1] / np.max(np.abs(cvel)))
+        errd = np.abs(cdespl[-1] / np.max(np.abs(cdespl)))
+
+        if errv <= tol and errd <= tol:
+            break
+
+    return vel, despl, cxg, cvel, cdespl
+
+
+def baselinecorrect_loop(sc, t):
+    """
+    Search of the time to correct of the original baselinecorrect.
+    """
+    CT = np.max(np.array([1, t[-1] / 20]))
+    vel, despl, ccs, cvel, cdespl = basecorr_loop(t, sc, CT)
+    kka = 1
+    flbc = True
+
+    while any(np.isnan(ccs)):
+        kka = kka + 1
+        CTn = kka * CT
+        if CTn >= np.median(t):
+            flbc = False
+            ccs, cvel, cdespl = sc, vel, despl
+            break
+        vel, despl, ccs, cvel, cdespl = basecorr_loop(t, sc, CTn)
+
+    return ccs, cvel, cdespl, flbc
+
+
+def test_basecorr_matches_loop(record):
+    t = np.arange(record.size) * DT
+    expected = basecorr_loop(t, record, 1.)
+    result = reqpy.basecorr(t, record, 1.)
+    for value, reference in zip(result, expected):
+        np.testing.assert_array_equal(value, reference)
+
+
+def test_basecorr_batch_matches_loop():
+    records = np.array([synthetic_record(1500, 1 / DT, seed) for seed in range(3)])
+    t = np.arange(records.shape[1]) * DT
+    CT = np.array([1., 1.5, 2.])
+    result = reqpy.basecorr_batch(t, records, CT)
+    for k in range(len(records)):
+        expected = basecorr_loop(t, records[k], CT[k])
+        for value, reference in zip(result, expected):
+            np.testing.assert_array_equal(value[k], reference)
+
+
+def test_baselinecorrect_matches_loop(record):
+    t = np.arange(record.size) * DT
+    expected = baselinecorrect_loop(record, t)
+    result = reqpy.baselinecorrect(record, t)
+    for value, reference in zip(result, expected[:3]):
+        np.testing.assert_array_equal(value, reference)
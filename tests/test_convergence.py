@@ -0,0 +1,34 @@
+import numpy as np
+
+import reqpy
+from conftest import DT
+
+
+def test_check_convergence():
+    rmse = np.array([50., 20., 10., 9.])
+    meane = rmse / 2
+    assert reqpy.CheckConvergence(rmse, meane) is None
+    assert reqpy.CheckConvergence(rmse, meane, rmse_tol=9.5) == 'converged'
+    assert reqpy.CheckConvergence(rmse, meane, rmse_tol=9.5, misfit_tol=4.) is None
+    assert reqpy.CheckConvergence(rmse, meane, patience=1) is None
+    assert reqpy.CheckConvergence(rmse, meane, rtol=0.2) == 'stagnated'  # 10 -> 9 is not a 20% reduction
+    rmse = np.array([50., 20., 21., 22.])
+    assert reqpy.CheckConvergence(rmse, rmse, patience=3) is None
+    assert reqpy.CheckConvergence(rmse, rmse, patience=2) == 'diverged'
+
+
+def test_patience_returns_best_iterate(record, target):
+    To, dso = target
+    dso = dso * (1 + 0.4 * (-1) ** np.arange(dso.size))  # jagged target, the RMSE grows after a few iterations
+    patience = 3
+    result = reqpy.REQPY_single(record, 1 / DT, dso, To, nit=30, plots=0, baseline=0, patience=patience,
+                                full_output=True, verbose=False)
+    ccs, rmse, info = result[0], result[1], result[-1]
+
+    best = info['best_iteration']
+    assert info['stop_reason'] == 'diverged'
+    assert info['niter'] == best + patience < 30
+    assert best == np.argmin(info['rmse'])
+    assert reqpy.CheckConvergence(info['rmse'][:-1], info['meane'][:-1], patience=patience) is None
+    np.testing.assert_array_equal(ccs, info['history'][best])
+    np.testing.assert_allclose(rmse, info['rmse'][best], rtol=1e-8)
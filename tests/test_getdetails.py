@@ -0,0 +1,39 @@
+import numpy as np
+from scipy import signal
+
+import reqpy
+from conftest import DT
+
+
+def getdetails_loop(t, s, C, scales, omega, zeta):
+    """
+    Detail functions with one time domain convolution per scale, as the
+    original getdetails (reference for the filter bank implementation).
+    """
+    NS = np.size(scales)
+    n = np.size(s)
+    D = np.zeros((NS, n))
+    centertime = np.median(t)
+
+    for k in range(NS):
+        wv = reqpy.zumontw((t - centertime) / scales[k], omega, zeta)
+        D[k, :] = -signal.fftconvolve(C[k, :], wv, mode='same') / (scales[k] ** (5 / 2))
+
+    sr = np.trapz(D.T, scales)
+    ff = np.max(np.abs(s)) / np.max(np.abs(sr))
+    return ff * D, ff * sr
+
+
+def test_getdetails_matches_loop(record):
+    omega, zeta = np.pi, 0.05
+    t = np.arange(record.size) * DT
+    freqs = np.geomspace(1 / (2 * DT), 0.1, 40)
+    scales = omega / (2 * np.pi * freqs)
+    C = reqpy.cwtzm(record, 1 / DT, scales, omega, zeta)
+
+    D_ref, sr_ref = getdetails_loop(t, record, C, scales, omega, zeta)
+    D, sr = reqpy.getdetails(t, record, C, scales, omega, zeta)
+
+    scale = np.max(np.abs(D_ref))
+    np.testing.assert_allclose(D, D_ref, rtol=0, atol=1e-11 * scale)
+    np.testing.assert_allclose(sr, sr_ref, rtol=0, atol=1e-11 * np.max(np.abs(sr_ref)))
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+import utilities
+from conftest import DT, write_at2
+from library import RecordLibrary
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('Northridge-01, 1/17/1994, Sylmar, 360', ('Northridge-01', 1994, 'Sylmar', '360')),
+    ('Northridge-01, 1/17/1994 12:31, Sylmar, 360', ('Northridge-01', 1994, 'Sylmar', '360')),
+    ('Chi-Chi, 9/20/99, TCU065, E', ('Chi-Chi', 1999, 'TCU065', 'E')),
+    ('IMPERIAL VALLEY 10/15/79 2316, EL CENTRO ARRAY #6, 230', ('IMPERIAL VALLEY', 1979, 'EL CENTRO ARRAY #6', '230')),
+    ('PARKFIELD 09/28/04, TEMBLOR, 205', ('PARKFIELD', 2004, 'TEMBLOR', '205')),
+    ('Northridge-01, 1/17/??, Sylmar, 360', ('Northridge-01', None, 'Sylmar', '360')),
+])
+def test_read_at2_header(tmp_path, line, expected):
+    path = str(tmp_path / 'record.AT2')
+    write_at2(path, np.zeros(12), description=line, layout='old')
+    header = utilities.read_at2_header(path)
+    assert (header['event'], header['year'], header['station'], header['component']) == expected
+    assert (header['npts'], header['dt']) == (12, DT)
+    if expected[1] is None:
+        assert header['eqname'] == 'Northridge-01_Sylmar_360'
+    else:
+        assert header['eqname'] == '%s_%s_%s_comp_%s' % (expected[1], *expected[::2], expected[3])
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / 'records'
+    root.mkdir()
+    (root / 'chichi').mkdir()
+    files = {'RSN953_NORTHR_MUL009.AT2': ('Northridge-01, 1/17/1994, Beverly Hills, 009', 1500),
+             'RSN953_NORTHR_MUL279.AT2': ('Northridge-01, 1/17/1994, Beverly Hills, 279', 1400),
+             'RSN953_NORTHR_MUL-UP.AT2': ('Northridge-01, 1/17/1994, Beverly Hills, UP', 1500),
+             'RSN1083_NORTHR_SYL090.AT2': ('Northridge-01, 1/17/1994, Sylmar, 090', 2000),
+             'chichi/RSN1505_CHICHI_TCU065-E.AT2': ('Chi-Chi, 9/20/1999, TCU065, E', 3000),
+             'chichi/RSN1505_CHICHI_TCU065-N.AT2': ('Chi-Chi, 9/20/1999, TCU065, N', 3000)}
+    for seed, (name, (line, npts)) in enumerate(sorted(files.items())):
+        write_at2(str(root / name), utilities.synthetic_record(npts, 1 / DT, seed), description=line)
+    (root / 'notes.txt').write_text('not a record\n')
+    return RecordLibrary(str(root), cache=utilities.RecordCache(str(tmp_path / 'cache')))
+
+
+def test_scan(library):
+    assert library.scan() == 6
+    assert len(library) == 6
+    assert library.errors == {}
+    assert library.scan() == 0  # unchanged files are not read again
+
+    path = os.path.join(library.root, 'RSN1083_NORTHR_SYL090.AT2')
+    write_at2(path, np.zeros(10), description='Northridge-01, 1/17/1994, Sylmar, 360')
+    os.remove(os.path.join(library.root, 'RSN953_NORTHR_MUL-UP.AT2'))
+    with open(os.path.join(library.root, 'broken.AT2'), 'w') as file:
+        file.write('PEER NGA STRONG MOTION DATABASE RECORD\n')
+    assert library.scan() == 1
+    assert list(library.errors) == [os.path.join(library.root, 'broken.AT2')]
+    assert len(library) == 5
+    assert library.query(station='sylmar')[0].component == '360'
+
+    reopened = RecordLibrary(library.root)
+    assert len(reopened) == 5
+    assert reopened.scan() == 0
+
+
+def test_query(library):
+    library.scan()
+    assert len(library.query(event='northridge-01')) == 4
+    assert [info.station for info in library.query(year=(1995, None))] == ['TCU065', 'TCU065']
+    assert len(library.query(npts=lambda n: n < 2000)) == 3
+    assert len(library.query(dt=DT)) == 6
+    assert library.query(event='Northridge-01', component='009')[0].path.endswith('MUL009.AT2')
+    with pytest.raises(ValueError):
+        library.query(magnitude=6.7)
+
+
+def test_pairs(library):
+    library.scan()
+    pairs = library.pairs()
+    assert [(a.component, b.component) for a, b in pairs] == [('E', 'N'), ('009', '279')]
+    assert library.pairs(library.query(year=1994)) == pairs[1:]
+
+    suite, fs = library.load_suite([pairs[1], library.query(station='Sylmar')[0]])
+    assert [np.shape(item) for item in suite] == [(2, 1400), (2000,)]
+    np.testing.assert_array_equal(fs, 1 / DT)
+    assert library.cache.misses == 3
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import utilities
+from conftest import DT, write_at2
+
+
+@pytest.mark.parametrize('layout', ['new', 'old'])
+def test_read_at2(tmp_path, record, layout):
+    path = str(tmp_path / 'RSN953_NORTHR_MUL009.AT2')
+    write_at2(path, record[:1203], layout=layout)
+    result = utilities.read_record(path, 'nga', scalefactor=2)
+    assert result.npts == 1203
+    assert result.dt == DT
+    assert result.eqname == '1994_Northridge-01_Sylmar_comp_360'
+    np.testing.assert_allclose(result.acc, 2 * record[:1203], rtol=1e-7)
+    np.testing.assert_allclose(result.time, np.arange(1203) * DT)
+
+
+def test_read_one_column(tmp_path, record):
+    path = tmp_path / 'record.txt'
+    np.savetxt(path, record)
+    result = utilities.read_record(str(path), 'one', DT)
+    np.testing.assert_array_equal(result.acc, record)
+    assert result.eqname == 'record'
+    with pytest.raises(ValueError):
+        utilities.read_record(str(path), 'one')
+
+
+def test_read_two_columns_with_comments(tmp_path):
+    path = tmp_path / 'record.txt'
+    path.write_text('# time acc\n0.00 0.1\n0.02 -0.2\n# end of the record\n0.04 0.3\n')
+    result = utilities.read_record(str(path), 'two')
+    np.testing.assert_array_equal(result.acc, [0.1, -0.2, 0.3])
+    assert result.dt == pytest.approx(0.02)
+    time, accel = utilities.processTwoCfile(str(path), 2)
+    np.testing.assert_array_equal(time, [0, 0.02, 0.04])
+    np.testing.assert_array_equal(accel, [0.2, -0.4, 0.6])
+
+
+def test_read_two_columns_single_row(tmp_path):
+    path = tmp_path / 'record.txt'
+    path.write_text('0.00 0.1\n')
+    with pytest.raises(ValueError, match='dt is required'):
+        utilities.read_record(str(path), 'two')
+    assert utilities.read_record(str(path), 'two', dt=0.01).dt == 0.01
+
+
+def test_read_two_columns_wrong_shape(tmp_path):
+    path = tmp_path / 'record.txt'
+    path.write_text('0.00 0.1 5\n0.01 0.2 6\n')
+    with pytest.raises(ValueError):
+        utilities.read_record(str(path), 'two')
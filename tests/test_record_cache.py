@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+import utilities
+from conftest import write_at2
+
+
+def test_hits_and_misses(tmp_path, record):
+    path = str(tmp_path / 'record.AT2')
+    write_at2(path, record)
+    cache = utilities.RecordCache(str(tmp_path / 'cache'))
+
+    first = cache.load(path)
+    second = cache.load(path)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert isinstance(second.acc, np.memmap)
+    np.testing.assert_array_equal(second.acc, first.acc)
+    assert second[1:] == first[1:]
+    np.testing.assert_array_equal(cache.load(path, scalefactor=2).acc, 2 * first.acc)
+    assert cache.info()['entries'] == 1
+
+
+def test_index_shared_between_instances(tmp_path, record):
+    path = str(tmp_path / 'record.AT2')
+    write_at2(path, record)
+    with utilities.RecordCache(str(tmp_path / 'cache')) as cache:
+        cache.load(path)
+
+    cache = utilities.RecordCache(str(tmp_path / 'cache'))
+    cache.load(path)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    cache.clear()
+    assert cache.info()['entries'] == 0
+    assert os.listdir(str(tmp_path / 'cache')) == []
+
+
+def test_invalidated_when_the_source_changes(tmp_path, record):
+    path = str(tmp_path / 'record.AT2')
+    write_at2(path, record)
+    cache = utilities.RecordCache(str(tmp_path / 'cache'))
+    cache.load(path)
+
+    write_at2(path, record[:1000])  # size changes
+    assert cache.load(path).npts == 1000
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    size = os.path.getsize(path)
+    write_at2(path, -record[:1000])  # same size, mtime changes
+    stat = os.stat(path)
+    assert stat.st_size == size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    np.testing.assert_allclose(cache.load(path).acc, -record[:1000], rtol=1e-7)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    cache.load(path)
+    assert (cache.hits, cache.misses) == (1, 3)
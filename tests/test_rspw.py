@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import reqpy
+from conftest import DT
+
+
+def rspw_loop(T, s, zi, dt):
+    """
+    Piecewise exact response spectra with the time stepping loop of the
+    original RSPW (reference for the linear filter implementation).
+    """
+    pi = np.pi
+    nper = np.size(T)
+    n = np.size(s)
+    SD = np.zeros(nper)
+    SV = np.zeros(nper)
+    SA = np.zeros(nper)
+
+    for k in range(nper):
+        wn = 2 * pi / T[k]
+        wd = wn * (1 - zi ** 2) ** (1 / 2)
+        u = np.zeros((2, n))
+
+        ex = np.exp(-zi * wn * dt)
+        cwd = np.cos(wd * dt)
+        swd = np.sin(wd * dt)
+        zisq = 1 / (np.sqrt(1 - (zi ** 2)))
+
+        a11 = ex * (cwd + zi * zisq * swd)
+        a12 = (ex / wd) * swd
+        a21 = -wn * zisq * ex * swd
+        a22 = ex * (cwd - zi * zisq * swd)
+
+        b11 = ex * (((2 * zi ** 2 - 1) / ((wn ** 2) * dt) + zi / wn) * (1 / wd) * np.sin(wd * dt) +
+                    (2 * zi / ((wn ** 3) * dt) + 1 / (wn ** 2)) * np.cos(wd * dt)) - 2 * zi / ((wn ** 3) * dt)
+        b12 = -ex * (((2 * zi ** 2 - 1) / ((wn ** 2) * dt)) * (1 / wd) * np.sin(wd * dt) +
+                     (2 * zi / ((wn ** 3) * dt)) * np.cos(wd * dt)) - (1 / (wn ** 2)) + 2 * zi / ((wn ** 3) * dt)
+        b21 = -((a11 - 1) / ((wn ** 2) * dt)) - a12
+        b22 = -b21 - a12
+
+        A = np.array([[a11, a12], [a21, a22]])
+        B = np.array([[b11, b12], [b21, b22]])
+
+        for q in range(n - 1):
+            u[:, q + 1] = np.dot(A, u[:, q]) + np.dot(B, np.array([s[q], s[q + 1]]))
+
+        at = -2 * wn * zi * u[1, :] - (wn ** 2) * u[0, :]
+
+        SD[k] = np.max(np.abs(u[0, :]))
+        SV[k] = np.max(np.abs(u[1, :]))
+        SA[k] = np.max(np.abs(at))
+
+    PSV = (2 * pi / T) * SD
+    PSA = (2 * pi / T) ** 2 * SD
+    return PSA, PSV, SA, SV, SD
+
+
+@pytest.mark.parametrize('zi', [0.02, 0.05])
+def test_rspw_matches_loop(record, zi):
+    T = np.geomspace(0.02, 5, 25)
+    expected = rspw_loop(T, record, zi, DT)
+    result = reqpy.RSPW(T, record, zi, DT)
+    for value, reference in zip(result, expected):
+        np.testing.assert_allclose(value, reference, rtol=1e-9, atol=1e-12)
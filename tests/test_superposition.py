@@ -0,0 +1,22 @@
+import numpy as np
+
+import reqpy
+from conftest import DT
+from utilities import synthetic_record
+
+
+def test_superposition_matches_spectra(record, target):
+    To, dso = target
+    default = reqpy.REQPY_single(record, 1 / DT, dso, To, nit=5, plots=0, verbose=False)
+    result = reqpy.REQPY_single(record, 1 / DT, dso, To, nit=5, plots=0, superposition=True, verbose=False)
+    np.testing.assert_allclose(result[5], default[5], rtol=1e-10)  # PSAccs
+    np.testing.assert_allclose(result[0], default[0], rtol=0, atol=1e-10 * np.max(np.abs(default[0])))
+
+
+def test_superposition_matches_spectra_rotdnn(record, target):
+    To, dso = target
+    s2 = synthetic_record(record.size, 1 / DT, 1)
+    default = reqpy.REQPYrotdnn(record, s2, 1 / DT, dso, To, 100, nit=3, plots=0, verbose=False)
+    result = reqpy.REQPYrotdnn(record, s2, 1 / DT, dso, To, 100, nit=3, plots=0, superposition=True,
+                               verbose=False)
+    np.testing.assert_allclose(result[6], default[6], rtol=1e-10)  # PSArotnn